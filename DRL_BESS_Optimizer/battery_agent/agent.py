@@ -1,15 +1,27 @@
-import pandas as pd
 from sklearn.model_selection import train_test_split
 from stable_baselines3.common.env_checker import check_env
 from stable_baselines3.common.env_util import make_vec_env
-from stable_baselines3 import DDPG, SAC, TD3, PPO, A2C
 from stable_baselines3.common.callbacks import EvalCallback
 import torch as th
-import wandb
-from wandb.integration.sb3 import WandbCallback
 from stable_baselines3.common.monitor import Monitor
+from stable_baselines3.common.vec_env import DummyVecEnv, SubprocVecEnv
 from battery_agent.data_preprocessor import BatteryAgentDataProcessor
-from battery_agent.battery_env import BatteryEnv
+from battery_agent.battery_env import BatteryEnv, FEATURE_COLUMNS
+from battery_agent.batched_battery_env import BatchedBatteryEnv
+from battery_agent.episode_scheduler import DayScheduler, split_days
+from battery_agent.rollout import rollout_actions
+from battery_agent.metrics import MetricsSink
+from battery_agent.model_cache import ALGORITHMS, load_model
+from battery_agent.validation import CarbonValidationCallback
+from battery_agent.replay_prefill import prefill_replay_buffer
+from battery_agent.pretrain import pretrain_policy
+from functools import partial
+import inspect
+import numpy as np
+
+VEC_ENV_BACKENDS = ['dummy', 'subprocess', 'batched']
+
+MODEL_HYPERPARAMS = ['gamma', 'learning_rate', 'batch_size', 'buffer_size']
 
 class BatteryAgent:
     """
@@ -31,7 +43,7 @@ class BatteryAgent:
 
         self.mean_ci, self.std_dev_ci = data_processor.get_mean_std(train_data)
 
-    def make_env(self, max_power, max_charge):
+    def make_env(self, max_power, max_charge, days=None, seed=None):
         """
         Create an environment for the battery agent. Used when making vectorized
         envs for parallel training algorithms like PPO or A2C.
@@ -42,11 +54,17 @@ class BatteryAgent:
             Battery's power capacity
         max_charge : float
             Battery's energy capacity
+        days : np.array, optional
+            Indices of the training days this env's episodes are drawn from,
+            in a new shuffled order on every pass. Without days the env walks
+            through all of the training data.
+        seed : int, optional
+            Seed of the env and its day order
 
         Returns
         -------
-        BatteryEnv
-            The training environment.
+        Monitor
+            The training environment, wrapped in a Monitor.
         """
         config = {
             "policy_type": 'MlpPolicy',
@@ -63,14 +81,115 @@ class BatteryAgent:
             min_charge=0,
             ci_data=self.train_data,
             mean_ci=self.mean_ci,
-            std_dev_ci=self.std_dev_ci)
+            std_dev_ci=self.std_dev_ci,
+            scheduler=None if days is None else DayScheduler(self.train_data['settlementPeriod'], mode='shuffle', days=days, seed=seed))
 
-        return train_env
+        return Monitor(train_env)
 
-    def train_agent(self, max_power, max_charge, model_save_name):
+    def make_vec_env(self, max_power, max_charge, n_envs, vec_env='dummy', seed=42):
         """
-        Train the battery agent. Edit the algorithm called for training if
-        needed.
+        Create n_envs training environments that run in parallel. Every
+        environment is seeded and gets its own range of training days.
+
+        Parameters
+        ----------
+        max_power : float
+            Battery's power capacity
+        max_charge : float
+            Battery's energy capacity
+        n_envs : int
+            Number of environments
+        vec_env : str, optional
+            'dummy' steps the envs one after another in this process,
+            'subprocess' runs each env in its own process, and 'batched'
+            steps all of them with one set of NumPy operations.
+        seed : int, optional
+            Seed of the first environment, the others use seed + 1, seed + 2, ...
+
+        Returns
+        -------
+        VecEnv
+            The vectorized training environment.
+        """
+        if vec_env not in VEC_ENV_BACKENDS:
+            raise ValueError(f"vec_env must be one of {VEC_ENV_BACKENDS}, got {vec_env}")
+
+        if vec_env == 'batched':
+            # lanes draw distinct days from one shuffled order
+            scheduler = DayScheduler(self.train_data['settlementPeriod'], mode='shuffle', seed=seed)
+            return BatchedBatteryEnv(
+                n_envs,
+                initial_charge=max_charge/2,
+                max_power=max_power,
+                max_charge=max_charge,
+                min_charge=0,
+                ci_data=self.train_data,
+                mean_ci=self.mean_ci,
+                std_dev_ci=self.std_dev_ci,
+                scheduler=scheduler)
+
+        day_ranges = split_days(self.train_data['settlementPeriod'], n_envs)
+        env_fns = [partial(self.make_env, max_power, max_charge, days=days, seed=seed + i)
+                   for i, days in enumerate(day_ranges)]
+
+        if vec_env == 'subprocess':
+            return SubprocVecEnv(env_fns)
+        return DummyVecEnv(env_fns)
+
+    def make_model(self, algorithm, env, hyperparams=None, seed=42, tensorboard_log=None, verbose=1):
+        """
+        Create an untrained model.
+
+        Parameters
+        ----------
+        algorithm : str
+            One of 'DDPG', 'SAC', 'TD3', 'PPO' or 'A2C'
+        env : gym.Env or VecEnv
+            The training environment
+        hyperparams : dict, optional
+            Any of 'gamma', 'learning_rate', 'batch_size', 'buffer_size'
+            and 'net_arch'. Other keys, and keys the algorithm does not take,
+            are ignored, so a run config can be passed as is.
+        seed : int, optional
+            Seed of the model
+        tensorboard_log : str, optional
+            Directory of the tensorboard logs
+        verbose : int, optional
+            Verbosity of the model
+
+        Returns
+        -------
+        BaseAlgorithm
+            The model
+        """
+        if algorithm not in ALGORITHMS:
+            raise ValueError(f"algorithm must be one of {list(ALGORITHMS)}, got {algorithm}")
+
+        hyperparams = hyperparams or {}
+
+        # e.g. buffer_size only exists for the off policy algorithms
+        accepted = inspect.signature(ALGORITHMS[algorithm]).parameters
+        kwargs = {name: hyperparams[name] for name in MODEL_HYPERPARAMS
+                  if name in hyperparams and name in accepted}
+
+        # e.g. policy_kwargs = dict(activation_fn=th.nn.ReLU,
+        #              net_arch=dict(pi=[200, 100], qf=[200, 100]))
+        if 'net_arch' in hyperparams:
+            kwargs['policy_kwargs'] = dict(net_arch=list(hyperparams['net_arch']))
+
+        return ALGORITHMS[algorithm]('MlpPolicy',
+                                     env,
+                                     verbose=verbose,
+                                     seed=seed,
+                                     tensorboard_log=tensorboard_log,
+                                     **kwargs)
+
+    def train_agent(self, max_power, max_charge, model_save_name, algorithm='DDPG', n_envs=1, vec_env='dummy', seed=42,
+                    metrics='csv', checkpoint_freq=0, gradient_save_freq=0, hyperparams=None,
+                    val_data=None, val_sizes=None, eval_freq=10000, patience=5, prefill=None,
+                    pretrain=None, pretrain_epochs=20):
+        """
+        Train the battery agent.
 
         Parameters
         ----------
@@ -80,67 +199,122 @@ class BatteryAgent:
             Battery's energy capacity
         model_save_name : str
             The file name to save the trained model to
+        algorithm : str, optional
+            One of 'DDPG', 'SAC', 'TD3', 'PPO' or 'A2C'
+        n_envs : int, optional
+            Number of environments to train on in parallel. With 1 the agent
+            walks through the training data in a single env.
+        vec_env : str, optional
+            How to run the environments when n_envs > 1: 'dummy',
+            'subprocess' or 'batched', see make_vec_env
+        seed : int, optional
+            Seed of the model and environments
+        metrics : str, optional
+            Where the training metrics go: 'wandb', 'tensorboard', 'csv' or
+            'none'. Only 'wandb' needs a network login, see MetricsSink.
+        checkpoint_freq : int, optional
+            Number of env steps between model checkpoints, 0 disables them
+        gradient_save_freq : int, optional
+            Number of env steps between logged gradients with wandb, 0
+            disables them
+        hyperparams : dict, optional
+            Hyperparameters overriding the defaults, e.g. the best trial of a
+            sweep, see make_model
+        val_data : pd.DataFrame, optional
+            Validation slice to score the model on while it trains. The best
+            model is saved with a '_best' suffix, see CarbonValidationCallback.
+        val_sizes : list, optional
+            (power capacity, energy capacity) of the batteries to validate on.
+            Defaults to the training size.
+        eval_freq : int, optional
+            Number of env steps between validations
+        patience : int, optional
+            Number of validations without improvement before training stops,
+            0 never stops early
+        prefill : dict, optional
+            Transitions to put in the replay buffer before training, e.g.
+            real battery trajectories from pn_transitions. Only for DDPG,
+            TD3 and SAC.
+        pretrain : dict, optional
+            Transitions with the actions to clone before training, e.g. the
+            best dispatch of the training data from dispatch_transitions,
+            see pretrain_policy
+        pretrain_epochs : int, optional
+            Number of passes over the pretrain transitions
         """
+        if algorithm not in ALGORITHMS:
+            raise ValueError(f"algorithm must be one of {list(ALGORITHMS)}, got {algorithm}")
 
         config = {
+            "algorithm": algorithm,
             "policy_type": 'MlpPolicy',
             "total_timesteps": len(self.train_data)-1000,
             # "batch_size": 512,
             "gamma": 0.91,
             # "learning_rate: 0.001
+            "n_envs": n_envs,
+            "vec_env": vec_env,
         }
-
-        train_env = BatteryEnv(
-            initial_charge=max_charge/2,
-            max_power=max_power,
-            max_charge=max_charge,
-            min_charge=0,
-            ci_data=self.train_data,
-            mean_ci=self.mean_ci,
-            std_dev_ci=self.std_dev_ci)
-
-        check_env(train_env)
-
-        # train_env = make_vec_env(self.make_env, n_envs=4, env_kwargs={"max_power": max_power, "max_charge": max_charge})
-
-        run = wandb.init(
+        config.update(hyperparams or {})
+
+        if n_envs == 1:
+            train_env = BatteryEnv(
+                initial_charge=max_charge/2,
+                max_power=max_power,
+                max_charge=max_charge,
+                min_charge=0,
+                ci_data=self.train_data,
+                mean_ci=self.mean_ci,
+                std_dev_ci=self.std_dev_ci)
+
+            check_env(train_env)
+        else:
+            train_env = self.make_vec_env(max_power, max_charge, n_envs, vec_env=vec_env, seed=seed)
+
+        sink = MetricsSink(
+            backend=metrics,
             project="batteryagent_final",
             config=config,
-            sync_tensorboard=True,
+            checkpoint_freq=checkpoint_freq,
+            gradient_save_freq=gradient_save_freq,
         )
 
-        # policy_kwargs = dict(activation_fn=th.nn.ReLU,
-        #              net_arch=dict(pi=[200, 100], qf=[200, 100]))
+        model = self.make_model(algorithm, train_env, hyperparams=config, seed=seed,
+                                tensorboard_log=sink.tensorboard_log)
+
+        sink.attach(model)
+
+        if prefill is not None:
+            n_transitions = prefill_replay_buffer(model, prefill)
+            if model.verbose > 0:
+                print(f"prefilled the replay buffer with {n_transitions} transitions")
 
-        model = DDPG(config['policy_type'],
-                     train_env,
-                     verbose=1,
-                     # learning_starts=500,
-                    #  action_noise=action_noise,
-                     seed=42,
-                     # learning_rate=config['learning_rate'],
-                     # policy_kwargs=policy_kwargs,
-                     # batch_size=config['batch_size'],
-                     # buffer_size=100000,
-                     gamma=config['gamma'],
-                     tensorboard_log=f"./final/{run.id}")
+        if pretrain is not None:
+            pretrain_policy(model, pretrain, epochs=pretrain_epochs, seed=seed, verbose=model.verbose)
 
+        callbacks = [sink.callback()]
+        if val_data is not None:
+            callbacks.append(CarbonValidationCallback(
+                val_data,
+                val_sizes if val_sizes is not None else [(max_power, max_charge)],
+                self.mean_ci,
+                self.std_dev_ci,
+                eval_freq=eval_freq,
+                best_model_path=f"battery_agent/models/{model_save_name}_best",
+                patience=patience))
 
         # Train the model and calculate the reward.
         model.learn(total_timesteps=config['total_timesteps'],
-                    callback=WandbCallback(
-                        gradient_save_freq=100,
-                        model_save_path=f"models/{run.id}",
-                        model_save_freq=100,
-                        verbose=2))
+                    callback=callbacks)
 
         model.save(f"battery_agent/models/{model_save_name}")
 
-        # wandb.finish()
+        sink.close()
 
-    def test_agent(self, max_power, max_charge, model_name):
+    def test_agent(self, max_power, max_charge, model_name, model=None, algorithm='DDPG'):
         """
-        Test the trained battery management agent.
+        Test the trained battery management agent. The test data is not
+        changed, so tests on the same data can run at the same time.
 
         Parameters
         ----------
@@ -150,6 +324,11 @@ class BatteryAgent:
             Battery's energy capacity
         model_name : str
             The name of the saved model to use for testing
+        model : BaseAlgorithm, optional
+            An already loaded model to test instead of loading model_name
+        algorithm : str, optional
+            The algorithm model_name was trained with, one of 'DDPG', 'SAC',
+            'TD3', 'PPO' or 'A2C'
 
         Returns
         -------
@@ -158,46 +337,150 @@ class BatteryAgent:
             a list of daily charge cycles during testing,
             and a list of daily discharge cycles during testing
         """
-        env = BatteryEnv(
+        if model is None:
+            model = load_model(model_name, algorithm)
+
+        actions = self.predict_lanes(model, [(self.test_data, max_power, max_charge)])[0]
+
+        return self.score_actions(max_power, max_charge, actions)
+
+    def test_lanes(self, lanes, model_name, algorithm='DDPG'):
+        """
+        Test the trained battery management agent on many test periods and
+        battery sizes at once. All lanes are stepped together and the policy
+        is called once per settlement period on the observations of every
+        lane, so testing a whole matrix costs about as much as one test_agent
+        run on the longest period.
+
+        The policy runs on a batch instead of one observation at a time, so
+        its actions can differ from test_agent's in the last float digits,
+        which can change the outcome of a step right at a charge or cycle
+        limit.
+
+        Parameters
+        ----------
+        lanes : list
+            (test data, power capacity, energy capacity) of every lane, e.g.
+            the slices from BatteryAgentDataProcessor.split_test_data
+        model_name : str
+            The name of the saved model to use for testing
+        algorithm : str, optional
+            The algorithm model_name was trained with, one of 'DDPG', 'SAC',
+            'TD3', 'PPO' or 'A2C'
+
+        Returns
+        -------
+        list
+            The results of each lane, as returned by test_agent
+        """
+        model = load_model(model_name, algorithm)
+
+        lane_actions = self.predict_lanes(model, lanes)
+
+        return [self.score_actions(max_power, max_charge, actions, test_data=test_data)
+                for (test_data, max_power, max_charge), actions in zip(lanes, lane_actions)]
+
+    def predict_lanes(self, model, lanes):
+        """
+        Run a model over every lane in lockstep, each battery starting empty
+        at the first row of its test data and being reset whenever an episode
+        ends, as in test_agent.
+
+        Parameters
+        ----------
+        model : BaseAlgorithm
+            Trained model, or anything with a stable-baselines3 style predict
+        lanes : list
+            (test data, power capacity, energy capacity) of every lane
+
+        Returns
+        -------
+        list
+            The normalized actions of each lane, one per row of its test data
+            but the last
+        """
+        lengths = np.array([len(test_data) for test_data, _, _ in lanes])
+        n_rows = lengths.max()
+
+        # lanes on the same test data share its features, and shorter test data
+        # is padded with its last row so every lane can step until the longest is done
+        sources = []
+        source_ids = {}
+        data_index = []
+        for test_data, _, _ in lanes:
+            if id(test_data) not in source_ids:
+                source_ids[id(test_data)] = len(sources)
+                rows = np.minimum(np.arange(n_rows), len(test_data) - 1)
+                sources.append(test_data[FEATURE_COLUMNS + ['settlementPeriod']].iloc[rows])
+            data_index.append(source_ids[id(test_data)])
+
+        env = BatchedBatteryEnv(
+            len(lanes),
             initial_charge=0,
-            max_power=max_power,
-            max_charge=max_charge,
+            max_power=np.array([max_power for _, max_power, _ in lanes], dtype=np.float64),
+            max_charge=np.array([max_charge for _, _, max_charge in lanes], dtype=np.float64),
             min_charge=0,
-            ci_data=self.test_data,
+            ci_data=sources,
             mean_ci=self.mean_ci,
-            std_dev_ci=self.std_dev_ci)
+            std_dev_ci=self.std_dev_ci,
+            data_index=np.array(data_index))
 
-        model = DDPG.load(f"battery_agent/models/{model_name}")
+        actions = np.zeros((len(lanes), n_rows - 1), dtype=np.float32)
 
-        charge_values = []
-        daily_charge = []
-        daily_discharge = []
-
-        obs, _ = env.reset()
-        total_reward = 0
-        energy_out = []
-        for _ in range(len(self.test_data)):
+        obs = env.reset()
+        for t in range(n_rows - 1):
             action, _states = model.predict(obs, deterministic=True)
-            obs, reward, done, info, _ = env.step(action)
-            total_reward += reward
-
-            if env.current_timestep >= len(self.test_data)-1:
-              break
+            actions[:, t] = np.asarray(action).reshape(-1)
+            obs, _rewards, _dones, _infos = env.step(action)
 
-            energy_out.append(env.energy_out)
+        return [actions[i, :length - 1] for i, length in enumerate(lengths)]
 
-            charge_values.append(float(env.charge))
-            # reward_values.append(env.reward)
-            if env.sp == 48:
-                  daily_charge.append(float(env.daily_charge))
-                  daily_discharge.append(float(env.daily_discharge))
+    def score_actions(self, max_power, max_charge, actions, test_data=None):
+        """
+        Score a sequence of normalized actions on the test data without
+        stepping the env, e.g. the actions of a trained agent or a schedule
+        from another optimizer.
 
-            if done:
-                obs, _i = env.reset()
+        Parameters
+        ----------
+        max_power : float
+            Battery's power capacity
+        max_charge : float
+            Battery's energy capacity
+        actions : np.array
+            Normalized actions ranging from -1 to 1, one per settlement period
+            of the test data, starting with the first one.
+        test_data : pd.DataFrame, optional
+            The data the actions were taken on. Defaults to the agent's test data.
 
-        test_results = self.test_data
-        test_results.reset_index(drop=True, inplace=True)
-        test_results['energyOut'] = pd.Series(energy_out).astype(float)
-        test_results['charge'] = pd.Series(charge_values).astype(float)
+        Returns
+        -------
+        pd.DataFrame, list, list
+            A new DataFrame with the test data and its results,
+            a list of daily charge cycles during testing,
+            and a list of daily discharge cycles during testing
+        """
+        if test_data is None:
+            test_data = self.test_data
+
+        trajectory = rollout_actions(actions, 0, max_power, max_charge, 0, test_data, self.mean_ci, self.std_dev_ci)
+
+        # like test_agent, leave out the last step and record the cycles when the next SP is 48
+        n_steps = min(len(actions), len(test_data) - 2)
+        next_sp = np.array(test_data['settlementPeriod'])[1:n_steps + 1]
+        end_of_day = next_sp == 48
+        daily_charge = trajectory['daily_charge'][:n_steps][end_of_day].tolist()
+        daily_discharge = trajectory['daily_discharge'][:n_steps][end_of_day].tolist()
+
+        # the last rows have no result
+        energy_out = np.full(len(test_data), np.nan)
+        energy_out[:n_steps] = trajectory['energy_out'][:n_steps]
+        charge = np.full(len(test_data), np.nan)
+        charge[:n_steps] = trajectory['charge'][:n_steps]
+
+        # a new frame, so the test data is left as it is
+        test_results = test_data.reset_index(drop=True)
+        test_results['energyOut'] = energy_out
+        test_results['charge'] = charge
 
         return test_results, daily_charge, daily_discharge
@@ -0,0 +1,289 @@
+import time
+import numpy as np
+from gymnasium import spaces
+from stable_baselines3.common.vec_env import VecEnv
+from battery_agent.battery_env import build_feature_matrix, build_reward_tables, cycles_reward
+from battery_agent.env_stats import EnvStats
+
+
+class BatchedBatteryEnv(VecEnv):
+
+    def __init__(self, n_envs, initial_charge, max_power, max_charge, min_charge, ci_data, mean_ci, std_dev_ci, start_timesteps=None, verbose=0, log_freq=10000, scheduler=None, data_index=None, recorder=None):
+        """
+        Vectorized version of BatteryEnv that steps n_envs batteries with one
+        set of NumPy operations instead of one Python env object per lane.
+
+        Every lane follows the same transition and reward rules as
+        BatteryEnv.step, and shares the same carbon intensity data. A lane
+        is reset automatically when its episode ends, and the final
+        observation is put in its info dict under 'terminal_observation',
+        as stable-baselines3 expects from a VecEnv.
+
+        Parameters
+        ----------
+        n_envs : int
+            Number of batteries (lanes) to simulate.
+        initial_charge : float or np.array
+            The initial state of charge of each battery.
+        max_power : float or np.array
+            The maximum power output of each battery (power capacity).
+        max_charge : float or np.array
+            The maximum charge level of each battery (energy capacity)
+        min_charge : float or np.array
+            The minimum charge level of each battery (0)
+        ci_data : dict or list
+            Dictionary containing data related to carbon intensity, or a list
+            of them (e.g. one per region) covering the same settlement periods.
+        mean_ci : float
+            Mean value of training carbon intensity data for normalization.
+        std_dev_ci : float
+            Standard deviation of training carbon intensity data for normalization.
+        start_timesteps : np.array, optional
+            Row of ci_data each lane starts from. Defaults to 0 for all lanes.
+            With a scheduler, reset() moves every lane to a scheduled day.
+        verbose : int, optional
+            0 is silent, 1 prints a summary of the env stats every log_freq
+            battery steps.
+        log_freq : int, optional
+            Number of battery steps between printed summaries when verbose > 0.
+        scheduler : DayScheduler, optional
+            Picks the day every episode of every lane starts on. Without a
+            scheduler each lane keeps walking through the data.
+        data_index : np.array, optional
+            Index into ci_data of the data each lane uses, when ci_data is a
+            list. Defaults to the first one for all lanes.
+        recorder : TrajectoryRecorder, optional
+            Records the timestep, action, energy out, charge and reward of
+            every lane on every step.
+        """
+        self.num_cycles = 2
+        self.penalty = -50
+        self.render_mode = None
+
+        self.verbose = verbose
+        self.stats = EnvStats(verbose=verbose, log_freq=log_freq)
+
+        self.mean_ci = mean_ci
+        self.std_dev_ci = std_dev_ci
+
+        self.max_power = np.broadcast_to(np.asarray(max_power, dtype=np.float64), (n_envs,)).copy()
+        self.max_charge = np.broadcast_to(np.asarray(max_charge, dtype=np.float64), (n_envs,)).copy()
+        self.min_charge = np.broadcast_to(np.asarray(min_charge, dtype=np.float64), (n_envs,)).copy()
+        self.duration = self.max_charge / self.max_power
+
+        if not isinstance(ci_data, (list, tuple)):
+            ci_data = [ci_data]
+
+        self.settlement_periods = np.array(ci_data[0]['settlementPeriod'])
+        self.n_timesteps = len(self.settlement_periods)
+        if any(len(data['settlementPeriod']) != self.n_timesteps for data in ci_data):
+            raise ValueError("All of the ci_data must cover the same settlement periods")
+
+        # one feature matrix per data source, looked up by (lane data index, timestep)
+        self.features = np.stack([build_feature_matrix(data, mean_ci, std_dev_ci) for data in ci_data])
+        # reward per MWh by (lane data index, timestep), the same tables as BatteryEnv
+        self.charge_coefficients, self.discharge_coefficients = build_reward_tables(self.features)
+        if data_index is None:
+            data_index = np.zeros(n_envs, dtype=np.int64)
+        self.data_index = np.broadcast_to(np.asarray(data_index, dtype=np.int64), (n_envs,)).copy()
+        self.scheduler = scheduler
+
+        if start_timesteps is None:
+            start_timesteps = np.zeros(n_envs, dtype=np.int64)
+        self.current_timestep = np.array(start_timesteps, dtype=np.int64) % self.n_timesteps
+
+        self.initial_charge = np.broadcast_to(np.asarray(initial_charge, dtype=np.float64), (n_envs,)).copy()
+        self.charge = self.initial_charge / self.max_charge
+        self.daily_charge = np.zeros(n_envs)
+        self.daily_discharge = np.zeros(n_envs)
+        self.energy_out = np.zeros(n_envs)
+        self.reward = np.zeros(n_envs)
+        self.sp = self.settlement_periods[self.current_timestep]
+
+        self.actions = None
+        self.recorder = recorder
+
+        action_space = spaces.Box(low=-1, high=1, shape=(1,))
+
+        # charge, intensity, forecastmin, forecastmax, forecastmean, cycle c, cycle d
+        observation_space = spaces.Box(low=np.array([ 0, -5, -5, -5, -5, -1, -1]),
+                                       high=np.array([1,  5, 5, 5, 5, 1, 1]))
+
+        self.state = np.zeros((n_envs, 7), dtype=np.float32)
+
+        super(BatchedBatteryEnv, self).__init__(n_envs, observation_space, action_space)
+
+    def reset(self):
+        """
+        Reset every lane. Like BatteryEnv.reset, this clears the daily cycle
+        counters and reward but keeps each lane's timestep and state of charge.
+
+        Returns
+        -------
+        np.array
+            The observations of all lanes, shape (n_envs, 7)
+        """
+        self.reward[:] = 0.0
+        if self.scheduler is not None:
+            self.current_timestep = self.scheduler.next_days(self.num_envs)
+        self.sp = self.settlement_periods[self.current_timestep]
+        self.daily_charge[:] = 0.0
+        self.daily_discharge[:] = 0.0
+        self._reset_seeds()
+        self._reset_options()
+        self.fill_state()
+        return self.state.copy()
+
+    def step_async(self, actions):
+        self.actions = actions
+
+    def step_wait(self):
+        """
+        Advance every lane by one settlement period.
+
+        Returns
+        -------
+        tuple
+            The observations, rewards, done flags and info dicts of all lanes.
+            The info of a finished lane contains a summary of the env stats
+            under 'stats'.
+        """
+        start_time = time.perf_counter()
+
+        action = np.asarray(self.actions, dtype=np.float64).reshape(self.num_envs)
+        timesteps = self.current_timestep
+
+        new_day = self.sp == 1
+        self.daily_charge[new_day] = 0.0
+        self.daily_discharge[new_day] = 0.0
+
+        # un_normalize action for 0.5 hrs
+        energy_out = action * self.max_power / 2
+        action_cycles = energy_out / self.max_charge
+
+        # out of bounds if the action would take the charge outside the valid range
+        charge = self.state[:, 0] * self.max_charge
+        above_max = charge - energy_out > self.max_charge
+        below_min = ~above_max & (charge - energy_out < self.min_charge)
+        in_bounds = ~(above_max | below_min)
+
+        discharging = energy_out > 0
+        charging = ~discharging
+
+        self.daily_discharge += np.where(in_bounds & discharging, action_cycles, 0.0)
+        self.daily_charge -= np.where(in_bounds & charging, action_cycles, 0.0)
+
+        over_cycles = in_bounds & ((discharging & (self.daily_discharge > self.num_cycles))
+                                   | (charging & (self.daily_charge > self.num_cycles)))
+        penalized = ~in_bounds | over_cycles
+        valid = ~penalized
+
+        abs_energy = np.abs(energy_out)
+        reward = np.where(discharging,
+                          self.discharge_coefficients[self.data_index, timesteps],
+                          self.charge_coefficients[self.data_index, timesteps]) * abs_energy
+
+        # reward reaching end of day based on amount charged in that day
+        end_of_day = valid & (self.sp == 48)
+        reward = np.where(end_of_day,
+                          reward + self.get_cycles_reward(self.daily_charge) + self.get_cycles_reward(self.daily_discharge),
+                          reward)
+        self.reward = np.where(penalized, float(self.penalty), reward)
+
+        # clip the energy to what was actually charged or discharged
+        self.energy_out = np.select([above_max, below_min, over_cycles],
+                                    [charge - self.max_charge, charge - self.min_charge, 0.0],
+                                    energy_out)
+
+        self.charge = np.select([above_max, below_min, over_cycles],
+                                [1.0, 0.0, self.charge],
+                                self.charge - action / 2)
+
+        dones = penalized | end_of_day
+
+        self.current_timestep = (self.current_timestep + 1) % self.n_timesteps
+        self.sp = self.settlement_periods[self.current_timestep]
+        self.fill_state()
+
+        obs = self.state.copy()
+        infos = [{} for _ in range(self.num_envs)]
+
+        if self.recorder is not None:
+            self.recorder.record_many(timesteps, action, self.energy_out, self.charge, self.reward, np.arange(self.num_envs))
+
+        energy_in = -self.energy_out[self.energy_out < 0].sum()
+        energy_discharged = self.energy_out[self.energy_out > 0].sum()
+        self.stats.record(self.num_envs, np.count_nonzero(penalized), np.count_nonzero(~in_bounds),
+                          energy_in, energy_discharged, time.perf_counter() - start_time)
+
+        done_idx = np.flatnonzero(dones)
+        if len(done_idx) > 0:
+            stats = self.stats.summary()
+            for i in done_idx:
+                infos[i]['terminal_observation'] = obs[i].copy()
+                infos[i]['TimeLimit.truncated'] = False
+                infos[i]['stats'] = stats
+
+            # auto reset the finished lanes
+            self.daily_charge[done_idx] = 0.0
+            self.daily_discharge[done_idx] = 0.0
+            if self.scheduler is not None:
+                self.current_timestep[done_idx] = self.scheduler.next_days(len(done_idx))
+                self.sp = self.settlement_periods[self.current_timestep]
+            self.fill_state()
+            obs[done_idx] = self.state[done_idx]
+
+        return obs, self.reward.copy(), dones, infos
+
+    def fill_state(self):
+        """
+        Write the observation of every lane at its current timestep into
+        self.state.
+        """
+        self.state[:, 0] = self.charge
+        self.state[:, 1:5] = self.features[self.data_index, self.current_timestep]
+        self.state[:, 5] = self.daily_charge / 2
+        self.state[:, 6] = self.daily_discharge / 2
+
+    def get_cycles_reward(self, cycles):
+        return cycles_reward(cycles)
+
+    def _lane_indices(self, indices):
+        if indices is None:
+            return range(self.num_envs)
+        if isinstance(indices, int):
+            return [indices]
+        return indices
+
+    def get_attr(self, attr_name, indices=None):
+        """
+        Return an attribute for each lane. Per-lane arrays are indexed,
+        anything else is shared by all lanes.
+        """
+        value = getattr(self, attr_name)
+        indices = self._lane_indices(indices)
+        if isinstance(value, np.ndarray) and value.ndim > 0 and value.shape[0] == self.num_envs:
+            return [value[i] for i in indices]
+        return [value for _ in indices]
+
+    def set_attr(self, attr_name, value, indices=None):
+        """
+        Set an attribute for the given lanes. Per-lane arrays are written in
+        place, anything else is set for all lanes.
+        """
+        current = getattr(self, attr_name, None)
+        if isinstance(current, np.ndarray) and current.ndim > 0 and current.shape[0] == self.num_envs:
+            current[list(self._lane_indices(indices))] = value
+        else:
+            setattr(self, attr_name, value)
+
+    def env_method(self, method_name, *method_args, indices=None, **method_kwargs):
+        # all lanes live in this object, so the method is only called once
+        result = getattr(self, method_name)(*method_args, **method_kwargs)
+        return [result for _ in self._lane_indices(indices)]
+
+    def env_is_wrapped(self, wrapper_class, indices=None):
+        return [False for _ in self._lane_indices(indices)]
+
+    def close(self):
+        pass
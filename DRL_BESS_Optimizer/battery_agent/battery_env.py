@@ -1,10 +1,119 @@
+import time
 import gymnasium as gym
 from gymnasium import spaces
 import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+from battery_agent.env_stats import EnvStats
+
+# columns of ci_data that are normalized into the feature matrix, in observation order
+FEATURE_COLUMNS = ['nationalIntensity', 'forecast_min', 'forecast_max', 'forecast_mean']
+
+
+def build_feature_matrix(ci_data, mean_ci, std_dev_ci, columns=FEATURE_COLUMNS):
+    """
+    Normalize the carbon intensity columns once into a contiguous float32
+    matrix, so each step only needs a row lookup.
+
+    Parameters
+    ----------
+    ci_data : dict
+        Dictionary containing data related to carbon intensity
+    mean_ci : float
+        Mean value of training carbon intensity data for normalization.
+    std_dev_ci : float
+        Standard deviation of training carbon intensity data for normalization.
+    columns : list, optional
+        The columns of ci_data to include, one feature per column
+
+    Returns
+    -------
+    np.array
+        Array of shape (timesteps, len(columns)) with the normalized features
+    """
+    n_timesteps = len(ci_data[columns[0]])
+    features = np.empty((n_timesteps, len(columns)), dtype=np.float32)
+
+    for i, column in enumerate(columns):
+        features[:, i] = (np.asarray(ci_data[column], dtype=np.float64) - mean_ci) / std_dev_ci
+
+    return features
+
+
+def build_reward_tables(features):
+    """
+    Precompute the reward per MWh charged and per MWh discharged at every
+    timestep. The step reward only compares the intensity to the forecasts,
+    so it is the absolute energy out times the coefficient of its timestep
+    and direction.
+
+    Charging is rewarded 1 per MWh when the intensity is at most the
+    forecast mean and -5 when above it, and 5 more at or below the forecast
+    min. Discharging is rewarded 1 per MWh when the intensity is at least
+    the forecast mean and -5 when below it, and 5 more at or above the
+    forecast max.
+
+    Parameters
+    ----------
+    features : np.array
+        Normalized feature matrix from build_feature_matrix, or a stack of
+        them with the features on the last axis
+
+    Returns
+    -------
+    np.array, np.array
+        Reward per MWh charged and per MWh discharged, one per row of features
+    """
+    ci, fcast_min, fcast_max, fcast_mean = np.moveaxis(features[..., :4], -1, 0)
+
+    charge_coefficients = np.where(ci > fcast_mean, -5.0, 1.0) + np.where(ci <= fcast_min, 5.0, 0.0)
+    discharge_coefficients = np.where(ci < fcast_mean, -5.0, 1.0) + np.where(ci >= fcast_max, 5.0, 0.0)
+    return charge_coefficients, discharge_coefficients
+
+
+def cycles_reward(cycles):
+    """
+    Reward for the charge or discharge cycles of a day, given at the end of
+    the day. Works on floats and arrays.
+    """
+    return cycles**10
+    # if cycles > 1.8:
+    #     return 300
+    # elif cycles > 1.5:
+    #     return 200
+    # elif cycles > 1.3:
+    #     return 100
+    # elif cycles > 1.1:
+    #     return 50
+    # elif cycles > 0.8:
+    #     return 20
+    # return 0
+
+
+class BatteryState:
+    """
+    The mutable state of a BatteryEnv, small enough to copy thousands of
+    times per decision for lookahead search. The data arrays are never part
+    of it.
+    """
+    __slots__ = ['timestep', 'charge', 'daily_charge', 'daily_discharge', 'sp', 'reward', 'energy_out']
+
+    def __init__(self, timestep, charge, daily_charge, daily_discharge, sp, reward, energy_out):
+        self.timestep = timestep
+        self.charge = charge
+        self.daily_charge = daily_charge
+        self.daily_discharge = daily_discharge
+        self.sp = sp
+        self.reward = reward
+        self.energy_out = energy_out
+
+    def __repr__(self):
+        return (f"BatteryState(timestep={self.timestep}, charge={self.charge}, daily_charge={self.daily_charge}, "
+                f"daily_discharge={self.daily_discharge}, sp={self.sp}, reward={self.reward}, energy_out={self.energy_out})")
+
 
 class BatteryEnv(gym.Env):
 
-    def __init__(self, initial_charge, max_power, max_charge, min_charge, ci_data, mean_ci, std_dev_ci):
+    def __init__(self, initial_charge, max_power, max_charge, min_charge, ci_data, mean_ci, std_dev_ci, verbose=0, log_freq=10000, scheduler=None, lookback=1, sp_one_hot=False, recorder=None):
         """
         Custom environment for simulating the charging of a battery energy
         storage system for maximum carbon abatement
@@ -25,12 +134,37 @@ class BatteryEnv(gym.Env):
             Mean value of training carbon intensity data for normalization.
         std_dev_ci : float
             Standard deviation of training carbon intensity data for normalization.
+        verbose : int, optional
+            0 is silent, 1 prints a summary of the env stats every log_freq
+            steps, 2 also prints the action and state on every step.
+        log_freq : int, optional
+            Number of steps between printed summaries when verbose > 0.
+        scheduler : DayScheduler, optional
+            Picks the day every episode starts on. Without a scheduler the
+            env keeps walking through the data, and a new episode starts
+            wherever the last one ended.
+        lookback : int, optional
+            Number of timesteps of intensity and forecasts in the observation.
+        sp_one_hot : bool, optional
+            Add the settlement period as a one-hot vector to the observation.
+        recorder : TrajectoryRecorder, optional
+            Records the timestep, action, energy out, charge and reward of
+            every step, e.g. for debugging.
+
+        With lookback > 1 or sp_one_hot, the observation is a dict (use
+        'MultiInputPolicy') of 'battery' (charge, cycle c, cycle d), 'window'
+        (the last lookback rows of intensity and forecasts) and optionally
+        'sp'. The window and one-hot vector are looked up in precomputed
+        arrays instead of being rebuilt on every step.
         """
 
         super(BatteryEnv, self).__init__()
         self.num_cycles = 2
         self.penalty = -50
 
+        self.verbose = verbose
+        self.stats = EnvStats(verbose=verbose, log_freq=log_freq)
+
         self.mean_ci = mean_ci
         self.std_dev_ci = std_dev_ci
 
@@ -46,6 +180,15 @@ class BatteryEnv(gym.Env):
         self.forecast_max = np.array(ci_data['forecast_max'])
         self.forecast_mean = np.array(ci_data['forecast_mean'])
         self.settlement_periods = np.array(ci_data['settlementPeriod'])
+        self.n_timesteps = len(self.settlement_periods)
+        self.scheduler = scheduler
+
+        # normalized intensity and forecasts, looked up by row every step
+        self.features = build_feature_matrix(ci_data, mean_ci, std_dev_ci)
+        self.n_features = self.features.shape[1]
+
+        # reward per MWh of every timestep, so a step's reward is one multiply
+        self.charge_coefficients, self.discharge_coefficients = build_reward_tables(self.features)
 
         self.current_timestep = 0
 
@@ -57,7 +200,11 @@ class BatteryEnv(gym.Env):
         self.reward = 0
         self.sp = self.settlement_periods[0]
 
-        self.actions = []
+        self.action = 0.0
+        self.recorder = recorder
+
+        self.penalized = False
+        self.clipped = False
 
         # Define action space to be a number between -max_power/2 to max_power/2 (since its MW * 0.5 hrs)
         self.action_space = spaces.Box(low=-1, high=1, shape=(1,))
@@ -66,19 +213,75 @@ class BatteryEnv(gym.Env):
         self.observation_space = spaces.Box(low=np.array([ 0, -5, -5, -5, -5, -1, -1]),
                                             high=np.array([1,  5, 5, 5, 5, 1, 1]))
 
+        # observation buffer, refilled in place on every step
+        self.state = np.zeros(self.n_features + 3, dtype=np.float32)
+
+        self.lookback = lookback
+        self.sp_one_hot = sp_one_hot
+        self.dict_observation = lookback > 1 or sp_one_hot
+        if self.dict_observation:
+            # repeat the first row so the first timesteps also get a full window
+            padded = np.concatenate([np.repeat(self.features[:1], lookback - 1, axis=0), self.features])
+            # windows[t] is a (lookback, n_features) view ending at row t, read only like sp_vectors
+            # so the observations can be views into them
+            self.windows = sliding_window_view(padded, lookback, axis=0).transpose(0, 2, 1)
+            self.sp_vectors = np.eye(48, dtype=np.float32)
+            self.sp_vectors.setflags(write=False)
 
-        curr_ci = (self.carbon_intensity_data[0] - self.mean_ci) / self.std_dev_ci
-        fcast_min = (self.forecast_min[0] - self.mean_ci) / self.std_dev_ci
-        fcast_max = (self.forecast_max[0] - self.mean_ci) / self.std_dev_ci
-        fcast_mean = (self.forecast_mean[0] - self.mean_ci) / self.std_dev_ci
+            observation_spaces = {
+                'battery': spaces.Box(low=np.array([0, -1, -1]), high=np.array([1, 1, 1]), dtype=np.float32),
+                'window': spaces.Box(low=-5, high=5, shape=(lookback, self.n_features), dtype=np.float32),
+            }
+            if sp_one_hot:
+                observation_spaces['sp'] = spaces.Box(low=0, high=1, shape=(48,), dtype=np.float32)
+            self.observation_space = spaces.Dict(observation_spaces)
 
-        self.state = np.array([self.charge, curr_ci, fcast_min, fcast_max, fcast_mean, self.daily_charge/2, self.daily_discharge/2], dtype=np.float32)
+        self.fill_state()
 
 
     def step(self, action):
         """
         Simulate one time step in the environment.
 
+        Parameters
+        ----------
+        action : float
+            The action to be taken, ranging from -1 to 1.
+
+        Returns
+        -------
+        tuple
+            A tuple containing the new state, reward, done flag, and additional info.
+            The state is a new array on every step, so it can be kept, e.g.
+            as the terminal observation of a vectorized env. At the end of an episode the info
+            contains a summary of the env stats under 'stats'.
+        """
+        start_time = time.perf_counter()
+
+        self.penalized = False
+        self.clipped = False
+        timestep = self.current_timestep
+
+        _, reward, done, truncated, info = self.take_action(action)
+
+        energy_out = self.energy_out
+        if self.recorder is not None:
+            self.recorder.record(timestep, self.action, energy_out, self.charge, reward)
+
+        self.stats.record(1, self.penalized, self.clipped,
+                          -energy_out if energy_out < 0 else 0.0,
+                          energy_out if energy_out > 0 else 0.0,
+                          time.perf_counter() - start_time)
+
+        if done:
+            info['stats'] = self.stats.summary()
+
+        return self.get_observation(), reward, done, truncated, info
+
+    def take_action(self, action):
+        """
+        Apply the action to the battery and move to the next timestep.
+
         Parameters
         ----------
         action : float
@@ -89,7 +292,11 @@ class BatteryEnv(gym.Env):
         tuple
             A tuple containing the new state, reward, done flag, and additional info.
         """
-        charge, ci, fcast_min, fcast_max, fcast_mean, daily_charge, daily_discharge = self.state
+        # the policy gives an array of shape (1,), do the scalar maths in plain floats
+        action = float(np.asarray(action).reshape(-1)[0])
+        self.action = action
+
+        charge = float(self.state[0])
 
         if self.sp == 1:
             self.daily_charge = 0.0
@@ -98,8 +305,6 @@ class BatteryEnv(gym.Env):
         # get number of cycles of this action for update later
         # action_cycles = (action/2) / self.duration
 
-        print("action norm: ", action)
-
         # un_normalize action for 0.5 hrs
         self.energy_out = action * self.max_power / 2
 
@@ -107,12 +312,11 @@ class BatteryEnv(gym.Env):
 
         action_cycles = self.energy_out / self.max_charge
 
-        print("action_cycles: ", action_cycles)
-
-        print("SP: ", self.sp)
-        print("full action: ", energy_out)
-
-        self.actions.append(energy_out)
+        if self.verbose > 1:
+            print("action norm: ", action)
+            print("action_cycles: ", action_cycles)
+            print("SP: ", self.sp)
+            print("full action: ", energy_out)
 
         done = False
 
@@ -124,6 +328,7 @@ class BatteryEnv(gym.Env):
 
             charge = self.max_charge
             self.charge=1.0
+            self.clipped = True
             return self.out_of_bounds_end()
 
         elif charge - energy_out < self.min_charge:
@@ -132,6 +337,7 @@ class BatteryEnv(gym.Env):
 
             charge = self.min_charge
             self.charge=0.0
+            self.clipped = True
             return self.out_of_bounds_end()
 
         curr_reward = 0
@@ -147,7 +353,7 @@ class BatteryEnv(gym.Env):
               self.energy_out=0
               return self.out_of_bounds_end()
 
-          curr_reward = self.calculate_discharge_reward(energy_out, ci, fcast_mean, fcast_max)
+          curr_reward = self.discharge_coefficients[self.current_timestep] * energy_out
           self.reward = float(curr_reward)
 
         # Charging action
@@ -162,7 +368,7 @@ class BatteryEnv(gym.Env):
               self.energy_out=0
               return self.out_of_bounds_end()
 
-          curr_reward = self.calculate_charge_reward(energy_out, ci, fcast_mean, fcast_min)
+          curr_reward = self.charge_coefficients[self.current_timestep] * energy_out
           self.reward = float(curr_reward)
 
         # update charge
@@ -178,8 +384,9 @@ class BatteryEnv(gym.Env):
           return self.state, self.reward, done, False, {}
 
         self.state = self.get_next_state()
-        print("state: ", self.state)
-        print("timestep: ", self.current_timestep)
+        if self.verbose > 1:
+            print("state: ", self.state)
+            print("timestep: ", self.current_timestep)
         return self.state, self.reward, done, False, {}
 
     def out_of_bounds_end(self):
@@ -193,6 +400,7 @@ class BatteryEnv(gym.Env):
             The next state, penalty reward, done flag, and additional info.
         """
         self.reward = self.penalty
+        self.penalized = True
         done=True
         self.state = self.get_next_state()
         return self.state, self.reward, done, False, {}
@@ -208,58 +416,88 @@ class BatteryEnv(gym.Env):
         """
         self.current_timestep += 1
 
+        # wrap around to the start of the data
+        if self.current_timestep >= self.n_timesteps:
+            self.current_timestep = 0
+
         self.sp = self.settlement_periods[self.current_timestep]
-        next_ci = (self.carbon_intensity_data[self.current_timestep] - self.mean_ci) / self.std_dev_ci
-        fcast_min = (self.forecast_min[self.current_timestep] - self.mean_ci) / self.std_dev_ci
-        fcast_max = (self.forecast_max[self.current_timestep] - self.mean_ci) / self.std_dev_ci
-        fcast_mean = (self.forecast_mean[self.current_timestep] - self.mean_ci) / self.std_dev_ci
+        self.fill_state()
+        return self.state
+
+    def fill_state(self):
+        """
+        Write the observation for the current timestep into the preallocated
+        state buffer.
+        """
+        state = self.state
+        state[0] = self.charge
+        state[1:self.n_features + 1] = self.features[self.current_timestep]
+        state[-2] = self.daily_charge / 2
+        state[-1] = self.daily_discharge / 2
+
+    def get_observation(self):
+        """
+        Get the observation for the current timestep.
 
-        state = np.array([self.charge, next_ci, fcast_min, fcast_max, fcast_mean, self.daily_charge/2, self.daily_discharge/2], dtype=np.float32)
-        return state
+        Returns
+        -------
+        np.array or dict
+            A copy of the state buffer, or a dict when lookback > 1 or
+            sp_one_hot is used. Later steps and resets never change it. In
+            the dict only 'battery' is a new array, 'window' and 'sp' are
+            read only views into the precomputed windows and SP vectors, so
+            they cost nothing however long the lookback is.
+        """
+        if not self.dict_observation:
+            return self.state.copy()
+
+        observation = {
+            'battery': self.state[[0, -2, -1]],
+            'window': self.windows[self.current_timestep],
+        }
+        if self.sp_one_hot:
+            observation['sp'] = self.sp_vectors[self.sp - 1]
+        return observation
+
+    def get_state(self):
+        """
+        Take a snapshot of the env's mutable state, e.g. to branch from it in
+        a lookahead search. Only a few scalars are copied, never the data.
+
+        Returns
+        -------
+        BatteryState
+            The timestep, charge, daily cycles, SP, reward and energy out
+        """
+        return BatteryState(self.current_timestep, self.charge, self.daily_charge, self.daily_discharge,
+                            self.sp, self.reward, self.energy_out)
+
+    def set_state(self, battery_state):
+        """
+        Restore a snapshot taken with get_state.
+
+        Parameters
+        ----------
+        battery_state : BatteryState
+            The snapshot to restore
+
+        Returns
+        -------
+        np.array or dict
+            The observation of the restored state
+        """
+        self.current_timestep = battery_state.timestep
+        self.charge = battery_state.charge
+        self.daily_charge = battery_state.daily_charge
+        self.daily_discharge = battery_state.daily_discharge
+        self.sp = battery_state.sp
+        self.reward = battery_state.reward
+        self.energy_out = battery_state.energy_out
+        self.fill_state()
+        return self.get_observation()
 
     def get_cycles_reward(self, cycles):
-        return cycles**10
-        # if cycles > 1.8:
-        #     return 300
-        # elif cycles > 1.5:
-        #     return 200
-        # elif cycles > 1.3:
-        #     return 100
-        # elif cycles > 1.1:
-        #     return 50
-        # elif cycles > 0.8:
-        #     return 20
-        # return 0
-
-    def calculate_charge_reward(self, energy_out, ci, fcast_mean, fcast_min):
-      curr_reward = 0
-
-      diff = ci - fcast_mean
-      if diff > 0:
-        # higher CI than fcast mean, so negative reward
-        curr_reward -= energy_out * 5
-      else:
-        # negative diff, so positive reward
-        curr_reward += energy_out
-      if ci <= fcast_min:
-        # extreme positive reward
-        curr_reward += energy_out * 5
-
-      return curr_reward
-
-    def calculate_discharge_reward(self, energy_out, ci, fcast_mean, fcast_max):
-      curr_reward = 0
-      diff = ci - fcast_mean
-
-      if diff < 0:
-        curr_reward -= energy_out * 5
-      # if above average
-      else:
-        curr_reward += energy_out
-      if ci >= fcast_max:
-        curr_reward += energy_out * 5
-
-      return curr_reward
+        return cycles_reward(cycles)
 
     def reset(self, seed=42, options=None):
         """
@@ -279,10 +517,13 @@ class BatteryEnv(gym.Env):
         """
         super().reset(seed=seed)
         # Reset to initial state
-        # already increment timestep in get_next_state
+        # already increment timestep in get_next_state, unless a scheduler picks the next day
 
         self.reward = 0.0
 
+        if self.scheduler is not None:
+            self.current_timestep = self.scheduler.next_day()
+
         self.sp = self.settlement_periods[self.current_timestep]
 
         # if we reach a new day, reset the cycles
@@ -291,10 +532,5 @@ class BatteryEnv(gym.Env):
         self.daily_charge = 0.0
         self.daily_discharge = 0.0
 
-        ci = (self.carbon_intensity_data[self.current_timestep] - self.mean_ci) / self.std_dev_ci
-        fcast_min = (self.forecast_min[self.current_timestep] - self.mean_ci) / self.std_dev_ci
-        fcast_max = (self.forecast_max[self.current_timestep] - self.mean_ci) / self.std_dev_ci
-        fcast_mean = (self.forecast_mean[self.current_timestep] - self.mean_ci) / self.std_dev_ci
-
-        self.state = np.array([self.charge, ci, fcast_min, fcast_max, fcast_mean, self.daily_charge/2, self.daily_discharge/2], dtype=np.float32)
-        return self.state, {}
+        self.fill_state()
+        return self.get_observation(), {}
@@ -0,0 +1,319 @@
+import warnings
+import numpy as np
+from battery_agent.battery_env import build_feature_matrix, build_reward_tables, cycles_reward
+from battery_agent.optimal_dispatch import get_day_rows, dispatch_results
+
+DP_OBJECTIVES = ['carbon', 'reward']
+
+
+def reward_tables(ci_data, mean_ci, std_dev_ci):
+    """
+    Get the BatteryEnv reward per MWh charged and per MWh discharged at every
+    timestep. The env compares the normalized intensity to the normalized
+    forecasts, so the same float32 features are used here.
+
+    Parameters
+    ----------
+    ci_data : pd.DataFrame
+        Carbon intensity data with the forecast columns
+    mean_ci : float
+        Mean value of training carbon intensity data for normalization.
+    std_dev_ci : float
+        Standard deviation of training carbon intensity data for normalization.
+
+    Returns
+    -------
+    np.array, np.array
+        Reward per MWh charged and per MWh discharged, one per row of ci_data
+    """
+    return build_reward_tables(build_feature_matrix(ci_data, mean_ci, std_dev_ci))
+
+
+def solve_dp_dispatch(charge_values, discharge_values, max_power, max_charge, initial_soc=0.0, num_cycles=2,
+                      n_levels=16, cycles_reward=None, batch_size=128, env_dynamics=False):
+    """
+    Find the dispatch of every day that gets the highest value, by backward
+    induction over a grid of states of charge and daily charge cycles. Each
+    settlement period is one array operation over every state of every day
+    in the batch.
+
+    The charge is discretized into n_levels steps of a full battery, and
+    every action moves it a whole number of steps. By default the charge is
+    physical, like in solve_daily_dispatch: a step is max_charge / n_levels
+    MWh and the charge stays within [0, max_charge].
+
+    With env_dynamics the charge moves like BatteryEnv's charge fraction, by
+    action / 2, so a step is max_power / n_levels MWh, and the bounds are
+    checked like BatteryEnv checks them, on the MWh held before every action.
+    The two only differ when max_power != max_charge, and only the schedules
+    planned with env_dynamics can then be replayed in BatteryEnv. With
+    max_power > max_charge BatteryEnv can never empty the battery again, so
+    no day can return to an initial_soc of 0 and every day is left idle.
+
+    BatteryEnv checks its bounds and cycle limits on floats, so a schedule
+    that ends exactly on them is only replayed without penalties when the
+    grid is exact in binary, which is why n_levels is a power of two by
+    default.
+
+    The state is the charge and the energy charged so far in the day, which
+    together also give the energy discharged, so the daily cycle limits of
+    BatteryEnv are kept exactly and any function of the daily cycles can be
+    rewarded at the end of the day. Actions that would go out of bounds or
+    over the cycle limits are never taken. Like solve_daily_dispatch, every
+    day starts and ends at initial_soc so the days are independent.
+
+    Parameters
+    ----------
+    charge_values : np.array
+        Value of charging one MWh in every settlement period of every day,
+        shape (n_days, 48)
+    discharge_values : np.array
+        Value of discharging one MWh in every settlement period of every day,
+        shape (n_days, 48)
+    max_power : float
+        Battery's power capacity
+    max_charge : float
+        Battery's energy capacity
+    initial_soc : float, optional
+        State of charge every day starts and ends at, as a fraction of
+        max_charge. Rounded to the grid.
+    num_cycles : int, optional
+        Maximum charge and discharge cycles per day
+    n_levels : int, optional
+        Number of steps of the state of charge grid
+    cycles_reward : function, optional
+        Value of the day's charge cycles and of its discharge cycles, added at
+        the end of the day. Takes an array of cycles.
+    batch_size : int, optional
+        Number of days solved at once, which bounds the memory used
+    env_dynamics : bool, optional
+        Whether the charge moves like BatteryEnv's charge fraction instead of
+        the physical charge
+
+    Returns
+    -------
+    np.array, np.array, np.array
+        Energy out (MWh, negative when charging) and the state of charge after
+        each settlement period, shape (n_days, 48), and the value of every day
+    """
+    charge_values = np.asarray(charge_values, dtype=np.float64).reshape(-1, 48)
+    discharge_values = np.asarray(discharge_values, dtype=np.float64).reshape(-1, 48)
+    n_days = len(charge_values)
+
+    if not env_dynamics and max_power != max_charge:
+        warnings.warn(f"The dispatch of a {max_power:g}MW/{max_charge:g}MWh battery is planned with the physical "
+                      f"charge and BatteryEnv would not follow it, as it moves the charge fraction by action / 2. "
+                      f"Use env_dynamics to plan in BatteryEnv's dynamics.")
+
+    if env_dynamics and max_power > max_charge and round(initial_soc * n_levels) == 0:
+        warnings.warn(f"BatteryEnv can never empty a {max_power:g}MW/{max_charge:g}MWh battery once it is charged, "
+                      f"so no day can end at an initial_soc of 0 and the dispatch is idle.")
+
+    # MWh moved by one step of the grid
+    step = (max_power if env_dynamics else max_charge) / n_levels
+    max_move = int(np.floor(max_power / 2 / step + 1e-9))
+    if max_move < 1:
+        raise ValueError(f"n_levels={n_levels} is too coarse for a {max_power}MW/{max_charge}MWh battery to move")
+    max_cycled = int(np.floor(num_cycles * max_charge / step + 1e-9))
+    start_level = int(round(initial_soc * n_levels))
+
+    # BatteryEnv only checks the MWh held before each action, so when a step is less than max_charge / n_levels
+    # its charge fraction can leave [0, 1] by what max_move steps hold
+    extra = 0 if step * n_levels >= max_charge else int(np.floor(max_move * step * n_levels / max_charge + 1e-9))
+    levels = np.arange(-extra, n_levels + extra + 1)
+    n_states = len(levels)
+
+    # moves in steps, positive is discharging
+    moves = np.arange(-max_move, max_move + 1)
+    charged = np.arange(max_cycled + 1)[None, :]
+    # energy discharged so far in the day follows from the charge and the energy charged
+    discharged = start_level + charged - levels[:, None]
+    valid = (discharged >= 0) & (discharged <= max_cycled)
+
+    # the bounds BatteryEnv checks before every action, on the MWh held minus the MWh discharged, where
+    # the MWh held come from the float32 charge in its observation
+    held = (levels / n_levels).astype(np.float32).astype(np.float64) * max_charge
+    held_after = held[None, :] - moves[:, None] * step
+    in_bounds = np.where((held_after >= 0) & (held_after <= max_charge), 0.0, -np.inf)
+
+    # value of ending the day in every state
+    terminal = np.where(valid & (levels[:, None] == start_level), 0.0, -np.inf)
+    if cycles_reward is not None:
+        with np.errstate(invalid='ignore'):
+            terminal = terminal + cycles_reward(charged * step / max_charge) + cycles_reward(np.maximum(discharged, 0) * step / max_charge)
+
+    energy_out = np.zeros((n_days, 48))
+    charge = np.zeros((n_days, 48))
+    values = np.zeros(n_days)
+
+    for start in range(0, n_days, batch_size):
+        days = np.arange(start, min(start + batch_size, n_days))
+        n = len(days)
+
+        # value of moving by every action in every settlement period
+        move_values = np.where(moves > 0,
+                               discharge_values[days, :, None] * moves * step,
+                               charge_values[days, :, None] * -moves * step)
+
+        policy = np.empty((48, n, n_states, max_cycled + 1), dtype=np.int16)
+        value = np.broadcast_to(terminal, (n, n_states, max_cycled + 1))
+        for sp in range(47, -1, -1):
+            # unreachable states are -inf, so are the moves that leave the grid
+            padded = np.full((n, n_states + 2 * max_move, max_cycled + 1 + max_move), -np.inf)
+            padded[:, max_move:max_move + n_states, :max_cycled + 1] = np.where(valid, value, -np.inf)
+
+            action_values = np.empty((len(moves), n, n_states, max_cycled + 1))
+            for i, move in enumerate(moves):
+                charged_after = max(-move, 0)
+                action_values[i] = (padded[:, max_move - move:max_move - move + n_states,
+                                           charged_after:charged_after + max_cycled + 1]
+                                    + move_values[:, sp, i, None, None]
+                                    + in_bounds[i, None, :, None])
+
+            policy[sp] = np.argmax(action_values, axis=0)
+            value = np.take_along_axis(action_values, policy[sp][None].astype(np.intp), axis=0)[0]
+
+        values[days] = value[:, start_level + extra, 0]
+
+        # follow the policy forward from the start of every day
+        state = np.full(n, start_level + extra)
+        cycled = np.zeros(n, dtype=np.intp)
+        for sp in range(48):
+            move = moves[policy[sp, np.arange(n), state, cycled]]
+            energy_out[days, sp] = move * step
+            state = state - move
+            cycled = cycled + np.maximum(-move, 0)
+            charge[days, sp] = levels[state] / n_levels
+
+    return energy_out, charge, values
+
+
+def dp_dispatch_lanes(lanes, objective='carbon', mean_ci=None, std_dev_ci=None, initial_soc=0.0, num_cycles=2,
+                      n_levels=16, intensity_column='nationalIntensity', batch_size=128, env_dynamics=None):
+    """
+    Find the best dispatch of every lane with solve_dp_dispatch. Lanes with
+    the same battery size are solved together.
+
+    Parameters
+    ----------
+    lanes : list
+        (data, power capacity, energy capacity) of every lane, like
+        BatteryAgent.test_lanes
+    objective : str, optional
+        'carbon' maximizes the carbon abated, i.e. the intensity of every MWh
+        discharged minus that of every MWh charged. 'reward' maximizes the
+        BatteryEnv reward, including the end of day cycles reward.
+    mean_ci : float, optional
+        Mean value of training carbon intensity data, needed for 'reward'
+    std_dev_ci : float, optional
+        Standard deviation of training carbon intensity data, needed for 'reward'
+    initial_soc : float, optional
+        State of charge every day starts and ends at, as a fraction of max_charge
+    num_cycles : int, optional
+        Maximum charge and discharge cycles per day
+    n_levels : int, optional
+        Number of steps of the state of charge grid
+    intensity_column : str, optional
+        The intensity to abate for 'carbon'
+    batch_size : int, optional
+        Number of days solved at once
+    env_dynamics : bool, optional
+        Whether to plan in BatteryEnv's charge dynamics, see
+        solve_dp_dispatch. Defaults to True for 'reward' and False for
+        'carbon', which is then a discretized optimal_dispatch_lanes.
+
+    Returns
+    -------
+    list
+        A new DataFrame per lane with its data and 'energyOut' and 'charge'
+        columns, see dispatch_results
+    """
+    if objective not in DP_OBJECTIVES:
+        raise ValueError(f"objective must be one of {DP_OBJECTIVES}, got {objective}")
+    if objective == 'reward' and (mean_ci is None or std_dev_ci is None):
+        raise ValueError("The 'reward' objective needs mean_ci and std_dev_ci to normalize the data like BatteryEnv")
+    if env_dynamics is None:
+        env_dynamics = objective == 'reward'
+
+    day_rows = []
+    charge_values = []
+    discharge_values = []
+    for data, _, _ in lanes:
+        rows = get_day_rows(data)
+        day_rows.append(rows)
+        if objective == 'carbon':
+            intensity = np.asarray(data[intensity_column], dtype=np.float64)
+            charge_values.append(-intensity[rows])
+            discharge_values.append(intensity[rows])
+        else:
+            lane_charge_values, lane_discharge_values = reward_tables(data, mean_ci, std_dev_ci)
+            charge_values.append(lane_charge_values[rows])
+            discharge_values.append(lane_discharge_values[rows])
+
+    day_offsets = np.cumsum([0] + [len(rows) for rows in day_rows])
+    energy_out = np.zeros((day_offsets[-1], 48))
+    charge = np.zeros((day_offsets[-1], 48))
+
+    sizes = [(max_power, max_charge) for _, max_power, max_charge in lanes]
+    for size in dict.fromkeys(sizes):
+        group = [i for i, lane_size in enumerate(sizes) if lane_size == size]
+        group_days = np.concatenate([np.arange(day_offsets[i], day_offsets[i + 1]) for i in group])
+
+        group_energy, group_charge, _ = solve_dp_dispatch(np.concatenate([charge_values[i] for i in group]),
+                                                          np.concatenate([discharge_values[i] for i in group]),
+                                                          size[0], size[1], initial_soc, num_cycles, n_levels,
+                                                          cycles_reward if objective == 'reward' else None,
+                                                          batch_size, env_dynamics)
+        energy_out[group_days] = group_energy
+        charge[group_days] = group_charge
+
+    return dispatch_results(lanes, day_rows, energy_out, charge, initial_soc)
+
+
+def dp_dispatch(ci_data, max_power, max_charge, objective='carbon', mean_ci=None, std_dev_ci=None, initial_soc=0.0,
+                num_cycles=2, n_levels=16, intensity_column='nationalIntensity', env_dynamics=None):
+    """
+    Find the best dispatch with perfect foresight on a grid of states of
+    charge, for either the carbon abated or the BatteryEnv reward. With the
+    'carbon' objective it is a discretized optimal_dispatch. With the
+    'reward' objective it is planned in BatteryEnv's charge dynamics, and is
+    the best BatteryEnv score among the schedules on the grid that start and
+    end every day at initial_soc, so the days are independent. The result can
+    be scored like an agent's:
+
+        full_data = process_test_data(dp_dispatch(test_data, 25, 50))
+        calculate_total_carbon_abated(full_data)
+
+    Parameters
+    ----------
+    ci_data : pd.DataFrame
+        Carbon intensity data with 'settlementPeriod', intensity_column and,
+        for 'reward', the forecast columns
+    max_power : float
+        Battery's power capacity
+    max_charge : float
+        Battery's energy capacity
+    objective : str, optional
+        'carbon' or 'reward', see dp_dispatch_lanes
+    mean_ci : float, optional
+        Mean value of training carbon intensity data, needed for 'reward'
+    std_dev_ci : float, optional
+        Standard deviation of training carbon intensity data, needed for 'reward'
+    initial_soc : float, optional
+        State of charge every day starts and ends at, as a fraction of max_charge
+    num_cycles : int, optional
+        Maximum charge and discharge cycles per day
+    n_levels : int, optional
+        Number of steps of the state of charge grid
+    intensity_column : str, optional
+        The intensity to abate for 'carbon'
+    env_dynamics : bool, optional
+        Whether to plan in BatteryEnv's charge dynamics, see dp_dispatch_lanes
+
+    Returns
+    -------
+    pd.DataFrame
+        A new DataFrame with the data and 'energyOut' and 'charge' columns
+    """
+    return dp_dispatch_lanes([(ci_data, max_power, max_charge)], objective, mean_ci, std_dev_ci, initial_soc,
+                             num_cycles, n_levels, intensity_column, env_dynamics=env_dynamics)[0]
@@ -0,0 +1,84 @@
+import time
+import numpy as np
+
+STAT_NAMES = ['steps', 'penalties', 'clipped_actions', 'energy_in', 'energy_out', 'step_time']
+
+
+class EnvStats:
+    """
+    Running counters and timers for the battery environments, kept in one
+    NumPy array so recording a step never does any I/O.
+
+    Parameters
+    ----------
+    verbose : int, optional
+        0 is silent, 1 prints a summary every log_freq steps.
+    log_freq : int, optional
+        Number of steps between printed summaries when verbose > 0.
+    """
+
+    def __init__(self, verbose=0, log_freq=10000):
+        self.verbose = verbose
+        self.log_freq = log_freq
+        self.counters = np.zeros(len(STAT_NAMES))
+        self.next_log = log_freq
+        self.start_time = time.perf_counter()
+
+    def record(self, steps, penalties, clipped_actions, energy_in, energy_out, step_time):
+        """
+        Add the outcome of one (possibly batched) step to the counters.
+
+        Parameters
+        ----------
+        steps : int
+            Number of battery steps taken
+        penalties : int
+            Number of steps that ended in the out of bounds or cycle penalty
+        clipped_actions : int
+            Number of actions clipped to keep the charge inside its bounds
+        energy_in : float
+            Energy charged in MWh
+        energy_out : float
+            Energy discharged in MWh
+        step_time : float
+            Wall time spent in the step in seconds
+        """
+        counters = self.counters
+        counters[0] += steps
+        counters[1] += penalties
+        counters[2] += clipped_actions
+        counters[3] += energy_in
+        counters[4] += energy_out
+        counters[5] += step_time
+
+        if self.verbose > 0 and counters[0] >= self.next_log:
+            self.next_log += self.log_freq
+            self.log_summary()
+
+    def summary(self):
+        """
+        Get a snapshot of the counters.
+
+        Returns
+        -------
+        dict
+            The counters by name, plus the mean time per step in microseconds
+            and the steps per second of wall time since the stats were created.
+        """
+        summary = dict(zip(STAT_NAMES, self.counters.tolist()))
+        steps = max(summary['steps'], 1)
+        summary['us_per_step'] = 1e6 * summary['step_time'] / steps
+        summary['steps_per_sec'] = summary['steps'] / (time.perf_counter() - self.start_time)
+        return summary
+
+    def log_summary(self):
+        summary = self.summary()
+        print(f"steps: {summary['steps']:.0f} | penalties: {summary['penalties']:.0f} | "
+              f"clipped: {summary['clipped_actions']:.0f} | energy in: {summary['energy_in']:.1f} MWh | "
+              f"energy out: {summary['energy_out']:.1f} MWh | {summary['us_per_step']:.1f} us/step | "
+              f"{summary['steps_per_sec']:.0f} steps/s")
+
+    def reset(self):
+        self.counters[:] = 0.0
+        self.next_log = self.log_freq
+        self.start_time = time.perf_counter()
@@ -0,0 +1,143 @@
+import numpy as np
+
+SCHEDULER_MODES = ['sequential', 'shuffle', 'weighted']
+
+
+def get_day_starts(settlement_periods):
+    """
+    Get the row of every complete day in the data, i.e. every settlement
+    period 1 that is followed by the other 47 settlement periods of the day.
+
+    Parameters
+    ----------
+    settlement_periods : np.array
+        Settlement period of every row of the data
+
+    Returns
+    -------
+    np.array
+        Row index of the first settlement period of each day
+    """
+    settlement_periods = np.asarray(settlement_periods)
+    day_starts = np.flatnonzero(settlement_periods == 1)
+    day_starts = day_starts[day_starts + 48 <= len(settlement_periods)]
+    return day_starts[settlement_periods[day_starts + 47] == 48]
+
+
+def split_days(settlement_periods, n_parts):
+    """
+    Split the days of the data into contiguous, disjoint ranges, e.g. one
+    per parallel training worker.
+
+    Parameters
+    ----------
+    settlement_periods : np.array
+        Settlement period of every row of the data
+    n_parts : int
+        Number of ranges to split the days into
+
+    Returns
+    -------
+    list
+        Arrays of day indices, to use as the days of a DayScheduler
+    """
+    n_days = len(get_day_starts(settlement_periods))
+    return np.array_split(np.arange(n_days), n_parts)
+
+
+class DayScheduler:
+    """
+    Picks the day each episode of a battery env starts on, from a precomputed
+    index of day start rows, so a reset only costs a lookup.
+
+    Days are taken in order in 'sequential' mode, in a new random order on
+    every pass in 'shuffle' mode, and drawn with replacement with the given
+    weights in 'weighted' mode. Sequential and shuffled passes wrap around
+    when every day has been used, so training can run for any number of
+    epochs over the data.
+
+    Parameters
+    ----------
+    settlement_periods : np.array
+        Settlement period of every row of the data
+    mode : str, optional
+        One of 'sequential', 'shuffle' or 'weighted'
+    days : np.array, optional
+        Indices of the days to use, e.g. from split_days. Defaults to all days.
+    weights : np.array, optional
+        Sampling weight of each day, required in 'weighted' mode
+    seed : int, optional
+        Seed of the random number generator
+    """
+
+    def __init__(self, settlement_periods, mode='sequential', days=None, weights=None, seed=None):
+        if mode not in SCHEDULER_MODES:
+            raise ValueError(f"mode must be one of {SCHEDULER_MODES}, got {mode}")
+
+        self.mode = mode
+        self.day_starts = get_day_starts(settlement_periods)
+        if days is not None:
+            self.day_starts = self.day_starts[days]
+
+        if len(self.day_starts) == 0:
+            raise ValueError("The data does not contain any complete days")
+
+        self.n_days = len(self.day_starts)
+        self.rng = np.random.default_rng(seed)
+        self.epoch = 0
+        self.position = 0
+
+        if mode == 'weighted':
+            if weights is None:
+                raise ValueError("weights are required in weighted mode")
+            weights = np.asarray(weights, dtype=np.float64)
+            if days is not None and len(weights) != self.n_days:
+                weights = weights[days]
+            self.probabilities = weights / weights.sum()
+            self.order = self.draw_weighted()
+        elif mode == 'shuffle':
+            self.order = self.rng.permutation(self.n_days)
+        else:
+            self.order = np.arange(self.n_days)
+
+    def draw_weighted(self):
+        # draw a block of days at a time so sampling a day stays O(1)
+        return self.rng.choice(self.n_days, size=max(self.n_days, 1024), p=self.probabilities)
+
+    def next_day(self):
+        """
+        Get the start row of the next episode's day.
+
+        Returns
+        -------
+        int
+            Row of the first settlement period of the day
+        """
+        if self.position >= len(self.order):
+            self.position = 0
+            self.epoch += 1
+            if self.mode == 'shuffle':
+                self.order = self.rng.permutation(self.n_days)
+            elif self.mode == 'weighted':
+                self.order = self.draw_weighted()
+
+        day = self.order[self.position]
+        self.position += 1
+        return int(self.day_starts[day])
+
+    def next_days(self, n):
+        """
+        Get the start rows of the next n episodes, e.g. for the lanes of a
+        BatchedBatteryEnv that finished on the same step.
+
+        Parameters
+        ----------
+        n : int
+            Number of days
+
+        Returns
+        -------
+        np.array
+            Row of the first settlement period of each day
+        """
+        return np.array([self.next_day() for _ in range(n)], dtype=np.int64)
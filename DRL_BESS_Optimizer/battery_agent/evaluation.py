@@ -0,0 +1,109 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+import pandas as pd
+import torch as th
+from battery_agent.agent import BatteryAgent
+from battery_agent.test_analysis import process_test_data, calculate_total_carbon_abated
+
+# set in every worker process by init_worker
+worker_agent = None
+worker_periods = None
+
+
+def init_worker(train_data, periods):
+    """
+    Set up an evaluation worker process. The data is sent once per worker,
+    and test_agent loads the models through the model cache, so each is
+    only loaded the first time one of the worker's tasks needs it.
+    """
+    global worker_agent, worker_periods
+    th.set_num_threads(1)
+    worker_agent = BatteryAgent(train_data=train_data, test_data=None)
+    worker_periods = periods
+
+
+def evaluate_task(task):
+    """
+    Test one model on one period for one battery size and calculate the
+    carbon it abated. Runs in a worker process.
+
+    Parameters
+    ----------
+    task : tuple
+        (model name, algorithm, period name, power capacity, energy capacity)
+
+    Returns
+    -------
+    dict
+        The result of calculate_total_carbon_abated, along with the task
+    """
+    model_name, algorithm, period, max_power, max_charge = task
+
+    worker_agent.test_data = worker_periods[period]
+    test_results, daily_charge, daily_discharge = worker_agent.test_agent(max_power, max_charge, model_name,
+                                                                          algorithm=algorithm)
+
+    full_data = process_test_data(test_results)
+    result = calculate_total_carbon_abated(full_data)
+
+    return {
+        "Model": model_name,
+        "Algorithm": algorithm,
+        "Period": period,
+        "MW Capacity": max_power,
+        "MWh Capacity": max_charge,
+        "Duration": max_charge / max_power,
+        **result,
+    }
+
+
+def evaluate_matrix(model_names, periods, sizes, train_data, algorithm='DDPG', n_workers=None, save_file=None):
+    """
+    Test every combination of model, test period and battery size on a
+    process pool and calculate the carbon each abated.
+
+    Tasks are grouped by model so each worker loads as few models as
+    possible.
+
+    Parameters
+    ----------
+    model_names : list
+        Names of saved models in 'battery_agent/models/'
+    periods : dict
+        Test data by period name, e.g.
+        {'year': test_data_1_year, 'q1': test_data_q1, 'q2': test_data_q2, 'q4': test_data_q4}
+    sizes : list
+        (power capacity, energy capacity) of every battery size
+    train_data : pd.DataFrame
+        The training data, for the normalization of the observations
+    algorithm : str or dict, optional
+        The algorithm the models were trained with, one of 'DDPG', 'SAC',
+        'TD3', 'PPO' or 'A2C', or a dict of it by model name
+    n_workers : int, optional
+        Number of worker processes. Defaults to the number of cores.
+    save_file : str, optional
+        csv file to save the results to
+
+    Returns
+    -------
+    pd.DataFrame
+        One row per model, period and size with the carbon abated, weighted
+        average intensities, and energy charged and discharged
+    """
+    algorithms = algorithm if isinstance(algorithm, dict) else {model_name: algorithm for model_name in model_names}
+    tasks = [(model_name, algorithms[model_name], period, max_power, max_charge)
+             for model_name in model_names
+             for period in periods
+             for max_power, max_charge in sizes]
+
+    n_workers = n_workers or os.cpu_count() or 1
+    chunksize = max(1, len(tasks) // (4 * n_workers))
+
+    with ProcessPoolExecutor(max_workers=n_workers, initializer=init_worker, initargs=(train_data, periods)) as pool:
+        results = pd.DataFrame(list(pool.map(evaluate_task, tasks, chunksize=chunksize)))
+
+    if save_file is not None:
+        os.makedirs(os.path.dirname(save_file) or ".", exist_ok=True)
+        results.to_csv(save_file, index=False)
+
+    return results
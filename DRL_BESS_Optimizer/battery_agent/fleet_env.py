@@ -0,0 +1,158 @@
+import numpy as np
+import pandas as pd
+from battery_agent.batched_battery_env import BatchedBatteryEnv
+
+
+class FleetBatteryEnv(BatchedBatteryEnv):
+
+    def __init__(self, fleet, ci_data, mean_ci, std_dev_ci, regional_ci_data=None, initial_soc=0.0, start_timestep=0, **kwargs):
+        """
+        Batched env with one lane per asset of a BESS fleet, so a whole fleet
+        is simulated with one policy call and one NumPy step per settlement
+        period.
+
+        Along with the env, every lane keeps the energy it charged and
+        discharged and the intensity weighted sums of both, so the carbon
+        abated by each asset is available after a single pass.
+
+        Parameters
+        ----------
+        fleet : pd.DataFrame
+            The fleet, indexed by BMU ID with 'MW', 'MWh', 'Region' and 'Name'
+            columns, e.g. config.BESS_fleet
+        ci_data : dict
+            Dictionary containing data related to carbon intensity, shared by
+            every asset whose region is not in regional_ci_data
+        mean_ci : float
+            Mean value of training carbon intensity data for normalization.
+        std_dev_ci : float
+            Standard deviation of training carbon intensity data for normalization.
+        regional_ci_data : dict, optional
+            Carbon intensity data by region id, with the same columns and
+            settlement periods as ci_data. Assets use the data of their region.
+        initial_soc : float, optional
+            Initial state of charge of every asset as a fraction of its energy capacity
+        start_timestep : int, optional
+            Row of the data every asset starts from
+        **kwargs
+            Passed on to BatchedBatteryEnv
+        """
+        self.bmu_ids = np.array(fleet.index)
+        self.names = np.array(fleet['Name']) if 'Name' in fleet else self.bmu_ids
+        self.regions = np.array(fleet['Region'])
+
+        max_power = fleet['MW'].to_numpy(dtype=np.float64)
+        max_charge = fleet['MWh'].to_numpy(dtype=np.float64)
+
+        regional_ci_data = regional_ci_data or {}
+        region_ids = sorted(regional_ci_data)
+        sources = [ci_data] + [regional_ci_data[region] for region in region_ids]
+
+        # assets in a region without its own data use the shared data at index 0
+        source_of_region = {region: i + 1 for i, region in enumerate(region_ids)}
+        data_index = np.array([source_of_region.get(region, 0) for region in self.regions], dtype=np.int64)
+
+        # raw intensities, to weight the energy charged and discharged
+        self.intensity = np.stack([np.asarray(source['nationalIntensity'], dtype=np.float64) for source in sources])
+
+        n_assets = len(fleet)
+        super(FleetBatteryEnv, self).__init__(
+            n_assets,
+            initial_charge=initial_soc * max_charge,
+            max_power=max_power,
+            max_charge=max_charge,
+            min_charge=0,
+            ci_data=sources,
+            mean_ci=mean_ci,
+            std_dev_ci=std_dev_ci,
+            start_timesteps=np.full(n_assets, start_timestep),
+            data_index=data_index,
+            **kwargs)
+
+        self.energy_charged = np.zeros(n_assets)
+        self.energy_discharged = np.zeros(n_assets)
+        self.ci_energy_charged = np.zeros(n_assets)
+        self.ci_energy_discharged = np.zeros(n_assets)
+
+    def step_wait(self):
+        """
+        Advance every asset by one settlement period and add the energy it
+        charged and discharged to its totals.
+
+        Returns
+        -------
+        tuple
+            The observations, rewards, done flags and info dicts of all assets.
+        """
+        intensity = self.intensity[self.data_index, self.current_timestep]
+
+        result = super(FleetBatteryEnv, self).step_wait()
+
+        charged = np.where(self.energy_out < 0, -self.energy_out, 0.0)
+        discharged = np.where(self.energy_out > 0, self.energy_out, 0.0)
+        self.energy_charged += charged
+        self.energy_discharged += discharged
+        self.ci_energy_charged += intensity * charged
+        self.ci_energy_discharged += intensity * discharged
+
+        return result
+
+    def run_policy(self, model, n_steps):
+        """
+        Run a policy on every asset at once for n_steps settlement periods,
+        calling it once per step on the observations of the whole fleet.
+
+        Parameters
+        ----------
+        model : BaseAlgorithm
+            Trained model, or anything with a stable-baselines3 style predict
+        n_steps : int
+            Number of settlement periods to run
+
+        Returns
+        -------
+        pd.DataFrame
+            Carbon abatement results of each asset, see results
+        """
+        obs = self.reset()
+        for _ in range(n_steps):
+            actions, _states = model.predict(obs, deterministic=True)
+            obs, _rewards, _dones, _infos = self.step(actions)
+
+        return self.results()
+
+    def results(self):
+        """
+        Calculate the carbon abated by each asset so far, using the same
+        formula as test_analysis.calculate_total_carbon_abated:
+
+            ((CId - CIc) * Ed - ((Ec - Ed) * CIc)) / Ed
+
+        Returns
+        -------
+        pd.DataFrame
+            One row per asset with its BMUID, carbon abated, weighted average
+            intensities while charging and discharging, energy charged and
+            discharged, capacities and duration.
+        """
+        with np.errstate(divide='ignore', invalid='ignore'):
+            CIc_national = self.ci_energy_charged / self.energy_charged / 0.001
+            CId_national = self.ci_energy_discharged / self.energy_discharged / 0.001
+            carbon_abated_national = ((CId_national - CIc_national) * self.energy_discharged
+                                      - ((self.energy_charged - self.energy_discharged) * CIc_national)) / self.energy_discharged
+
+        return pd.DataFrame({
+            "BMUID": self.bmu_ids,
+            "carbon_abated_national (mt CO2/MWh Discharged)": carbon_abated_national / 1e6,
+            "CIc_national (mt CO2/MWh)": CIc_national / 1e6,
+            "CId_national (mt CO2/MWh)": CId_national / 1e6,
+            "Ec (MWh)": self.energy_charged,
+            "Ed (MWh)": self.energy_discharged,
+            "Ec-Ed": self.energy_charged - self.energy_discharged,
+            "CId-CIc": (CId_national / 1e6) - (CIc_national / 1e6),
+            "MW Capacity": self.max_power,
+            "MWh Capacity": self.max_charge,
+            "Duration": self.duration,
+            "RegionId": self.regions,
+            "Asset": self.names,
+        })
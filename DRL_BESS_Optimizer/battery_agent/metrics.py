@@ -0,0 +1,111 @@
+import os
+import time
+import uuid
+from stable_baselines3.common.callbacks import CallbackList, CheckpointCallback
+from stable_baselines3.common.logger import configure
+
+METRICS_BACKENDS = ['wandb', 'tensorboard', 'csv', 'none']
+
+
+class MetricsSink:
+    """
+    Where the training metrics and checkpoints of a run go.
+
+    'wandb' syncs the tensorboard logs to Weights & Biases and needs a login,
+    'tensorboard' only writes the tensorboard event files, 'csv' appends the
+    metrics to a progress.csv file, and 'none' only prints them. Everything
+    but 'wandb' works offline, and wandb is only imported when it is used.
+
+    Parameters
+    ----------
+    backend : str, optional
+        One of 'wandb', 'tensorboard', 'csv' or 'none'
+    log_dir : str, optional
+        Directory the logs of every run are written to, in a folder per run
+    project : str, optional
+        The wandb project
+    config : dict, optional
+        The run config, saved with the wandb run
+    checkpoint_freq : int, optional
+        Number of calls to env.step between model checkpoints, 0 disables them.
+        With a vectorized env every call steps all of its envs.
+    checkpoint_dir : str, optional
+        Directory the checkpoints are saved to, in a folder per run
+    gradient_save_freq : int, optional
+        Number of calls to env.step between logged gradient histograms, 0
+        disables them. Only used by the wandb backend.
+    """
+
+    def __init__(self, backend='csv', log_dir='./final', project="batteryagent_final", config=None,
+                 checkpoint_freq=0, checkpoint_dir='models', gradient_save_freq=0):
+        if backend not in METRICS_BACKENDS:
+            raise ValueError(f"backend must be one of {METRICS_BACKENDS}, got {backend}")
+
+        self.backend = backend
+        self.checkpoint_freq = checkpoint_freq
+        self.gradient_save_freq = gradient_save_freq
+        self.run = None
+
+        if backend == 'wandb':
+            import wandb
+            self.run = wandb.init(
+                project=project,
+                config=config,
+                sync_tensorboard=True,
+            )
+            self.run_id = self.run.id
+        else:
+            # the random suffix keeps runs started in the same second apart
+            self.run_id = f"{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:8]}"
+
+        self.log_dir = os.path.join(log_dir, self.run_id)
+        self.checkpoint_dir = os.path.join(checkpoint_dir, self.run_id)
+
+    @property
+    def tensorboard_log(self):
+        """
+        The tensorboard_log argument of the model, None when no event files
+        are needed.
+        """
+        return self.log_dir if self.backend in ('wandb', 'tensorboard') else None
+
+    def attach(self, model):
+        """
+        Point the model's logger at the sink. Call before model.learn.
+
+        Parameters
+        ----------
+        model : BaseAlgorithm
+            The model being trained
+        """
+        if self.backend == 'csv':
+            model.set_logger(configure(self.log_dir, ['stdout', 'csv']))
+        elif self.backend == 'none':
+            model.set_logger(configure(None, ['stdout']))
+
+    def callback(self):
+        """
+        Get the callbacks that save checkpoints and, with wandb, gradients.
+
+        Returns
+        -------
+        CallbackList
+            Callbacks to pass to model.learn
+        """
+        callbacks = []
+
+        if self.backend == 'wandb':
+            from wandb.integration.sb3 import WandbCallback
+            callbacks.append(WandbCallback(
+                gradient_save_freq=self.gradient_save_freq,
+                model_save_path=self.checkpoint_dir if self.checkpoint_freq > 0 else None,
+                model_save_freq=self.checkpoint_freq,
+                verbose=2))
+        elif self.checkpoint_freq > 0:
+            callbacks.append(CheckpointCallback(save_freq=self.checkpoint_freq, save_path=self.checkpoint_dir))
+
+        return CallbackList(callbacks)
+
+    def close(self):
+        if self.run is not None:
+            self.run.finish()
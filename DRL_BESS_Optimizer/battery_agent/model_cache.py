@@ -0,0 +1,121 @@
+import os
+import threading
+from collections import OrderedDict
+from stable_baselines3 import DDPG, SAC, TD3, PPO, A2C
+
+ALGORITHMS = {
+    'DDPG': DDPG,
+    'SAC': SAC,
+    'TD3': TD3,
+    'PPO': PPO,
+    'A2C': A2C,
+}
+
+
+class ModelCache:
+    """
+    Keeps loaded models in memory so loading the same saved model again only
+    costs a dictionary lookup.
+
+    Models are looked up by their resolved path, and reloaded when the file
+    has been modified since it was loaded. When more than max_size models
+    are held, the least recently used one is dropped.
+
+    Parameters
+    ----------
+    max_size : int, optional
+        Maximum number of models held
+    warm_up : bool, optional
+        Whether to run one prediction on a newly loaded model, so the first
+        real prediction does not pay for the lazy set up of torch
+    """
+
+    def __init__(self, max_size=8, warm_up=True):
+        self.max_size = max_size
+        self.warm_up = warm_up
+        self.models = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.models)
+
+    def load(self, path, algorithm='DDPG'):
+        """
+        Get a saved model, loading it only if it is not cached or its file
+        has changed.
+
+        Parameters
+        ----------
+        path : str
+            Path of the saved model, with or without the .zip extension
+        algorithm : str or type, optional
+            The algorithm the model was trained with, one of 'DDPG', 'SAC',
+            'TD3', 'PPO' or 'A2C', or its class
+
+        Returns
+        -------
+        BaseAlgorithm
+            The model
+        """
+        if isinstance(algorithm, str):
+            if algorithm not in ALGORITHMS:
+                raise ValueError(f"algorithm must be one of {list(ALGORITHMS)}, got {algorithm}")
+            algorithm = ALGORITHMS[algorithm]
+
+        if not path.endswith(".zip"):
+            path = path + ".zip"
+        path = os.path.realpath(path)
+        mtime = os.stat(path).st_mtime_ns
+        key = (path, algorithm)
+
+        with self.lock:
+            cached = self.models.get(key)
+            if cached is not None and cached[0] == mtime:
+                self.hits += 1
+                self.models.move_to_end(key)
+                return cached[1]
+
+        model = algorithm.load(path)
+        if self.warm_up:
+            model.predict(model.observation_space.sample(), deterministic=True)
+
+        with self.lock:
+            self.misses += 1
+            self.models[key] = (mtime, model)
+            self.models.move_to_end(key)
+            while len(self.models) > self.max_size:
+                self.models.popitem(last=False)
+
+        return model
+
+    def clear(self):
+        with self.lock:
+            self.models.clear()
+            self.hits = 0
+            self.misses = 0
+
+
+# shared by every load_model call in the process
+model_cache = ModelCache()
+
+
+def load_model(model_name, algorithm='DDPG'):
+    """
+    Load a model saved in 'battery_agent/models/' through the process wide
+    model cache.
+
+    Parameters
+    ----------
+    model_name : str
+        The name of the saved model
+    algorithm : str, optional
+        One of 'DDPG', 'SAC', 'TD3', 'PPO' or 'A2C', or its class
+
+    Returns
+    -------
+    BaseAlgorithm
+        The model
+    """
+    return model_cache.load(f"battery_agent/models/{model_name}", algorithm)
@@ -0,0 +1,216 @@
+import time
+import numpy as np
+import scipy.sparse as sp
+from scipy.optimize import linprog
+
+
+class MPCPolicy:
+    """
+    Model predictive dispatch that can stand in for a trained model, e.g.
+    as a fallback when a policy misbehaves:
+
+        policy = MPCPolicy(agent.test_data, 25, 50)
+        agent.test_agent(25, 50, None, model=policy)
+
+    Every settlement period it solves a linear program for the dispatch of
+    the next horizon settlement periods that abates the most carbon, from the
+    battery's charge and daily cycles in the observation, the intensity of
+    the current settlement period and the forecasts of the ones after it. The
+    first action of the plan is taken and the rest is thrown away.
+
+    The constraints only depend on where days start in the horizon, so they
+    are built once per layout and only the costs and limits change between
+    solves, which take a few milliseconds. The rest of each plan is kept and
+    followed if the next solve fails or runs over time_limit.
+
+    predict has to be called once per settlement period in order, starting
+    at start_timestep, as test_agent does. Call reset to start over.
+
+    Parameters
+    ----------
+    ci_data : pd.DataFrame
+        Carbon intensity data with 'settlementPeriod', intensity_column and
+        forecast_column, the same rows the env steps through
+    max_power : float
+        Battery's power capacity
+    max_charge : float
+        Battery's energy capacity
+    horizon : int, optional
+        Number of settlement periods planned for, including the current one
+    num_cycles : int, optional
+        Maximum charge and discharge cycles per day, as in BatteryEnv
+    intensity_column : str, optional
+        The intensity of the current settlement period
+    forecast_column : str, optional
+        The forecast intensity of the later settlement periods
+    start_timestep : int, optional
+        Row of the data of the first call to predict
+    margin : float, optional
+        Fraction of max_charge the plan stays inside the charge and cycle
+        limits by, so float rounding in BatteryEnv never takes it over them
+    time_limit : float, optional
+        Seconds a solve may take before the previous plan is used instead
+    """
+
+    def __init__(self, ci_data, max_power, max_charge, horizon=48, num_cycles=2, intensity_column='nationalIntensity',
+                 forecast_column='forecast', start_timestep=0, margin=1e-6, time_limit=0.05):
+        self.max_power = max_power
+        self.max_charge = max_charge
+        self.horizon = horizon
+        self.num_cycles = num_cycles
+        self.margin = margin
+        self.time_limit = time_limit
+
+        self.intensity = np.asarray(ci_data[intensity_column], dtype=np.float64)
+        self.forecast = np.asarray(ci_data[forecast_column], dtype=np.float64)
+        self.settlement_periods = np.asarray(ci_data['settlementPeriod'])
+
+        self.constraints = {}
+        self.start_timestep = start_timestep
+        self.reset()
+
+    def reset(self, timestep=None):
+        """
+        Start over at timestep, or at start_timestep if it is None.
+        """
+        self.timestep = self.start_timestep if timestep is None else timestep
+        self.plan = np.zeros(0)
+        self.solve_times = []
+        self.n_fallbacks = 0
+
+    def get_constraints(self, settlement_periods):
+        """
+        Build the constraints of a horizon over the variables [energy charged
+        in each SP, energy discharged in each SP], or get them from the cache.
+
+        Parameters
+        ----------
+        settlement_periods : np.array
+            Settlement period of every row of the horizon
+
+        Returns
+        -------
+        sp.csr_matrix, np.array
+            A_ub, and the day of every cycle limit row (0 is the current day)
+        """
+        # day of every row of the horizon, 0 is the current day
+        day = np.cumsum(settlement_periods == 1) - int(settlement_periods[0] == 1)
+        key = (len(settlement_periods), tuple(np.flatnonzero(np.diff(day)) + 1))
+        if key in self.constraints:
+            return self.constraints[key]
+
+        n = len(settlement_periods)
+        cumulative = np.tril(np.ones((n, n)))
+        energy_to_soc = np.hstack([-cumulative, cumulative])
+
+        days = np.unique(day)
+        in_day = (day[None, :] == days[:, None]).astype(np.float64)
+        zeros = np.zeros_like(in_day)
+        cycles = np.vstack([np.hstack([in_day, zeros]), np.hstack([zeros, in_day])])
+
+        A_ub = sp.csr_matrix(np.vstack([energy_to_soc, -energy_to_soc, cycles]))
+        self.constraints[key] = (A_ub, np.concatenate([days, days]))
+        return self.constraints[key]
+
+    def solve(self, timestep, charge, daily_charge, daily_discharge):
+        """
+        Plan the dispatch of the horizon starting at timestep.
+
+        Parameters
+        ----------
+        timestep : int
+            Row of the data of the current settlement period
+        charge : float
+            State of charge, as a fraction of max_charge
+        daily_charge : float
+            Charge cycles of the current day so far
+        daily_discharge : float
+            Discharge cycles of the current day so far
+
+        Returns
+        -------
+        np.array or None
+            Energy out (MWh, negative when charging) of every settlement
+            period of the horizon, or None if the solve failed
+        """
+        end = min(timestep + self.horizon, len(self.settlement_periods))
+        settlement_periods = self.settlement_periods[timestep:end]
+        if settlement_periods[0] == 1:
+            # the env resets the daily cycles before this step
+            daily_charge = daily_discharge = 0.0
+
+        A_ub, cycle_days = self.get_constraints(settlement_periods)
+
+        # the intensity of the current settlement period is known, later ones are forecast
+        intensity = self.forecast[timestep:end].copy()
+        intensity[0] = self.intensity[timestep]
+
+        soc = charge * self.max_charge
+        margin = self.margin * self.max_charge
+        cycle_limit = np.where(cycle_days == 0,
+                               self.num_cycles * self.max_charge - np.repeat([daily_charge, daily_discharge], len(cycle_days) // 2) * self.max_charge,
+                               self.num_cycles * self.max_charge)
+        n = len(intensity)
+        b_ub = np.concatenate([
+            np.full(n, soc - min(margin, max(soc, 0.0))),
+            np.full(n, self.max_charge - soc - min(margin, max(self.max_charge - soc, 0.0))),
+            np.maximum(cycle_limit - margin, 0.0),
+        ])
+
+        result = linprog(np.concatenate([intensity, -intensity]), A_ub=A_ub, b_ub=b_ub,
+                         bounds=(0, self.max_power / 2), method='highs',
+                         options={'time_limit': self.time_limit})
+        if not result.success:
+            return None
+
+        x = np.clip(result.x, 0, self.max_power / 2)
+        return x[n:] - x[:n]
+
+    def predict(self, observation, state=None, episode_start=None, deterministic=True):
+        """
+        Get the action for the current settlement period, like a
+        stable-baselines3 model's predict.
+
+        Parameters
+        ----------
+        observation : np.array or dict
+            BatteryEnv observation of one battery, shape (7,) or (1, 7), or
+            the dict observation of lookback or sp_one_hot, of which only
+            'battery' is used
+        state, episode_start, deterministic : optional
+            Not used, for compatibility with stable-baselines3
+
+        Returns
+        -------
+        np.array, None
+            The normalized action, shaped like the observation's batch, and
+            no state
+        """
+        if isinstance(observation, dict):
+            if 'battery' not in observation:
+                raise ValueError(f"Dict observations need a 'battery' entry, got {list(observation)}")
+            # the charge and daily cycles, in the same places as in the flat observation
+            observation = observation['battery']
+        observation = np.asarray(observation, dtype=np.float64)
+        vectorized = observation.ndim > 1
+        if vectorized and len(observation) != 1:
+            raise ValueError(f"MPCPolicy controls one battery, got {len(observation)} observations")
+        observation = observation.reshape(-1)
+
+        start_time = time.perf_counter()
+        plan = self.solve(self.timestep, observation[0], 2 * observation[-2], 2 * observation[-1])
+        self.solve_times.append(time.perf_counter() - start_time)
+
+        if plan is None:
+            # keep to the previous plan, or wait if it has run out
+            self.n_fallbacks += 1
+            plan = self.plan if len(self.plan) > 0 else np.zeros(1)
+
+        # never leave the charge limits, even when following an old plan
+        soc = observation[0] * self.max_charge
+        energy_out = np.clip(plan[0], soc - self.max_charge, soc)
+        self.plan = plan[1:]
+        self.timestep += 1
+
+        action = np.array([np.clip(energy_out / (self.max_power / 2), -1, 1)], dtype=np.float32)
+        return (action[None] if vectorized else action), None
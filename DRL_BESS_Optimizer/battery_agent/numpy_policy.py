@@ -0,0 +1,173 @@
+import numpy as np
+
+ACTIVATIONS = {
+    'identity': lambda x: x,
+    'relu': lambda x: np.maximum(x, 0, out=x),
+    'tanh': lambda x: np.tanh(x, out=x),
+    'elu': lambda x: np.where(x > 0, x, np.expm1(np.minimum(x, 0))),
+    'leaky_relu': lambda x: np.where(x > 0, x, 0.01 * x),
+    'sigmoid': lambda x: 1 / (1 + np.exp(-x)),
+}
+
+# torch module class name -> activation name
+TORCH_ACTIVATIONS = {
+    'Identity': 'identity',
+    'ReLU': 'relu',
+    'Tanh': 'tanh',
+    'ELU': 'elu',
+    'LeakyReLU': 'leaky_relu',
+    'Sigmoid': 'sigmoid',
+}
+
+
+def get_actor_modules(model):
+    """
+    Get the modules that map an observation to a deterministic action, in
+    the order they are applied, for any of the algorithms BatteryAgent trains.
+
+    Parameters
+    ----------
+    model : BaseAlgorithm
+        A stable-baselines3 model with an MlpPolicy
+
+    Returns
+    -------
+    list
+        The torch modules of the actor
+    """
+    policy = model.policy
+    if hasattr(policy, 'actor') and hasattr(policy.actor, 'mu'):
+        actor = policy.actor
+        if hasattr(actor, 'latent_pi'):
+            # SAC: the deterministic action is the squashed mean
+            return list(actor.latent_pi) + [actor.mu] + ['tanh']
+        # DDPG and TD3
+        return list(actor.mu)
+    if hasattr(policy, 'mlp_extractor'):
+        # PPO and A2C: the deterministic action is the mean of the distribution
+        return list(policy.mlp_extractor.policy_net) + [policy.action_net]
+    raise ValueError(f"Cannot export the policy of {type(model).__name__}")
+
+
+def export_policy(model, save_path, algorithm='DDPG'):
+    """
+    Export the actor MLP of a trained model to a .npz file that NumpyPolicy
+    can run without torch.
+
+    Parameters
+    ----------
+    model : BaseAlgorithm or str
+        A trained model, or the path of a saved model, e.g.
+        "battery_agent/models/DDPG_Best"
+    save_path : str
+        The .npz file to write
+    algorithm : str, optional
+        The algorithm of a saved model, one of 'DDPG', 'SAC', 'TD3', 'PPO'
+        or 'A2C'
+    """
+    if isinstance(model, str):
+        # only exporting needs torch, running the exported policy does not
+        from battery_agent.model_cache import ALGORITHMS
+        if algorithm not in ALGORITHMS:
+            raise ValueError(f"algorithm must be one of {list(ALGORITHMS)}, got {algorithm}")
+        model = ALGORITHMS[algorithm].load(model)
+
+    if len(model.observation_space.shape) != 1:
+        raise ValueError("Only flat Box observations can be exported")
+
+    arrays = {}
+    layers = []
+    for module in get_actor_modules(model):
+        name = module if isinstance(module, str) else type(module).__name__
+        if name == 'Linear':
+            arrays[f"weight_{len(layers)}"] = module.weight.detach().cpu().numpy().T.astype(np.float32)
+            arrays[f"bias_{len(layers)}"] = module.bias.detach().cpu().numpy().astype(np.float32)
+            layers.append('linear')
+        elif name in TORCH_ACTIVATIONS or name in ACTIVATIONS:
+            layers.append(TORCH_ACTIVATIONS.get(name, name))
+        else:
+            raise ValueError(f"Cannot export a {name} layer")
+
+    np.savez_compressed(save_path,
+                        layers=np.array(layers),
+                        action_low=model.action_space.low.astype(np.float32),
+                        action_high=model.action_space.high.astype(np.float32),
+                        squash_output=np.array(model.policy.squash_output),
+                        **arrays)
+
+
+class NumpyPolicy:
+    """
+    Runs an actor MLP exported by export_policy with NumPy only, so
+    deciding an action needs neither torch nor stable-baselines3.
+
+    predict has the same signature as a stable-baselines3 model's, so a
+    NumpyPolicy can be used wherever a model is, e.g. in
+    FleetBatteryEnv.run_policy.
+
+    Parameters
+    ----------
+    path : str
+        The .npz file written by export_policy
+    """
+
+    def __init__(self, path):
+        with np.load(path) as data:
+            self.layers = [str(layer) for layer in data['layers']]
+            self.weights = {i: (data[f"weight_{i}"], data[f"bias_{i}"])
+                            for i, layer in enumerate(self.layers) if layer == 'linear'}
+            self.action_low = data['action_low']
+            self.action_high = data['action_high']
+            self.squash_output = bool(data['squash_output'])
+
+        self.n_inputs = self.weights[0][0].shape[0]
+
+    def forward(self, obs):
+        """
+        Run the MLP on a batch of observations.
+
+        Parameters
+        ----------
+        obs : np.array
+            Observations, shape (n, n_inputs)
+
+        Returns
+        -------
+        np.array
+            Raw outputs of the MLP, shape (n, n_actions)
+        """
+        x = obs
+        for i, layer in enumerate(self.layers):
+            if layer == 'linear':
+                weight, bias = self.weights[i]
+                x = x @ weight
+                x += bias
+            else:
+                x = ACTIVATIONS[layer](x)
+        return x
+
+    def predict(self, obs, state=None, episode_start=None, deterministic=True):
+        """
+        Get the deterministic action for one observation or a batch of them.
+
+        Parameters
+        ----------
+        obs : np.array
+            One observation, shape (n_inputs,), or a batch, shape (n, n_inputs)
+
+        Returns
+        -------
+        np.array, None
+            The actions, shape (n_actions,) or (n, n_actions), and no state
+        """
+        obs = np.asarray(obs, dtype=np.float32)
+        single = obs.ndim == 1
+        actions = self.forward(obs.reshape(-1, self.n_inputs))
+
+        if self.squash_output:
+            # the actor outputs in [-1, 1], rescale to the action space
+            actions = self.action_low + 0.5 * (actions + 1.0) * (self.action_high - self.action_low)
+        else:
+            actions = np.clip(actions, self.action_low, self.action_high)
+
+        return (actions[0] if single else actions), None
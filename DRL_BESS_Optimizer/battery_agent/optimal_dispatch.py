@@ -0,0 +1,271 @@
+import warnings
+import numpy as np
+import scipy.sparse as sp
+from scipy.optimize import linprog
+from battery_agent.episode_scheduler import get_day_starts
+
+
+def daily_constraints(max_charge, initial_soc, num_cycles, margin):
+    """
+    Build the constraints of one day's dispatch problem, over the variables
+    [energy charged in each SP (48), energy discharged in each SP (48)].
+
+    The charge has to stay within [0, max_charge] after every settlement
+    period, and the energy charged and discharged in the day may each be at
+    most num_cycles * max_charge. The day has to end at the charge it
+    started at, so the days are independent of each other.
+
+    Returns
+    -------
+    sp.csr_matrix, np.array, sp.csr_matrix, np.array
+        A_ub, b_ub, A_eq, b_eq of the day
+    """
+    # energy out so far after each SP, i.e. initial charge minus charge, in MWh
+    cumulative = np.tril(np.ones((48, 48)))
+    energy_to_soc = np.hstack([-cumulative, cumulative])
+
+    cycles = np.zeros((2, 96))
+    cycles[0, :48] = 1
+    cycles[1, 48:] = 1
+
+    # stay margin inside the limits, except for the return to initial_soc at the end
+    soc_margin = np.full(48, margin * max_charge)
+    soc_margin[-1] = 0.0
+
+    A_ub = np.vstack([energy_to_soc, -energy_to_soc, cycles])
+    b_ub = np.concatenate([
+        initial_soc * max_charge - soc_margin,
+        (1 - initial_soc) * max_charge - soc_margin,
+        np.full(2, (num_cycles - margin) * max_charge),
+    ])
+
+    A_eq = np.concatenate([-np.ones(48), np.ones(48)])[None, :]
+    b_eq = np.zeros(1)
+
+    return sp.csr_matrix(A_ub), b_ub, sp.csr_matrix(A_eq), b_eq
+
+
+def solve_daily_dispatch(intensity, max_power, max_charge, initial_soc=0.0, num_cycles=2, margin=1e-6, batch_size=128):
+    """
+    Find the dispatch of every day that abates the most carbon, knowing the
+    intensity of every settlement period in advance, by solving one linear
+    program per day. Days (and batteries) are independent, so batch_size of
+    them are stacked into one block diagonal program per solver call.
+
+    The carbon abated by a day is sum(intensity * energy_out): discharging
+    displaces generation at the intensity of that settlement period and
+    charging adds generation at it. Each settlement period can move at most
+    max_power / 2 MWh.
+
+    The charge is modelled in MWh. BatteryEnv changes the charge fraction by
+    action / 2 per settlement period, which is the same only when max_power
+    equals max_charge, so only those schedules can be replayed in the env as
+    actions = energy_out / (max_power / 2). For other batteries a warning says
+    the schedule does not follow the env's dynamics.
+
+    The result is the best energy balanced daily schedule by total carbon.
+    It is not an upper bound on what an agent can score: every day has to
+    end at initial_soc, so moving energy across midnight is left out, and
+    the total carbon is not the carbon abated per MWh discharged that
+    calculate_total_carbon_abated reports, which a schedule with fewer
+    cycles can beat.
+
+    Parameters
+    ----------
+    intensity : np.array
+        Carbon intensity of every settlement period of every day, shape (n_days, 48)
+    max_power : float or np.array
+        Power capacity of the battery of every day
+    max_charge : float or np.array
+        Energy capacity of the battery of every day
+    initial_soc : float, optional
+        State of charge every day starts and ends at, as a fraction of max_charge
+    num_cycles : int, optional
+        Maximum charge and discharge cycles per day
+    margin : float, optional
+        Fraction of max_charge the schedule stays inside the charge and cycle
+        limits by, so float rounding in BatteryEnv never takes it over them
+    batch_size : int, optional
+        Number of days solved per solver call
+
+    Returns
+    -------
+    np.array, np.array
+        Energy out (MWh, negative when charging) and the charge after each
+        settlement period as a fraction of max_charge, shape (n_days, 48)
+    """
+    intensity = np.asarray(intensity, dtype=np.float64).reshape(-1, 48)
+    n_days = len(intensity)
+    max_power = np.broadcast_to(np.asarray(max_power, dtype=np.float64), (n_days,))
+    max_charge = np.broadcast_to(np.asarray(max_charge, dtype=np.float64), (n_days,))
+
+    mismatched = max_power != max_charge
+    if mismatched.any():
+        warnings.warn(f"{mismatched.sum()} days have a battery whose max_power is not its max_charge, e.g. "
+                      f"{max_power[mismatched][0]:g}MW/{max_charge[mismatched][0]:g}MWh. Their dispatch is modelled "
+                      f"in MWh and BatteryEnv would not follow it, as it moves the charge fraction by action / 2.")
+
+    energy_out = np.zeros((n_days, 48))
+    constraints = {}
+
+    for start in range(0, n_days, batch_size):
+        days = np.arange(start, min(start + batch_size, n_days))
+
+        blocks = []
+        for day in days:
+            if max_charge[day] not in constraints:
+                constraints[max_charge[day]] = daily_constraints(max_charge[day], initial_soc, num_cycles, margin)
+            blocks.append(constraints[max_charge[day]])
+
+        # minimise the carbon added by charging minus the carbon displaced by discharging
+        c = np.concatenate([np.concatenate([intensity[day], -intensity[day]]) for day in days])
+        bounds = np.column_stack([np.zeros(96 * len(days)), np.repeat(max_power[days] / 2, 96)])
+
+        result = linprog(c,
+                         A_ub=sp.block_diag([block[0] for block in blocks], format='csr'),
+                         b_ub=np.concatenate([block[1] for block in blocks]),
+                         A_eq=sp.block_diag([block[2] for block in blocks], format='csr'),
+                         b_eq=np.concatenate([block[3] for block in blocks]),
+                         bounds=bounds,
+                         method='highs')
+        if not result.success:
+            raise ValueError(f"The dispatch of days {days[0]} to {days[-1]} could not be solved: {result.message}")
+
+        x = np.clip(result.x.reshape(len(days), 2, 48), 0, (max_power[days] / 2)[:, None, None])
+        energy_out[days] = x[:, 1] - x[:, 0]
+
+    charge = initial_soc - np.cumsum(energy_out, axis=1) / max_charge[:, None]
+    return energy_out, charge
+
+
+def get_day_rows(data):
+    """
+    Get the rows of every complete day in the data.
+
+    Parameters
+    ----------
+    data : pd.DataFrame
+        Data with a 'settlementPeriod' column
+
+    Returns
+    -------
+    np.array
+        Row index of every settlement period of each day, shape (n_days, 48)
+    """
+    return get_day_starts(data['settlementPeriod'])[:, None] + np.arange(48)
+
+
+def dispatch_results(lanes, day_rows, energy_out, charge, initial_soc):
+    """
+    Write the daily dispatch of every lane back into a copy of its data.
+
+    Parameters
+    ----------
+    lanes : list
+        (data, power capacity, energy capacity) of every lane
+    day_rows : list
+        The rows of the days of every lane, from get_day_rows
+    energy_out : np.array
+        Energy out of the days of all lanes in order, shape (n_days, 48)
+    charge : np.array
+        Charge of the days of all lanes in order, shape (n_days, 48)
+    initial_soc : float
+        State of charge outside the days, as a fraction of max_charge
+
+    Returns
+    -------
+    list
+        A new DataFrame per lane with its data and 'energyOut' and 'charge'
+        columns, like the results of test_agent. Rows outside complete days
+        have no dispatch.
+    """
+    results = []
+    start = 0
+    for (data, _, _), rows in zip(lanes, day_rows):
+        end = start + len(rows)
+        lane_energy = np.zeros(len(data))
+        lane_energy[rows] = energy_out[start:end]
+        lane_charge = np.full(len(data), float(initial_soc))
+        lane_charge[rows] = charge[start:end]
+        start = end
+
+        result = data.reset_index(drop=True)
+        result['energyOut'] = lane_energy
+        result['charge'] = lane_charge
+        results.append(result)
+
+    return results
+
+
+def optimal_dispatch_lanes(lanes, initial_soc=0.0, num_cycles=2, intensity_column='nationalIntensity', margin=1e-6, batch_size=128):
+    """
+    Find the perfect foresight dispatch of every lane, see
+    solve_daily_dispatch, with the days of all lanes solved together in
+    batches.
+
+    Parameters
+    ----------
+    lanes : list
+        (data, power capacity, energy capacity) of every lane, like
+        BatteryAgent.test_lanes
+    initial_soc : float, optional
+        State of charge every day starts and ends at, as a fraction of max_charge
+    num_cycles : int, optional
+        Maximum charge and discharge cycles per day
+    intensity_column : str, optional
+        The intensity to abate
+    margin : float, optional
+        See solve_daily_dispatch
+    batch_size : int, optional
+        Number of days solved per solver call
+
+    Returns
+    -------
+    list
+        A new DataFrame per lane with its data and 'energyOut' and 'charge'
+        columns, see dispatch_results
+    """
+    day_rows = [get_day_rows(data) for data, _, _ in lanes]
+    intensity = [np.asarray(data[intensity_column], dtype=np.float64)[rows] for (data, _, _), rows in zip(lanes, day_rows)]
+    max_power = [np.full(len(rows), lane_power, dtype=np.float64) for (_, lane_power, _), rows in zip(lanes, day_rows)]
+    max_charge = [np.full(len(rows), lane_charge, dtype=np.float64) for (_, _, lane_charge), rows in zip(lanes, day_rows)]
+
+    energy_out, charge = solve_daily_dispatch(np.concatenate(intensity), np.concatenate(max_power),
+                                              np.concatenate(max_charge), initial_soc, num_cycles,
+                                              margin, batch_size)
+
+    return dispatch_results(lanes, day_rows, energy_out, charge, initial_soc)
+
+
+def optimal_dispatch(ci_data, max_power, max_charge, initial_soc=0.0, num_cycles=2, intensity_column='nationalIntensity'):
+    """
+    Find the energy balanced daily dispatch that abates the most carbon in
+    total with perfect foresight of the intensities, a baseline to compare
+    agents with on the same data, though not an upper bound on their
+    results, see solve_daily_dispatch. The result can be scored like an
+    agent's:
+
+        full_data = process_test_data(optimal_dispatch(test_data, 25, 50))
+        calculate_total_carbon_abated(full_data)
+
+    Parameters
+    ----------
+    ci_data : pd.DataFrame
+        Carbon intensity data with 'settlementPeriod' and intensity_column
+    max_power : float
+        Battery's power capacity
+    max_charge : float
+        Battery's energy capacity
+    initial_soc : float, optional
+        State of charge every day starts and ends at, as a fraction of max_charge
+    num_cycles : int, optional
+        Maximum charge and discharge cycles per day
+    intensity_column : str, optional
+        The intensity to abate
+
+    Returns
+    -------
+    pd.DataFrame
+        A new DataFrame with the data and 'energyOut' and 'charge' columns
+    """
+    return optimal_dispatch_lanes([(ci_data, max_power, max_charge)], initial_soc, num_cycles, intensity_column)[0]
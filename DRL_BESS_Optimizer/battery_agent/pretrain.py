@@ -0,0 +1,124 @@
+import numpy as np
+import torch as th
+from stable_baselines3 import SAC
+from battery_agent.dynamic_dispatch import dp_dispatch
+from battery_agent.replay_prefill import pn_transitions
+
+
+def dispatch_transitions(ci_data, max_power, max_charge, mean_ci, std_dev_ci, objective='reward', n_levels=16):
+    """
+    Label the training data with the best actions found offline, as
+    BatteryEnv transitions to clone or to prefill a replay buffer with.
+
+    The dispatch is planned in BatteryEnv's own charge dynamics for either
+    objective, so the env never penalizes the labels, also when max_power
+    differs from max_charge.
+
+    Parameters
+    ----------
+    ci_data : pd.DataFrame
+        The training data
+    max_power : float
+        Battery's power capacity
+    max_charge : float
+        Battery's energy capacity
+    mean_ci : float
+        Mean value of training carbon intensity data for normalization.
+    std_dev_ci : float
+        Standard deviation of training carbon intensity data for normalization.
+    objective : str, optional
+        'reward' or 'carbon', see dp_dispatch
+    n_levels : int, optional
+        Number of steps of the state of charge grid, see dp_dispatch
+
+    Returns
+    -------
+    dict
+        Transitions of the best dispatch, see pn_transitions
+    """
+    dispatch = dp_dispatch(ci_data, max_power, max_charge, objective, mean_ci, std_dev_ci, n_levels=n_levels,
+                           env_dynamics=True)
+    return pn_transitions(dispatch['energyOut'].to_numpy(), ci_data, max_power, max_charge, mean_ci, std_dev_ci)
+
+
+def policy_actions(model, obs):
+    """
+    The deterministic actions of a model's policy as a differentiable
+    tensor, scaled to [-1, 1] like the actions in its replay buffer.
+    """
+    if isinstance(model, SAC):
+        return model.actor(obs, deterministic=True)
+    if hasattr(model, 'actor'):
+        # DDPG and TD3
+        return model.actor(obs)
+    # PPO and A2C
+    return model.policy.get_distribution(obs).mode()
+
+
+def pretrain_policy(model, transitions, epochs=20, batch_size=256, learning_rate=1e-3, seed=0, verbose=1):
+    """
+    Fit the policy of a stable-baselines3 model to labelled actions by
+    minibatch supervised learning (behaviour cloning), so reinforcement
+    learning starts from a policy that already dispatches well instead of
+    from random weights.
+
+    Only the actor is trained. The target actor of DDPG and TD3 is set to the
+    pretrained one. The critic still starts from scratch, prefilling the
+    replay buffer with the same transitions (see prefill_replay_buffer)
+    gives it something to learn from before the first rollouts.
+
+    Parameters
+    ----------
+    model : BaseAlgorithm
+        The model to pretrain, with flat observations
+    transitions : dict
+        Transitions with 'obs' and 'action', e.g. from dispatch_transitions
+    epochs : int, optional
+        Number of passes over the transitions
+    batch_size : int, optional
+        Number of transitions per gradient step
+    learning_rate : float, optional
+        Learning rate of the Adam optimizer
+    seed : int, optional
+        Seed of the minibatch order
+    verbose : int, optional
+        0 is silent, 1 prints the loss of every epoch
+
+    Returns
+    -------
+    list
+        Mean squared error of the actions in every epoch
+    """
+    obs, _ = model.policy.obs_to_tensor(np.asarray(transitions['obs'], dtype=np.float32))
+    actions = th.as_tensor(model.policy.scale_action(np.asarray(transitions['action'], dtype=np.float32)),
+                           device=model.device)
+    if len(actions) == 0:
+        raise ValueError("There are no transitions to pretrain on")
+
+    actor = model.actor if hasattr(model, 'actor') else model.policy
+    actor.set_training_mode(True)
+    optimizer = th.optim.Adam(actor.parameters(), lr=learning_rate)
+    rng = np.random.default_rng(seed)
+
+    losses = []
+    for epoch in range(epochs):
+        order = th.as_tensor(rng.permutation(len(actions)), device=model.device)
+        epoch_loss = 0.0
+        for start in range(0, len(actions), batch_size):
+            batch = order[start:start + batch_size]
+            loss = th.nn.functional.mse_loss(policy_actions(model, obs[batch]), actions[batch])
+
+            optimizer.zero_grad()
+            loss.backward()
+            optimizer.step()
+            epoch_loss += loss.item() * len(batch)
+
+        losses.append(epoch_loss / len(actions))
+        if verbose > 0:
+            print(f"pretraining epoch {epoch + 1}/{epochs}: action mse {losses[-1]:.4f}")
+
+    actor.set_training_mode(False)
+    if hasattr(model, 'actor_target'):
+        model.actor_target.load_state_dict(model.actor.state_dict())
+
+    return losses
@@ -0,0 +1,178 @@
+import numpy as np
+import pandas as pd
+from gymnasium import spaces
+from battery_agent.battery_env import build_feature_matrix
+from battery_agent.episode_scheduler import get_day_starts
+from battery_agent.rollout import rollout
+
+
+def pn_energy_per_period(pn_data, ci_data, time_column='from'):
+    """
+    Sum the energy out of a battery's physical notifications into the
+    settlement periods of the carbon intensity data.
+
+    Parameters
+    ----------
+    pn_data : pd.DataFrame
+        Physical notifications of one BMU after
+        BmrsApiAccessor.process_pn_data, with 'timeFrom' and 'energyOut'
+    ci_data : pd.DataFrame
+        Carbon intensity data with the start time of every settlement period
+        in time_column
+    time_column : str, optional
+        The start time column of ci_data
+
+    Returns
+    -------
+    np.array
+        Energy out (MWh, negative when charging) in every row of ci_data, NaN
+        where there are no physical notifications
+    """
+    period_start = pd.to_datetime(pn_data['timeFrom'], utc=True).dt.floor('30min')
+    energy = pd.Series(np.asarray(pn_data['energyOut'], dtype=np.float64), index=period_start.to_numpy())
+    energy = energy.groupby(level=0).sum()
+
+    ci_start = pd.to_datetime(ci_data[time_column], utc=True)
+    return energy.reindex(ci_start.to_numpy()).to_numpy()
+
+
+def pn_transitions(energy_out, ci_data, max_power, max_charge, mean_ci, std_dev_ci):
+    """
+    Turn a battery's half-hourly energy out into the transitions BatteryEnv
+    would have given for it, one episode per day, to learn from offline.
+
+    The actions are the energy out normalized by max_power / 2 and clipped
+    to [-1, 1]. The physical notifications do not say how charged the
+    battery was, so every day starts at the lowest charge that keeps the
+    day within BatteryEnv's bounds. Every day is then scored with rollout,
+    so the rewards, done flags and any penalties are the env's. Days with a
+    missing settlement period, or without a row after them, are left out.
+
+    Parameters
+    ----------
+    energy_out : np.array
+        Energy out (MWh, negative when charging) in every row of ci_data,
+        e.g. from pn_energy_per_period
+    ci_data : pd.DataFrame
+        Carbon intensity data, with the same columns as the training data
+    max_power : float
+        Battery's power capacity
+    max_charge : float
+        Battery's energy capacity
+    mean_ci : float
+        Mean value of training carbon intensity data for normalization.
+    std_dev_ci : float
+        Standard deviation of training carbon intensity data for normalization.
+
+    Returns
+    -------
+    dict
+        Arrays with one row per transition: 'obs', 'action', 'reward',
+        'next_obs' and 'done'
+    """
+    energy_out = np.asarray(energy_out, dtype=np.float64)
+    features = build_feature_matrix(ci_data, mean_ci, std_dev_ci)
+    settlement_periods = np.asarray(ci_data['settlementPeriod'])
+
+    day_starts = get_day_starts(settlement_periods)
+    day_starts = day_starts[day_starts + 48 < len(settlement_periods)]
+    day_rows = day_starts[:, None] + np.arange(48)
+    day_starts = day_starts[~np.isnan(energy_out[day_rows]).any(axis=1)]
+
+    observations, actions, rewards, next_observations, dones = [], [], [], [], []
+    for start in day_starts:
+        rows = start + np.arange(48)
+        action = np.clip(energy_out[rows] / (max_power / 2), -1, 1).astype(np.float32).astype(np.float64)
+        energy = action * max_power / 2
+
+        # BatteryEnv checks the charge before each action and moves it by action / 2
+        charge_before = np.concatenate(([0.0], np.cumsum(action[:-1]) / 2))
+        charge = float(np.clip(np.max(charge_before + energy / max_charge), 0, 1))
+
+        trace = rollout(action, charge, max_power, max_charge, 0, features, settlement_periods, start_timestep=start)
+
+        # the observation before each step, with the counters reset after every episode end
+        episode_start = np.concatenate(([True], trace['done'][:-1]))
+        obs = np.empty((48, features.shape[1] + 3), dtype=np.float32)
+        obs[:, 0] = np.concatenate(([charge], trace['charge'][:-1]))
+        obs[:, 1:-2] = features[rows]
+        obs[:, -2] = np.where(episode_start, 0.0, np.concatenate(([0.0], trace['daily_charge'][:-1])) / 2)
+        obs[:, -1] = np.where(episode_start, 0.0, np.concatenate(([0.0], trace['daily_discharge'][:-1])) / 2)
+
+        next_obs = np.empty_like(obs)
+        next_obs[:, 0] = trace['charge']
+        next_obs[:, 1:-2] = features[rows + 1]
+        next_obs[:, -2] = trace['daily_charge'] / 2
+        next_obs[:, -1] = trace['daily_discharge'] / 2
+
+        observations.append(obs)
+        actions.append(action.astype(np.float32)[:, None])
+        rewards.append(trace['reward'])
+        next_observations.append(next_obs)
+        dones.append(trace['done'])
+
+    n_features = features.shape[1] + 3
+    return {
+        'obs': np.concatenate(observations) if observations else np.zeros((0, n_features), dtype=np.float32),
+        'action': np.concatenate(actions) if actions else np.zeros((0, 1), dtype=np.float32),
+        'reward': np.concatenate(rewards) if rewards else np.zeros(0),
+        'next_obs': np.concatenate(next_observations) if next_observations else np.zeros((0, n_features), dtype=np.float32),
+        'done': np.concatenate(dones) if dones else np.zeros(0, dtype=bool),
+    }
+
+
+def prefill_replay_buffer(model, transitions):
+    """
+    Write transitions into the replay buffer of an off-policy model (DDPG,
+    TD3 or SAC) in bulk, e.g. before model.learn so it starts from real
+    battery trajectories. When there are more transitions than fit, the
+    last ones are kept.
+
+    With n_envs environments every buffer row holds n_envs transitions, so
+    the transitions that do not fill a whole row are left out.
+
+    Parameters
+    ----------
+    model : OffPolicyAlgorithm
+        The model, with a replay buffer of flat observations
+    transitions : dict
+        Transitions from pn_transitions
+
+    Returns
+    -------
+    int
+        Number of transitions written
+    """
+    buffer = getattr(model, 'replay_buffer', None)
+    if buffer is None:
+        raise ValueError("Only off-policy models (DDPG, TD3, SAC) have a replay buffer to prefill")
+    if not isinstance(buffer.observation_space, spaces.Box):
+        raise ValueError("Prefilling needs flat observations, not the dict observations of lookback or sp_one_hot")
+    if buffer.optimize_memory_usage:
+        raise ValueError("Prefilling a replay buffer with optimize_memory_usage is not supported")
+
+    n_envs = buffer.n_envs
+    n_rows = min(len(transitions['action']) // n_envs, buffer.buffer_size)
+    if n_rows == 0:
+        return 0
+    # the last n_rows * n_envs transitions
+    keep = slice(len(transitions['action']) - n_rows * n_envs, len(transitions['action']))
+
+    def rows_of(name):
+        values = np.asarray(transitions[name])[keep]
+        return values.reshape(n_rows, n_envs, *values.shape[1:])
+
+    rows = (buffer.pos + np.arange(n_rows)) % buffer.buffer_size
+    buffer.observations[rows] = rows_of('obs')
+    buffer.next_observations[rows] = rows_of('next_obs')
+    # the buffer holds actions scaled to [-1, 1], like OffPolicyAlgorithm._store_transition
+    buffer.actions[rows] = model.policy.scale_action(rows_of('action'))
+    buffer.rewards[rows] = rows_of('reward')
+    buffer.dones[rows] = rows_of('done')
+    if buffer.handle_timeout_termination:
+        buffer.timeouts[rows] = False
+
+    buffer.full = buffer.full or buffer.pos + n_rows >= buffer.buffer_size
+    buffer.pos = int((buffer.pos + n_rows) % buffer.buffer_size)
+
+    return n_rows * n_envs
@@ -0,0 +1,243 @@
+import numpy as np
+from battery_agent.battery_env import build_feature_matrix, build_reward_tables, cycles_reward
+
+
+def rollout(actions, charge, max_power, max_charge, min_charge, features, settlement_periods,
+            start_timestep=0, num_cycles=2, penalty=-50):
+    """
+    Score a whole sequence of normalized actions with the BatteryEnv rules,
+    without stepping the env.
+
+    The result is the same as calling BatteryEnv.reset() and then
+    BatteryEnv.step() for every action, resetting the env whenever an
+    episode ends, as BatteryAgent.test_agent does. The state of charge and
+    daily cycle counters are computed with cumulative sums over windows of
+    whole days, and a window is only cut short at the first out of bounds or
+    cycle limit penalty, since that is the only thing that changes the
+    trajectory after it. Sums are accumulated in the same order as the env so
+    the results match it exactly.
+
+    Parameters
+    ----------
+    actions : np.array
+        Normalized actions ranging from -1 to 1, one per timestep.
+    charge : float
+        State of charge of the battery before the first action, as a fraction
+        of max_charge.
+    max_power : float
+        The maximum power output of the battery (power capacity).
+    max_charge : float
+        The maximum charge level of the battery (energy capacity)
+    min_charge : float
+        The minimum charge level of the battery (0)
+    features : np.array
+        Normalized feature matrix of the data, from build_feature_matrix
+    settlement_periods : np.array
+        Settlement period of every row of the data
+    start_timestep : int, optional
+        Row of the data the first action is taken at.
+    num_cycles : int, optional
+        Maximum charge and discharge cycles per day.
+    penalty : float, optional
+        Reward given when an action is out of bounds or exceeds the cycle limit.
+
+    Returns
+    -------
+    dict
+        Arrays with one value per action: 'timestep', 'energy_out' (MWh
+        actually discharged, negative when charging), 'charge' (state of
+        charge after the action), 'reward', 'done', 'penalized', and the
+        'daily_charge' and 'daily_discharge' cycle counters after the action.
+    """
+    actions = np.asarray(actions, dtype=np.float64).reshape(-1)
+    n = len(actions)
+    timesteps = start_timestep + np.arange(n)
+
+    if start_timestep + n >= len(settlement_periods):
+        raise ValueError("The actions run past the end of the data, BatteryEnv needs one more row after the last action")
+
+    charge_coefficients, discharge_coefficients = build_reward_tables(features[timesteps])
+    sp = np.asarray(settlement_periods)[timesteps]
+
+    # un_normalize action for 0.5 hrs
+    energy_out = actions * max_power / 2
+    action_cycles = energy_out / max_charge
+    discharging = energy_out > 0
+    half_actions = actions / 2
+
+    # the reward only depends on the action and the timestep until a penalty is hit
+    step_reward = np.where(discharging, discharge_coefficients, charge_coefficients) * np.abs(energy_out)
+
+    discharge_cycles = np.where(discharging, action_cycles, 0.0)
+    charge_cycles = np.where(discharging, 0.0, -action_cycles)
+
+    out_energy = energy_out.copy()
+    out_charge = np.empty(n)
+    out_reward = np.empty(n)
+    out_done = sp == 48
+    out_penalized = np.zeros(n, dtype=bool)
+    out_daily_charge = np.empty(n)
+    out_daily_discharge = np.empty(n)
+
+    pos = 0
+    charge = float(charge)
+    episode_start = True
+    daily_charge = 0.0
+    daily_discharge = 0.0
+    window_days = 1
+
+    while pos < n:
+        end = min(n, pos + 48 * window_days)
+        length = end - pos
+
+        # the cycle counters reset at the start of every day and every episode
+        segment_start = sp[pos:end] == 1
+        segment_start[1:] |= sp[pos:end - 1] == 48
+        if not episode_start and not segment_start[0]:
+            carry_charge, carry_discharge = daily_charge, daily_discharge
+        else:
+            carry_charge, carry_discharge = 0.0, 0.0
+        segment_start[0] = True
+
+        segment = np.cumsum(segment_start) - 1
+        offset = np.arange(length) - np.flatnonzero(segment_start)[segment]
+        grid_shape = (segment[-1] + 1, offset.max() + 2)
+
+        # one row per day, accumulated left to right like the env does
+        charge_grid = np.zeros(grid_shape)
+        charge_grid[0, 0] = carry_charge
+        charge_grid[segment, offset + 1] = charge_cycles[pos:end]
+        charge_grid = np.cumsum(charge_grid, axis=1)
+
+        discharge_grid = np.zeros(grid_shape)
+        discharge_grid[0, 0] = carry_discharge
+        discharge_grid[segment, offset + 1] = discharge_cycles[pos:end]
+        discharge_grid = np.cumsum(discharge_grid, axis=1)
+
+        daily_charge_after = charge_grid[segment, offset + 1]
+        daily_discharge_after = discharge_grid[segment, offset + 1]
+
+        charges = np.subtract.accumulate(np.concatenate(([charge], half_actions[pos:end])))
+        # the env checks the bounds against the float32 charge in its observation
+        charge_mwh = charges[:-1].astype(np.float32).astype(np.float64) * max_charge
+
+        window_energy = energy_out[pos:end]
+        above_max = charge_mwh - window_energy > max_charge
+        below_min = ~above_max & (charge_mwh - window_energy < min_charge)
+        in_bounds = ~(above_max | below_min)
+        window_discharging = discharging[pos:end]
+        over_cycles = in_bounds & ((window_discharging & (daily_discharge_after > num_cycles))
+                                   | (~window_discharging & (daily_charge_after > num_cycles)))
+        penalized = ~in_bounds | over_cycles
+
+        violation = np.argmax(penalized) if penalized.any() else length
+        valid = slice(pos, pos + violation)
+
+        out_charge[valid] = charges[1:violation + 1]
+        out_daily_charge[valid] = daily_charge_after[:violation]
+        out_daily_discharge[valid] = daily_discharge_after[:violation]
+        out_reward[valid] = np.where(out_done[valid],
+                                     step_reward[valid] + cycles_reward(daily_charge_after[:violation]) + cycles_reward(daily_discharge_after[:violation]),
+                                     step_reward[valid])
+
+        if violation < length:
+            k = pos + violation
+            out_reward[k] = penalty
+            out_done[k] = True
+            out_penalized[k] = True
+
+            if over_cycles[violation]:
+                out_energy[k] = 0.0
+                out_charge[k] = charges[violation]
+                out_daily_charge[k] = daily_charge_after[violation]
+                out_daily_discharge[k] = daily_discharge_after[violation]
+            else:
+                # counters are not updated when the charge goes out of bounds
+                out_daily_charge[k] = charge_grid[segment[violation], offset[violation]]
+                out_daily_discharge[k] = discharge_grid[segment[violation], offset[violation]]
+                if above_max[violation]:
+                    out_energy[k] = charge_mwh[violation] - max_charge
+                    out_charge[k] = 1.0
+                else:
+                    out_energy[k] = charge_mwh[violation] - min_charge
+                    out_charge[k] = 0.0
+
+            charge = out_charge[k]
+            pos = k + 1
+            episode_start = True
+            window_days = 1
+        else:
+            charge = charges[-1]
+            daily_charge = daily_charge_after[-1]
+            daily_discharge = daily_discharge_after[-1]
+            episode_start = bool(out_done[end - 1])
+            pos = end
+            window_days = min(window_days * 2, 64)
+
+    return {
+        'timestep': timesteps,
+        'energy_out': out_energy,
+        'charge': out_charge,
+        'reward': out_reward,
+        'done': out_done,
+        'penalized': out_penalized,
+        'daily_charge': out_daily_charge,
+        'daily_discharge': out_daily_discharge,
+    }
+
+
+def rollout_actions(actions, initial_charge, max_power, max_charge, min_charge, ci_data, mean_ci, std_dev_ci, start_timestep=0):
+    """
+    Score a sequence of normalized actions for a battery with the same
+    parameters as BatteryEnv.
+
+    Parameters
+    ----------
+    actions : np.array
+        Normalized actions ranging from -1 to 1, one per timestep.
+    initial_charge : float
+        The initial state of charge of the battery.
+    max_power : float
+        The maximum power output of the battery (power capacity).
+    max_charge : float
+        The maximum charge level of the battery (energy capacity)
+    min_charge : float
+        The minimum charge level of the battery (0)
+    ci_data : dict
+        Dictionary containing data related to carbon intensity
+    mean_ci : float
+        Mean value of training carbon intensity data for normalization.
+    std_dev_ci : float
+        Standard deviation of training carbon intensity data for normalization.
+    start_timestep : int, optional
+        Row of ci_data the first action is taken at.
+
+    Returns
+    -------
+    dict
+        The trajectory arrays, see rollout
+    """
+    features = build_feature_matrix(ci_data, mean_ci, std_dev_ci)
+    return rollout(actions, initial_charge / max_charge, max_power, max_charge, min_charge, features,
+                   np.asarray(ci_data['settlementPeriod']), start_timestep)
+
+
+def rollout_env(env, actions):
+    """
+    Score a sequence of normalized actions starting from the current timestep
+    and state of charge of a BatteryEnv, without changing the env.
+
+    Parameters
+    ----------
+    env : BatteryEnv
+        The env whose parameters and data are used
+    actions : np.array
+        Normalized actions ranging from -1 to 1, one per timestep.
+
+    Returns
+    -------
+    dict
+        The trajectory arrays, see rollout
+    """
+    return rollout(actions, env.charge, env.max_power, env.max_charge, env.min_charge, env.features,
+                   env.settlement_periods, env.current_timestep, env.num_cycles, env.penalty)
@@ -34,3 +34,27 @@ plot_energy_over_time(test_results)
 full_data = process_test_data(test_results)
 result = calculate_total_carbon_abated(full_data)
 print(result)
+
+# test every model on every period and battery size on all cores
+# from battery_agent.evaluation import evaluate_matrix
+# periods = {'year': test_data_1_year, 'q1': test_data_q1, 'q2': test_data_q2, 'q4': test_data_q4}
+# sizes = [(25, 28), (50, 50), (25, 50), (14, 30), (33, 50), (10, 10)]
+# matrix = evaluate_matrix([model_name], periods, sizes, train_data, save_file="battery_agent/outputs/evaluation_matrix.csv")
+
+# dispatch with model predictive control on the forecasts instead of a trained model
+# from battery_agent.mpc_policy import MPCPolicy
+# test_results, daily_charge, daily_discharge = agent.test_agent(25, 50, None, model=MPCPolicy(agent.test_data, 25, 50))
+
+# start an off-policy agent from the real trajectories of a GB battery in the BMRS physical notifications
+# from carbon_abatement_api.bmrs_api_accessor import BmrsApiAccessor
+# from carbon_abatement_api.config import PN_STREAM_ENDPOINT
+# from battery_agent.replay_prefill import pn_energy_per_period, pn_transitions
+# bmrs = BmrsApiAccessor()
+# pn_data = bmrs.process_pn_data(bmrs.get_pn_stream_data(PN_STREAM_ENDPOINT, "2022-01-01", "2022-08-15", bm_unit=["E_ARNKB-1"]), "2022-01-01", "2022-08-15")
+# prefill = pn_transitions(pn_energy_per_period(pn_data, train_data), train_data, 25, 50, agent.mean_ci, agent.std_dev_ci)
+# agent.train_agent(25, 50, model_name, prefill=prefill)
+
+# warm start the actor by cloning the best dispatch of the training data before training
+# from battery_agent.pretrain import dispatch_transitions
+# labels = dispatch_transitions(train_data, 25, 50, agent.mean_ci, agent.std_dev_ci)
+# agent.train_agent(25, 50, model_name, pretrain=labels, prefill=labels)
@@ -0,0 +1,365 @@
+import itertools
+import math
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+import torch as th
+from battery_agent.model_cache import ALGORITHMS
+from battery_agent.validation import evaluate_model, validation_score
+
+SEARCH_MODES = ['grid', 'random', 'halving']
+
+# set in every worker process by init_worker
+worker_agent = None
+
+
+def grid_search_space(space):
+    """
+    Get every combination of the values of a search space.
+
+    Parameters
+    ----------
+    space : dict
+        List of values to try for every hyperparameter,
+        e.g. {'gamma': [0.9, 0.95], 'net_arch': [[64, 64], [256, 256]]}
+
+    Returns
+    -------
+    list
+        The hyperparameters of every trial
+    """
+    for name, values in space.items():
+        if not isinstance(values, list):
+            raise ValueError(f"grid search needs a list of values for {name}, got {values}")
+
+    names = list(space)
+    return [dict(zip(names, values)) for values in itertools.product(*space.values())]
+
+
+def sample_search_space(space, n_trials, seed=None):
+    """
+    Draw random hyperparameters from a search space.
+
+    A list is a set of values to choose from, a (low, high) tuple a uniform
+    range and a (low, high, 'log') tuple a log-uniform range. Ranges with
+    int bounds give ints.
+
+    Parameters
+    ----------
+    space : dict
+        Values or range of every hyperparameter,
+        e.g. {'learning_rate': (1e-4, 1e-2, 'log'), 'batch_size': [64, 256]}
+    n_trials : int
+        Number of trials to draw
+    seed : int, optional
+        Seed of the random number generator
+
+    Returns
+    -------
+    list
+        The hyperparameters of every trial
+    """
+    rng = np.random.default_rng(seed)
+    trials = []
+    for _ in range(n_trials):
+        params = {}
+        for name, values in space.items():
+            if isinstance(values, list):
+                params[name] = values[rng.integers(len(values))]
+            elif isinstance(values, tuple):
+                low, high = values[0], values[1]
+                if len(values) > 2 and values[2] == 'log':
+                    value = math.exp(rng.uniform(math.log(low), math.log(high)))
+                else:
+                    value = rng.uniform(low, high)
+                params[name] = int(round(value)) if isinstance(low, int) and isinstance(high, int) else float(value)
+            else:
+                params[name] = values
+        trials.append(params)
+    return trials
+
+
+def init_worker(agent, n_threads):
+    """
+    Set up a sweep worker process: pin its thread count so parallel trials
+    do not oversubscribe the cores, and keep the agent for its trials.
+    """
+    global worker_agent
+    # torch is already imported here, so thread variables such as
+    # OMP_NUM_THREADS would have no effect, set its thread pools directly
+    th.set_num_threads(n_threads)
+    try:
+        th.set_num_interop_threads(n_threads)
+    except RuntimeError:
+        # a forked worker inherits a parent whose inter-op pool has already started
+        pass
+    worker_agent = agent
+
+
+def run_trial_rung(trial, settings):
+    """
+    Train a trial up to the timesteps of its next rung, continuing from its
+    last saved model, then score it on the validation slice. Runs in a
+    worker process.
+
+    The replay buffer of an off-policy trial is only saved, and reloaded at
+    its next rung, with the 'save_replay_buffers' setting. Otherwise the
+    next rung starts with an empty buffer.
+
+    Parameters
+    ----------
+    trial : dict
+        'trial' id, 'params', 'rung' and the cumulative 'timesteps' to train to
+    settings : dict
+        The settings of the sweep, see Sweep.settings
+
+    Returns
+    -------
+    dict
+        The row of the trial in the results table
+    """
+    agent = worker_agent
+    start_time = time.perf_counter()
+
+    model_path = os.path.join(settings['sweep_dir'], f"trial_{trial['trial']:04d}")
+    buffer_path = model_path + "_replay_buffer"
+    seed = settings['seed'] + trial['trial']
+
+    env = agent.make_vec_env(settings['max_power'], settings['max_charge'], settings['n_envs'],
+                             vec_env=settings['vec_env'], seed=seed + 1000 * trial['rung'])
+
+    if os.path.exists(model_path + ".zip"):
+        model = ALGORITHMS[settings['algorithm']].load(model_path, env=env)
+        if settings['save_replay_buffers'] and os.path.exists(buffer_path + ".pkl"):
+            model.load_replay_buffer(buffer_path)
+    else:
+        model = agent.make_model(settings['algorithm'], env, hyperparams=trial['params'], seed=seed, verbose=0)
+
+    model.learn(total_timesteps=trial['timesteps'] - model.num_timesteps, reset_num_timesteps=False)
+    model.save(model_path)
+    if settings['save_replay_buffers'] and getattr(model, 'replay_buffer', None) is not None:
+        model.save_replay_buffer(buffer_path)
+    env.close()
+
+    results = evaluate_model(model, settings['sizes'], settings['val_data'], agent.mean_ci, agent.std_dev_ci)
+
+    return {
+        'trial': trial['trial'],
+        'rung': trial['rung'],
+        'timesteps': model.num_timesteps,
+        'score': validation_score(results),
+        'train_time': time.perf_counter() - start_time,
+        **{name: str(value) if isinstance(value, (list, tuple)) else value
+           for name, value in trial['params'].items()},
+    }
+
+
+class Sweep:
+    """
+    Local hyperparameter sweep that trains trials in parallel processes and
+    prunes them on a validation slice.
+
+    Trials are trained in rungs. After every rung each remaining trial is
+    scored by the carbon its greedy policy abates on the validation slice,
+    and the weak ones are stopped:
+
+    - 'grid' and 'random' give every trial the same budget split into
+      n_rungs equal rungs, and prune the trials scoring below the median
+      of a rung.
+    - 'halving' (successive halving) starts every trial on a small budget
+      and only keeps the best 1/eta of the trials at each rung, growing the
+      budget by eta each time.
+
+    Every rung of every trial is appended to results.csv in sweep_dir, so
+    the whole sweep ends up in one table.
+
+    Parameters
+    ----------
+    agent : BatteryAgent
+        The agent whose training data is used
+    space : dict
+        The search space, see grid_search_space and sample_search_space
+    val_data : pd.DataFrame
+        The validation slice of the carbon intensity data
+    mode : str, optional
+        One of 'grid', 'random' or 'halving'
+    n_trials : int, optional
+        Number of trials drawn in 'random' and 'halving' modes
+    budget : int, optional
+        Timesteps the trials that are never pruned are trained for
+    n_rungs : int, optional
+        Number of times the trials are scored
+    eta : int, optional
+        Fraction of trials kept (1/eta) and budget growth per rung in
+        'halving' mode
+    algorithm : str, optional
+        One of 'DDPG', 'SAC', 'TD3', 'PPO' or 'A2C'
+    max_power : float, optional
+        Battery's power capacity while training
+    max_charge : float, optional
+        Battery's energy capacity while training
+    sizes : list, optional
+        (power capacity, energy capacity) of the batteries to validate on.
+        Defaults to the training size.
+    n_envs : int, optional
+        Number of envs each trial trains on
+    vec_env : str, optional
+        'dummy' or 'batched', see BatteryAgent.make_vec_env
+    n_workers : int, optional
+        Number of trials trained at once. Defaults to as many as fit on the
+        cores with threads_per_trial threads each.
+    threads_per_trial : int, optional
+        Number of threads torch may use in each trial
+    prune : bool, optional
+        Whether to prune trials in 'grid' and 'random' modes
+    save_replay_buffers : bool, optional
+        Whether to save the replay buffers of off-policy trials after every
+        rung so the next rung continues with them. They can be large, so by
+        default every rung starts with an empty buffer.
+    sweep_dir : str, optional
+        Directory the models and results table are saved to
+    seed : int, optional
+        Seed of the sampled trials and of the models
+    verbose : int, optional
+        0 is silent, 1 prints the score and status of every trial at every
+        rung
+    """
+
+    def __init__(self, agent, space, val_data, mode='random', n_trials=8, budget=50000, n_rungs=3, eta=3,
+                 algorithm='DDPG', max_power=25, max_charge=50, sizes=None, n_envs=1, vec_env='batched',
+                 n_workers=None, threads_per_trial=1, prune=True, save_replay_buffers=False, sweep_dir="battery_agent/sweeps", seed=42,
+                 verbose=1):
+        if mode not in SEARCH_MODES:
+            raise ValueError(f"mode must be one of {SEARCH_MODES}, got {mode}")
+        if algorithm not in ALGORITHMS:
+            raise ValueError(f"algorithm must be one of {list(ALGORITHMS)}, got {algorithm}")
+        if vec_env == 'subprocess':
+            raise ValueError("trials already run in their own processes, use the 'dummy' or 'batched' vec_env")
+
+        self.agent = agent
+        self.mode = mode
+        self.budget = budget
+        self.n_rungs = n_rungs
+        self.eta = eta
+        self.prune = prune
+        self.threads_per_trial = threads_per_trial
+        self.n_workers = n_workers or max(1, (os.cpu_count() or 1) // threads_per_trial)
+        self.sweep_dir = sweep_dir
+        self.verbose = verbose
+        self.results_path = os.path.join(sweep_dir, "results.csv")
+
+        if mode == 'grid':
+            self.trials = grid_search_space(space)
+        else:
+            self.trials = sample_search_space(space, n_trials, seed)
+
+        self.settings = {
+            'algorithm': algorithm,
+            'max_power': max_power,
+            'max_charge': max_charge,
+            'sizes': sizes if sizes is not None else [(max_power, max_charge)],
+            'n_envs': n_envs,
+            'vec_env': vec_env,
+            'val_data': val_data,
+            'sweep_dir': sweep_dir,
+            'save_replay_buffers': save_replay_buffers,
+            'seed': seed,
+        }
+
+        os.makedirs(sweep_dir, exist_ok=True)
+
+    def rung_timesteps(self, rung):
+        """
+        Get the cumulative timesteps every trial is trained to by a rung.
+        """
+        if self.mode == 'halving':
+            return max(1, int(self.budget / self.eta ** (self.n_rungs - 1 - rung)))
+        return max(1, int(self.budget * (rung + 1) / self.n_rungs))
+
+    def select(self, rows):
+        """
+        Get the trials that go on to the next rung.
+
+        Parameters
+        ----------
+        rows : list
+            The results of every trial of the rung
+
+        Returns
+        -------
+        list
+            Ids of the trials to keep
+        """
+        ranked = sorted(rows, key=lambda row: row['score'], reverse=True)
+        if self.mode == 'halving':
+            return [row['trial'] for row in ranked[:max(1, math.ceil(len(ranked) / self.eta))]]
+        if not self.prune:
+            return [row['trial'] for row in ranked]
+
+        median = np.median([row['score'] for row in ranked if np.isfinite(row['score'])] or [-np.inf])
+        return [row['trial'] for row in ranked if row['score'] >= median]
+
+    def save_rows(self, rows):
+        table = pd.DataFrame(rows)
+        table.to_csv(self.results_path, mode='a', header=not os.path.exists(self.results_path), index=False)
+
+    def run(self):
+        """
+        Run the sweep.
+
+        Returns
+        -------
+        pd.DataFrame
+            One row per rung of every trial, with the trial's hyperparameters,
+            timesteps trained, validation score, training time and status
+            ('continued', 'pruned' or 'complete')
+        """
+        remaining = list(range(len(self.trials)))
+        all_rows = []
+
+        with ProcessPoolExecutor(max_workers=self.n_workers, initializer=init_worker,
+                                 initargs=(self.agent, self.threads_per_trial)) as pool:
+            for rung in range(self.n_rungs):
+                timesteps = self.rung_timesteps(rung)
+                futures = [pool.submit(run_trial_rung,
+                                       {'trial': i, 'params': self.trials[i], 'rung': rung, 'timesteps': timesteps},
+                                       self.settings)
+                           for i in remaining]
+                rows = [future.result() for future in futures]
+
+                last_rung = rung == self.n_rungs - 1
+                remaining = [row['trial'] for row in rows] if last_rung else self.select(rows)
+                for row in rows:
+                    if last_rung:
+                        row['status'] = 'complete'
+                    else:
+                        row['status'] = 'continued' if row['trial'] in remaining else 'pruned'
+                    if self.verbose > 0:
+                        print(f"trial {row['trial']} | rung {rung} | {row['timesteps']} steps | "
+                              f"score {row['score']:.4f} | {row['status']}")
+
+                self.save_rows(rows)
+                all_rows.extend(rows)
+
+        return pd.DataFrame(all_rows)
+
+    def best_params(self, results):
+        """
+        Get the hyperparameters of the best completed trial, to pass to
+        BatteryAgent.train_agent as hyperparams.
+
+        Parameters
+        ----------
+        results : pd.DataFrame
+            The table returned by run
+
+        Returns
+        -------
+        dict
+            The hyperparameters
+        """
+        complete = results[results['status'] == 'complete']
+        best = complete.loc[complete['score'].idxmax(), 'trial']
+        return self.trials[int(best)]
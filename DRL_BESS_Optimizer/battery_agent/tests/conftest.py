@@ -0,0 +1,21 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+
+@pytest.fixture
+def ci_data():
+    n_days = 4
+    rng = np.random.default_rng(0)
+    intensity = 200 + 80 * np.sin(np.arange(48 * n_days) * 2 * np.pi / 48) + rng.normal(0, 20, 48 * n_days)
+    forecast = intensity + rng.normal(0, 10, 48 * n_days)
+    data = pd.DataFrame({
+        'nationalIntensity': intensity,
+        'forecast': forecast,
+        'settlementPeriod': np.tile(np.arange(1, 49), n_days),
+    })
+    rolling_window = data['forecast'].rolling(window=24, min_periods=1)
+    data['forecast_min'] = rolling_window.min().shift(-24).bfill().ffill()
+    data['forecast_max'] = rolling_window.max().shift(-24).bfill().ffill()
+    data['forecast_mean'] = rolling_window.mean().shift(-24).bfill().ffill()
+    return data
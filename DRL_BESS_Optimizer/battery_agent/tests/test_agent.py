@@ -0,0 +1,71 @@
+import numpy as np
+import pandas as pd
+import pytest
+from battery_agent.agent import BatteryAgent
+from battery_agent.battery_env import BatteryEnv
+
+
+def test_make_vec_env_gives_each_env_its_own_days(ci_data):
+    agent = BatteryAgent(ci_data, ci_data.copy())
+    env = agent.make_vec_env(10, 20, 2, vec_env='dummy', seed=0)
+
+    day_starts = [set(monitor.env.scheduler.day_starts.tolist()) for monitor in env.envs]
+    assert day_starts[0].isdisjoint(day_starts[1])
+    assert len(day_starts[0] | day_starts[1]) == 4
+
+    env.reset()
+    obs, rewards, dones, infos = env.step(np.zeros((2, 1), dtype=np.float32))
+    assert obs.shape == (2, 7)
+
+
+def test_make_vec_env_rejects_unknown_backend(ci_data):
+    agent = BatteryAgent(ci_data, ci_data.copy())
+    with pytest.raises(ValueError):
+        agent.make_vec_env(10, 20, 2, vec_env='threads')
+
+
+class IntensityPolicy:
+    """Discharges when the intensity is high and charges when it is low."""
+
+    def predict(self, obs, deterministic=True):
+        obs = np.asarray(obs, dtype=np.float32).reshape(-1, 7)
+        return np.clip(0.3 * obs[:, 1:2] - 0.1 * obs[:, 0:1], -1, 1), None
+
+
+def test_predict_lanes_matches_single_env(ci_data):
+    agent = BatteryAgent(ci_data, ci_data.copy())
+    policy = IntensityPolicy()
+    second_half = ci_data.iloc[100:].reset_index(drop=True)
+    lanes = [(ci_data, 10, 20), (second_half, 10, 20), (ci_data, 40, 40)]
+
+    lane_actions = agent.predict_lanes(policy, lanes)
+
+    for (test_data, max_power, max_charge), actions in zip(lanes, lane_actions):
+        env = BatteryEnv(0, max_power, max_charge, 0, test_data, agent.mean_ci, agent.std_dev_ci)
+        expected = []
+        obs, _ = env.reset()
+        for _ in range(len(test_data)):
+            action, _states = policy.predict(obs)
+            obs, reward, done, truncated, info = env.step(action[0])
+            expected.append(float(action[0, 0]))
+            if env.current_timestep >= len(test_data) - 1:
+                break
+            if done:
+                obs, _ = env.reset()
+
+        np.testing.assert_array_equal(actions, np.array(expected, dtype=np.float32))
+
+
+def test_score_actions_leaves_test_data_unchanged(ci_data):
+    agent = BatteryAgent(ci_data, ci_data.copy())
+    lane_data = ci_data.iloc[48:].reset_index(drop=True)
+    actions = agent.predict_lanes(IntensityPolicy(), [(lane_data, 10, 20)])[0]
+
+    before = lane_data.copy()
+    results, daily_charge, daily_discharge = agent.score_actions(10, 20, actions, test_data=lane_data)
+
+    assert results['energyOut'].notnull().sum() == len(lane_data) - 2
+    assert results['energyOut'].dtype == np.float64
+    pd.testing.assert_frame_equal(lane_data, before)
+    assert 'energyOut' not in agent.test_data
+    assert len(daily_charge) == len(daily_discharge) == 2
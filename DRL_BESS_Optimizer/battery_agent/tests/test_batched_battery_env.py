@@ -0,0 +1,51 @@
+import numpy as np
+import pytest
+from battery_agent.battery_env import BatteryEnv
+from battery_agent.batched_battery_env import BatchedBatteryEnv
+
+
+def test_batched_env_matches_battery_env(ci_data):
+    n_envs = 3
+    n_steps = len(ci_data) - 2
+    rng = np.random.default_rng(1)
+    actions = rng.uniform(-1, 1, size=(n_steps, n_envs)).astype(np.float32)
+    mean_ci, std_ci = ci_data['nationalIntensity'].mean(), ci_data['nationalIntensity'].std()
+
+    batched = BatchedBatteryEnv(n_envs, 25, 50, 50, 0, ci_data, mean_ci, std_ci)
+    envs = [BatteryEnv(25, 50, 50, 0, ci_data, mean_ci, std_ci) for _ in range(n_envs)]
+
+    batched_obs = batched.reset()
+    obs = np.stack([env.reset()[0] for env in envs])
+    np.testing.assert_allclose(batched_obs, obs, atol=1e-5)
+
+    for step in range(n_steps):
+        batched_obs, batched_rewards, batched_dones, infos = batched.step(actions[step].reshape(n_envs, 1))
+        for i, env in enumerate(envs):
+            next_obs, reward, done, _, _ = env.step(actions[step, i:i+1])
+            assert batched_dones[i] == done
+            assert batched_rewards[i] == pytest.approx(float(np.squeeze(reward)), rel=1e-4, abs=1e-4)
+            assert batched.energy_out[i] == pytest.approx(float(np.squeeze(env.energy_out)), rel=1e-4, abs=1e-4)
+            if done:
+                np.testing.assert_allclose(infos[i]['terminal_observation'], next_obs, atol=1e-5)
+                next_obs, _ = env.reset()
+            np.testing.assert_allclose(batched_obs[i], next_obs, atol=1e-5)
+
+
+def test_batched_env_per_lane_capacities(ci_data):
+    batched = BatchedBatteryEnv(2, [0, 0], [10, 50], [20, 50], 0, ci_data, 200, 50)
+    batched.reset()
+    # charge at full power on both lanes
+    batched.step(np.array([[-1.0], [-1.0]]))
+    np.testing.assert_allclose(batched.energy_out, [-5.0, -25.0])
+    np.testing.assert_allclose(batched.charge, [0.5, 0.5])
+
+
+def test_batched_env_out_of_bounds(ci_data):
+    batched = BatchedBatteryEnv(2, 0, 50, 50, 0, ci_data, 200, 50)
+    batched.reset()
+    # discharging an empty battery ends the episode with the penalty
+    _, rewards, dones, infos = batched.step(np.array([[1.0], [0.0]]))
+    assert rewards[0] == batched.penalty
+    assert dones.tolist() == [True, False]
+    assert 'terminal_observation' in infos[0]
+    assert batched.energy_out[0] == 0.0
@@ -0,0 +1,132 @@
+import numpy as np
+import pytest
+from battery_agent.battery_env import BatteryEnv, build_feature_matrix, build_reward_tables
+from battery_agent.batched_battery_env import BatchedBatteryEnv
+
+
+@pytest.fixture
+def env(ci_data):
+    return BatteryEnv(25, 50, 50, 0, ci_data, 200, 50)
+
+
+def test_build_feature_matrix(ci_data):
+    features = build_feature_matrix(ci_data, 200, 50)
+    assert features.dtype == np.float32
+    assert features.flags['C_CONTIGUOUS']
+    np.testing.assert_allclose(features[:, 0], (ci_data['nationalIntensity'] - 200) / 50, rtol=1e-6)
+    np.testing.assert_allclose(features[:, 3], (ci_data['forecast_mean'] - 200) / 50, rtol=1e-6)
+
+
+def test_build_reward_tables():
+    # ci, forecast min, forecast max, forecast mean
+    features = np.array([[0.0, -1.0, 1.0, 0.5],
+                         [1.0, -1.0, 1.0, 0.5],
+                         [-1.0, -1.0, 1.0, 0.5],
+                         [0.5, 0.5, 0.5, 0.5]], dtype=np.float32)
+    charge_coefficients, discharge_coefficients = build_reward_tables(features)
+    np.testing.assert_array_equal(charge_coefficients, [1, -5, 6, 6])
+    np.testing.assert_array_equal(discharge_coefficients, [-5, 6, -5, 6])
+
+    charge_stack, discharge_stack = build_reward_tables(np.stack([features, features[::-1]]))
+    np.testing.assert_array_equal(charge_stack, [charge_coefficients, charge_coefficients[::-1]])
+    np.testing.assert_array_equal(discharge_stack, [discharge_coefficients, discharge_coefficients[::-1]])
+
+
+def test_envs_share_reward_tables(env, ci_data):
+    batched = BatchedBatteryEnv(1, 25, 50, 50, 0, ci_data, 200, 50)
+    np.testing.assert_array_equal(batched.charge_coefficients[0], env.charge_coefficients)
+    np.testing.assert_array_equal(batched.discharge_coefficients[0], env.discharge_coefficients)
+
+    env.reset()
+    _, reward, _, _, _ = env.step(np.array([0.2]))
+    assert reward == env.discharge_coefficients[0] * 5
+    _, reward, _, _, _ = env.step(np.array([-0.4]))
+    assert reward == env.charge_coefficients[1] * 10
+
+
+def test_kept_observation_is_not_changed(env):
+    obs, _ = env.reset()
+    kept = obs.copy()
+    next_obs, _, _, _, _ = env.step(np.array([0.1]))
+    np.testing.assert_array_equal(obs, kept)
+    assert next_obs[0] == pytest.approx(0.45)
+    np.testing.assert_allclose(next_obs[1:5], env.features[1])
+
+    kept = next_obs.copy()
+    env.step(np.array([0.1]))
+    env.reset()
+    np.testing.assert_array_equal(next_obs, kept)
+
+
+def test_kept_dict_observation_is_not_changed(ci_data):
+    env = BatteryEnv(25, 50, 50, 0, ci_data, 200, 50, lookback=4, sp_one_hot=True)
+    obs, _ = env.reset()
+    kept = {key: value.copy() for key, value in obs.items()}
+
+    env.step(np.array([-0.2]))
+    env.reset()
+    for key in kept:
+        np.testing.assert_array_equal(obs[key], kept[key])
+
+
+def test_step_is_silent_by_default(env, capsys):
+    env.reset()
+    for _ in range(10):
+        env.step(np.array([0.1]))
+    assert capsys.readouterr().out == ""
+
+
+def test_stats(env):
+    env.reset()
+    env.step(np.array([-0.2]))
+    env.step(np.array([0.4]))
+    # discharging more than the remaining charge is clipped and penalized
+    _, reward, done, _, info = env.step(np.array([1.0]))
+
+    assert done
+    assert reward == env.penalty
+    assert info['stats']['steps'] == 3
+    assert info['stats']['penalties'] == 1
+    assert info['stats']['clipped_actions'] == 1
+    assert info['stats']['energy_in'] == pytest.approx(5.0)
+    assert info['stats']['energy_out'] == pytest.approx(10.0 + 20.0)
+
+
+def test_lookback_observation(ci_data):
+    env = BatteryEnv(25, 50, 50, 0, ci_data, 200, 50, lookback=4, sp_one_hot=True)
+    obs, _ = env.reset()
+
+    # the first rows are padded with the first timestep
+    np.testing.assert_array_equal(obs['window'], np.repeat(env.features[:1], 4, axis=0))
+
+    for _ in range(10):
+        obs, _, _, _, _ = env.step(np.array([0.0]))
+
+    np.testing.assert_array_equal(obs['window'], env.features[7:11])
+    # a view into the precomputed windows, nothing is copied per step
+    assert np.shares_memory(obs['window'], env.windows)
+    assert not obs['window'].flags.writeable and not obs['sp'].flags.writeable
+    assert obs['sp'].argmax() == env.sp - 1
+    np.testing.assert_array_equal(obs['battery'], [env.charge, 0, 0])
+    assert env.observation_space.contains(obs)
+
+
+def test_get_and_set_state(env):
+    env.reset()
+    env.step(np.array([0.3]))
+    snapshot = env.get_state()
+    obs = env.state.copy()
+
+    # branch off and come back
+    for _ in range(5):
+        env.step(np.array([-0.5]))
+    restored_obs = env.set_state(snapshot)
+
+    np.testing.assert_array_equal(restored_obs, obs)
+    assert env.current_timestep == snapshot.timestep == 1
+    assert env.charge == snapshot.charge
+
+    _, reward, _, _, _ = env.step(np.array([0.1]))
+    env.set_state(snapshot)
+    _, replayed_reward, _, _, _ = env.step(np.array([0.1]))
+    assert replayed_reward == reward
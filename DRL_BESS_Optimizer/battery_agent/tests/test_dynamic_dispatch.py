@@ -0,0 +1,59 @@
+import numpy as np
+import pytest
+from battery_agent.battery_env import cycles_reward
+from battery_agent.dynamic_dispatch import dp_dispatch, dp_dispatch_lanes, reward_tables, solve_dp_dispatch
+from battery_agent.optimal_dispatch import optimal_dispatch
+from battery_agent.rollout import rollout_actions
+
+
+def test_dp_carbon_dispatch_matches_lp(ci_data):
+    intensity = ci_data['nationalIntensity'].to_numpy()
+    # both plan the physical charge, which BatteryEnv does not follow when max_power != max_charge
+    with pytest.warns(UserWarning):
+        results = dp_dispatch(ci_data, 25, 50)
+        optimal = optimal_dispatch(ci_data, 25, 50)
+
+    assert 'energyOut' not in ci_data
+    assert results['charge'].min() >= 0 and results['charge'].max() <= 1
+    # the power and capacity limits are whole grid steps, so the LP schedule is on the grid
+    np.testing.assert_allclose((intensity * results['energyOut']).sum(), (intensity * optimal['energyOut']).sum(), rtol=1e-5)
+
+
+def test_dp_reward_dispatch_scores_its_value_in_env(ci_data):
+    charge_values, discharge_values = reward_tables(ci_data, 200, 50)
+    energy_out, charge, values = solve_dp_dispatch(charge_values.reshape(-1, 48), discharge_values.reshape(-1, 48),
+                                                   50, 50, cycles_reward=cycles_reward)
+
+    trace = rollout_actions(energy_out.reshape(-1)[:len(ci_data) - 1] / 25, 0, 50, 50, 0, ci_data, 200, 50)
+    assert not trace['penalized'].any()
+    # the last day is cut short by one action, like test_agent
+    np.testing.assert_allclose(trace['reward'][:-47].sum(), values[:-1].sum())
+
+    optimal = optimal_dispatch(ci_data, 50, 50)['energyOut'].to_numpy()[:len(ci_data) - 1] / 25
+    assert trace['reward'].sum() > rollout_actions(optimal, 0, 50, 50, 0, ci_data, 200, 50)['reward'].sum()
+
+
+@pytest.mark.parametrize('max_power, max_charge', [(25, 50), (10, 40)])
+def test_dp_reward_dispatch_follows_env_dynamics(ci_data, max_power, max_charge):
+    results = dp_dispatch(ci_data, max_power, max_charge, 'reward', 200, 50)
+    values = solve_dp_dispatch(*(table.reshape(-1, 48) for table in reward_tables(ci_data, 200, 50)),
+                               max_power, max_charge, cycles_reward=cycles_reward, env_dynamics=True)[2]
+
+    actions = results['energyOut'].to_numpy()[:len(ci_data) - 1] / (max_power / 2)
+    trace = rollout_actions(actions, 0, max_power, max_charge, 0, ci_data, 200, 50)
+    assert not trace['penalized'].any()
+    np.testing.assert_allclose(trace['charge'], results['charge'].to_numpy()[:len(ci_data) - 1])
+    np.testing.assert_allclose(trace['reward'][:-47].sum(), values[:-1].sum())
+
+
+def test_dp_dispatch_lanes_groups_sizes(ci_data):
+    lanes = [(ci_data, 25, 50), (ci_data.iloc[48:], 10, 10), (ci_data.iloc[96:], 25, 50)]
+    results = dp_dispatch_lanes(lanes, 'reward', 200, 50)
+
+    for (data, max_power, max_charge), result in zip(lanes, results):
+        np.testing.assert_allclose(result['energyOut'], dp_dispatch(data, max_power, max_charge, 'reward', 200, 50)['energyOut'])
+
+    with pytest.raises(ValueError):
+        dp_dispatch_lanes(lanes, 'reward')
+
+    assert dp_dispatch_lanes([]) == []
@@ -0,0 +1,77 @@
+import numpy as np
+import pytest
+from battery_agent.battery_env import BatteryEnv
+from battery_agent.batched_battery_env import BatchedBatteryEnv
+from battery_agent.episode_scheduler import DayScheduler, get_day_starts, split_days
+
+
+@pytest.fixture
+def settlement_periods():
+    # data starts mid-day and ends with an incomplete day
+    return np.concatenate([np.arange(40, 49), np.tile(np.arange(1, 49), 3), np.arange(1, 10)])
+
+
+def test_get_day_starts(settlement_periods):
+    np.testing.assert_array_equal(get_day_starts(settlement_periods), [9, 57, 105])
+
+
+def test_sequential_wraps_around(settlement_periods):
+    scheduler = DayScheduler(settlement_periods)
+    assert [scheduler.next_day() for _ in range(4)] == [9, 57, 105, 9]
+    assert scheduler.epoch == 1
+
+
+def test_shuffle_uses_every_day_once_per_epoch(settlement_periods):
+    scheduler = DayScheduler(settlement_periods, mode='shuffle', seed=0)
+    for _ in range(3):
+        assert sorted(scheduler.next_days(3)) == [9, 57, 105]
+
+
+def test_weighted(settlement_periods):
+    scheduler = DayScheduler(settlement_periods, mode='weighted', weights=[0, 1, 0], seed=0)
+    assert set(scheduler.next_days(50)) == {57}
+
+    with pytest.raises(ValueError):
+        DayScheduler(settlement_periods, mode='weighted')
+
+
+def test_split_days_are_disjoint(settlement_periods):
+    parts = split_days(settlement_periods, 2)
+    schedulers = [DayScheduler(settlement_periods, days=days) for days in parts]
+    assert [scheduler.day_starts.tolist() for scheduler in schedulers] == [[9, 57], [105]]
+
+
+def test_env_episodes_start_on_scheduled_days(ci_data):
+    scheduler = DayScheduler(ci_data['settlementPeriod'], mode='shuffle', seed=0)
+    env = BatteryEnv(25, 25, 50, 0, ci_data, 200, 50, scheduler=scheduler)
+
+    # run more episodes than there are days in the data
+    for _ in range(10):
+        env.reset()
+        assert env.sp == 1
+        done = False
+        while not done:
+            _, _, done, _, _ = env.step(np.array([0.0]))
+
+
+def test_env_wraps_at_end_of_data(ci_data):
+    env = BatteryEnv(25, 25, 50, 0, ci_data, 200, 50)
+    env.reset()
+    for _ in range(len(ci_data)):
+        _, _, done, _, _ = env.step(np.array([0.0]))
+        if done:
+            env.reset()
+    assert env.current_timestep == 0
+
+
+def test_batched_env_lanes_reset_to_scheduled_days(ci_data):
+    scheduler = DayScheduler(ci_data['settlementPeriod'], seed=0)
+    env = BatchedBatteryEnv(3, 25, 25, 50, 0, ci_data, 200, 50, scheduler=scheduler)
+    env.reset()
+    np.testing.assert_array_equal(env.current_timestep, [0, 48, 96])
+
+    # discharging an empty battery ends the first lane's episode
+    env.charge[0] = 0.0
+    env.fill_state()
+    env.step(np.array([[1.0], [0.0], [0.0]]))
+    np.testing.assert_array_equal(env.current_timestep, [144, 49, 97])
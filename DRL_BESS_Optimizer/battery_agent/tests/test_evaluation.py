@@ -0,0 +1,21 @@
+from battery_agent.agent import BatteryAgent
+from battery_agent.evaluation import evaluate_matrix
+from battery_agent.test_analysis import process_test_data, calculate_total_carbon_abated
+
+
+def test_evaluate_matrix_matches_test_agent(ci_data, tmp_path):
+    periods = {'all': ci_data, 'last_days': ci_data.iloc[48:].reset_index(drop=True)}
+    sizes = [(25, 50), (10, 10)]
+    save_file = str(tmp_path / "matrix.csv")
+
+    results = evaluate_matrix(["DDPG_Best"], periods, sizes, ci_data, n_workers=2, save_file=save_file)
+
+    assert len(results) == 4
+    assert list(results['Period']) == ['all', 'all', 'last_days', 'last_days']
+
+    agent = BatteryAgent(train_data=ci_data, test_data=periods['last_days'].copy())
+    test_results, _, _ = agent.test_agent(10, 10, "DDPG_Best")
+    expected = calculate_total_carbon_abated(process_test_data(test_results))
+    row = results.iloc[3]
+    assert row["carbon_abated_national (mt CO2/MWh Discharged)"] == expected["carbon_abated_national (mt CO2/MWh Discharged)"]
+    assert row["Duration"] == 1
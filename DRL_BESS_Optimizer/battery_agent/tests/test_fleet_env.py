@@ -0,0 +1,69 @@
+import numpy as np
+import pandas as pd
+import pytest
+from battery_agent.fleet_env import FleetBatteryEnv
+from battery_agent.test_analysis import process_test_data, calculate_total_carbon_abated
+
+
+@pytest.fixture
+def fleet():
+    return pd.DataFrame({
+        "BMU ID": ["A", "B", "C"],
+        "Name": ["Asset A", "Asset B", "Asset C"],
+        "MW": [10, 20, 50],
+        "MWh": [10, 40, 50],
+        "Region": [1, 2, 1],
+    }).set_index("BMU ID")
+
+
+class SinePolicy:
+    """Charges in the first half of the day and discharges in the second."""
+
+    def __init__(self):
+        self.t = 0
+
+    def predict(self, obs, deterministic=True):
+        action = 0.1 * np.sin(2 * np.pi * (self.t % 48) / 48 + np.pi)
+        self.t += 1
+        return np.full((len(obs), 1), action), None
+
+
+def test_fleet_env_shapes(fleet, ci_data):
+    env = FleetBatteryEnv(fleet, ci_data, 200, 50, initial_soc=0.5)
+    obs = env.reset()
+    assert obs.shape == (3, 7)
+    np.testing.assert_allclose(env.max_power, [10, 20, 50])
+    np.testing.assert_allclose(obs[:, 0], 0.5)
+
+
+def test_fleet_env_regional_data(fleet, ci_data):
+    regional = ci_data.copy()
+    regional['nationalIntensity'] = regional['nationalIntensity'] + 100
+    env = FleetBatteryEnv(fleet, ci_data, 200, 50, regional_ci_data={2: regional})
+    obs = env.reset()
+    np.testing.assert_array_equal(env.data_index, [0, 1, 0])
+    assert obs[1, 1] == pytest.approx(obs[0, 1] + 2)
+
+
+def test_fleet_results_match_test_analysis(fleet, ci_data):
+    n_steps = 96
+    env = FleetBatteryEnv(fleet, ci_data, 200, 50, initial_soc=0.5)
+    results = env.run_policy(SinePolicy(), n_steps)
+
+    assert len(results) == 3
+    assert (results['Ed (MWh)'] > 0).all()
+
+    # score the first asset the same way as the agent's test results
+    energy_out = np.zeros(n_steps)
+    env = FleetBatteryEnv(fleet.iloc[:1], ci_data, 200, 50, initial_soc=0.5)
+    policy = SinePolicy()
+    obs = env.reset()
+    for i in range(n_steps):
+        obs, _, _, _ = env.step(policy.predict(obs)[0])
+        energy_out[i] = env.energy_out[0]
+    test_results = pd.DataFrame({'nationalIntensity': ci_data['nationalIntensity'][:n_steps], 'energyOut': energy_out})
+    expected = calculate_total_carbon_abated(process_test_data(test_results))
+
+    assert results['Ec (MWh)'][0] == pytest.approx(expected['Ec (MWh)'])
+    assert results['Ed (MWh)'][0] == pytest.approx(expected['Ed (MWh)'])
+    assert results['carbon_abated_national (mt CO2/MWh Discharged)'][0] == pytest.approx(expected['carbon_abated_national (mt CO2/MWh Discharged)'])
@@ -0,0 +1,36 @@
+import os
+import pytest
+from stable_baselines3 import PPO
+from battery_agent.agent import BatteryAgent
+from battery_agent.metrics import MetricsSink
+
+
+def test_csv_sink_logs_and_checkpoints_offline(ci_data, tmp_path):
+    agent = BatteryAgent(ci_data, ci_data.copy())
+    env = agent.make_vec_env(10, 20, 2, vec_env='batched', seed=0)
+
+    sink = MetricsSink(backend='csv', log_dir=str(tmp_path / "logs"), checkpoint_freq=64,
+                       checkpoint_dir=str(tmp_path / "models"))
+    model = PPO('MlpPolicy', env, n_steps=64, batch_size=64, seed=0, tensorboard_log=sink.tensorboard_log)
+    sink.attach(model)
+    model.learn(total_timesteps=256, callback=sink.callback())
+    sink.close()
+
+    assert sink.tensorboard_log is None
+    assert os.path.getsize(os.path.join(sink.log_dir, "progress.csv")) > 0
+    assert len(os.listdir(sink.checkpoint_dir)) == 2
+
+
+def test_sink_without_checkpoints_saves_nothing(tmp_path):
+    sink = MetricsSink(backend='none', checkpoint_dir=str(tmp_path))
+    assert len(sink.callback().callbacks) == 0
+
+
+def test_sink_rejects_unknown_backend():
+    with pytest.raises(ValueError):
+        MetricsSink(backend='mlflow')
+
+
+def test_runs_started_together_get_their_own_folders(tmp_path):
+    sinks = [MetricsSink(backend='none', log_dir=str(tmp_path)) for _ in range(2)]
+    assert sinks[0].run_id != sinks[1].run_id
@@ -0,0 +1,73 @@
+import os
+import shutil
+import numpy as np
+import pytest
+from stable_baselines3 import SAC, TD3
+from battery_agent.agent import BatteryAgent
+from battery_agent.battery_env import BatteryEnv
+from battery_agent.model_cache import ModelCache
+
+
+def copy_model(tmp_path, name):
+    path = str(tmp_path / f"{name}.zip")
+    shutil.copy("battery_agent/models/DDPG_Best.zip", path)
+    return path
+
+
+def test_model_cache_hits(tmp_path):
+    path = copy_model(tmp_path, "a")
+    cache = ModelCache()
+
+    model = cache.load(path)
+    assert cache.load(path[:-len(".zip")]) is model
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_model_cache_reloads_modified_file(tmp_path):
+    path = copy_model(tmp_path, "a")
+    cache = ModelCache(warm_up=False)
+
+    model = cache.load(path)
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+
+    assert cache.load(path) is not model
+    assert len(cache) == 1
+
+
+def test_model_cache_evicts_least_recently_used(tmp_path):
+    paths = [copy_model(tmp_path, name) for name in "abc"]
+    cache = ModelCache(max_size=2, warm_up=False)
+
+    first = cache.load(paths[0])
+    cache.load(paths[1])
+    cache.load(paths[0])
+    cache.load(paths[2])
+
+    assert len(cache) == 2
+    assert cache.load(paths[0]) is first
+    assert cache.misses == 3
+
+
+def test_model_cache_loads_by_algorithm_name(ci_data, tmp_path):
+    env = BatteryEnv(0, 25, 25, 0, ci_data, 200, 50)
+    path = str(tmp_path / "sac")
+    SAC('MlpPolicy', env, buffer_size=100, seed=0).save(path)
+    cache = ModelCache(warm_up=False)
+
+    assert isinstance(cache.load(path, 'SAC'), SAC)
+    assert cache.load(path, SAC) is cache.load(path, 'SAC')
+    with pytest.raises(ValueError):
+        cache.load(path, 'DQN')
+
+
+def test_test_agent_loads_non_ddpg_model(ci_data, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    os.makedirs("battery_agent/models")
+    agent = BatteryAgent(ci_data, ci_data.copy())
+    model = TD3('MlpPolicy', BatteryEnv(0, 25, 25, 0, ci_data, 200, 50), seed=0)
+    model.save("battery_agent/models/td3_test")
+
+    test_results, _, _ = agent.test_agent(25, 25, "td3_test", algorithm='TD3')
+    expected, _, _ = agent.test_agent(25, 25, None, model=model)
+    np.testing.assert_array_equal(test_results['energyOut'], expected['energyOut'])
@@ -0,0 +1,56 @@
+import numpy as np
+import pytest
+from battery_agent.agent import BatteryAgent
+from battery_agent.battery_env import BatteryEnv
+from battery_agent.mpc_policy import MPCPolicy
+from battery_agent.rollout import rollout_actions
+from battery_agent.test_analysis import process_test_data, calculate_total_carbon_abated
+
+
+def test_mpc_policy_runs_in_test_agent(ci_data):
+    agent = BatteryAgent(ci_data, ci_data.copy())
+    policy = MPCPolicy(agent.test_data, 50, 50, horizon=24)
+
+    test_results, daily_charge, daily_discharge = agent.test_agent(50, 50, None, model=policy)
+
+    assert len(policy.solve_times) == len(ci_data) - 1
+    assert policy.n_fallbacks == 0
+    assert max(daily_charge + daily_discharge) <= 2
+
+    actions = test_results['energyOut'].to_numpy()[:len(ci_data) - 2] / 25
+    assert not rollout_actions(actions, 0, 50, 50, 0, ci_data, 200, 50)['penalized'].any()
+
+    result = calculate_total_carbon_abated(process_test_data(test_results))
+    assert result['carbon_abated_national (mt CO2/MWh Discharged)'] > 0
+
+
+def test_mpc_policy_follows_previous_plan_when_solve_fails(ci_data):
+    policy = MPCPolicy(ci_data, 25, 50)
+    observation = np.array([[0.5, 0, 0, 0, 0, 0, 0]], dtype=np.float32)
+
+    action, state = policy.predict(observation)
+    assert action.shape == (1, 1) and state is None
+    plan = policy.plan.copy()
+
+    policy.solve = lambda *args: None
+    action, _ = policy.predict(observation[0])
+    assert action.shape == (1,)
+    assert policy.n_fallbacks == 1
+    np.testing.assert_allclose(action, np.clip(plan[0] / 12.5, -1, 1), rtol=1e-6)
+    assert policy.timestep == 2
+
+    policy.reset()
+    assert policy.timestep == 0 and len(policy.plan) == 0
+
+
+def test_mpc_policy_reads_dict_observations(ci_data):
+    env = BatteryEnv(0.5, 25, 50, 0, ci_data, 200, 50, lookback=4, sp_one_hot=True)
+    flat_env = BatteryEnv(0.5, 25, 50, 0, ci_data, 200, 50)
+    dict_obs, _ = env.reset()
+    flat_obs, _ = flat_env.reset()
+
+    action, _ = MPCPolicy(ci_data, 25, 50).predict(dict_obs)
+    np.testing.assert_allclose(action, MPCPolicy(ci_data, 25, 50).predict(flat_obs)[0])
+
+    with pytest.raises(ValueError):
+        MPCPolicy(ci_data, 25, 50).predict({'window': dict_obs['window']})
@@ -0,0 +1,47 @@
+import subprocess
+import sys
+import numpy as np
+import pytest
+from battery_agent.agent import BatteryAgent
+from battery_agent.numpy_policy import NumpyPolicy, export_policy
+
+
+@pytest.mark.parametrize("algorithm", ['DDPG', 'SAC', 'PPO'])
+def test_numpy_policy_matches_model(ci_data, tmp_path, algorithm):
+    agent = BatteryAgent(ci_data, ci_data.copy())
+    env = agent.make_vec_env(10, 20, 1, vec_env='batched', seed=0)
+    model = agent.make_model(algorithm, env, hyperparams={'net_arch': [16, 8]}, seed=0, verbose=0)
+
+    path = str(tmp_path / "policy.npz")
+    export_policy(model, path)
+    policy = NumpyPolicy(path)
+
+    obs = np.random.default_rng(0).normal(size=(100, 7)).astype(np.float32)
+    expected, _ = model.predict(obs, deterministic=True)
+    actions, _ = policy.predict(obs)
+    np.testing.assert_allclose(actions, expected, atol=1e-5)
+
+    action, _ = policy.predict(obs[0])
+    assert action.shape == (1,)
+    np.testing.assert_allclose(action, expected[0], atol=1e-5)
+
+
+def test_export_saved_model_by_algorithm_name(ci_data, tmp_path):
+    agent = BatteryAgent(ci_data, ci_data.copy())
+    env = agent.make_vec_env(10, 20, 1, vec_env='batched', seed=0)
+    model = agent.make_model('SAC', env, hyperparams={'net_arch': [16, 8]}, seed=0, verbose=0)
+    model.save(str(tmp_path / "sac_model"))
+
+    path = str(tmp_path / "policy.npz")
+    export_policy(str(tmp_path / "sac_model"), path, algorithm='SAC')
+
+    obs = np.random.default_rng(0).normal(size=(10, 7)).astype(np.float32)
+    np.testing.assert_allclose(NumpyPolicy(path).predict(obs)[0], model.predict(obs, deterministic=True)[0], atol=1e-5)
+
+    with pytest.raises(ValueError):
+        export_policy(str(tmp_path / "sac_model"), path, algorithm='DQN')
+
+
+def test_numpy_policy_does_not_import_torch():
+    code = "import sys, battery_agent.numpy_policy; assert 'torch' not in sys.modules"
+    subprocess.run([sys.executable, "-c", code], check=True)
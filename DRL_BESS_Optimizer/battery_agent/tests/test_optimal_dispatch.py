@@ -0,0 +1,51 @@
+import warnings
+import numpy as np
+import pytest
+from battery_agent.optimal_dispatch import optimal_dispatch, optimal_dispatch_lanes, solve_daily_dispatch
+from battery_agent.rollout import rollout_actions
+from battery_agent.test_analysis import process_test_data, calculate_total_carbon_abated
+
+
+def test_optimal_dispatch_respects_battery_limits(ci_data):
+    # the env moves the charge fraction by action / 2, so it only follows schedules with max_power == max_charge
+    with pytest.warns(UserWarning, match="BatteryEnv would not follow it"):
+        results = optimal_dispatch(ci_data, 25, 50)
+
+    assert 'energyOut' not in ci_data
+    assert np.all(np.abs(results['energyOut']) <= 12.5 + 1e-9)
+    assert results['charge'].min() >= 0 and results['charge'].max() <= 1
+
+    days = results['energyOut'].to_numpy().reshape(-1, 48)
+    assert np.all(np.maximum(days, 0).sum(axis=1) <= 2 * 50)
+    # every day ends where it started
+    np.testing.assert_allclose(days.sum(axis=1), 0, atol=1e-6)
+
+
+def test_optimal_dispatch_replays_in_env_and_beats_agent_schedule(ci_data):
+    with warnings.catch_warnings():
+        warnings.simplefilter("error")
+        results = optimal_dispatch(ci_data, 50, 50)
+    actions = results['energyOut'].to_numpy()[:len(ci_data) - 1] / 25
+    trace = rollout_actions(actions, 0, 50, 50, 0, ci_data, 200, 50)
+    assert not trace['penalized'].any()
+
+    optimal = calculate_total_carbon_abated(process_test_data(results))
+    assert optimal['carbon_abated_national (mt CO2/MWh Discharged)'] > 0
+
+    # charging at night and discharging in the afternoon peak is feasible but worse
+    naive = np.zeros((len(ci_data) // 48, 48))
+    naive[:, :2] = -25
+    naive[:, 8:10] = 25
+    intensity = ci_data['nationalIntensity'].to_numpy().reshape(-1, 48)
+    energy_out, _ = solve_daily_dispatch(intensity, 50, 50)
+    assert (intensity * energy_out).sum() >= (intensity * naive).sum()
+
+
+def test_optimal_dispatch_lanes_matches_single_lane(ci_data):
+    lanes = [(ci_data, 25, 50), (ci_data.iloc[48:], 10, 10)]
+    with pytest.warns(UserWarning):
+        results = optimal_dispatch_lanes(lanes)
+        single_lane = optimal_dispatch(ci_data, 25, 50)
+
+    np.testing.assert_allclose(results[0]['energyOut'], single_lane['energyOut'], atol=1e-6)
+    np.testing.assert_allclose(results[1]['energyOut'], optimal_dispatch(ci_data.iloc[48:], 10, 10)['energyOut'], atol=1e-6)
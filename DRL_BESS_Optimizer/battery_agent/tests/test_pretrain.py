@@ -0,0 +1,55 @@
+import numpy as np
+import pytest
+import torch as th
+from stable_baselines3 import DDPG, PPO, SAC
+from battery_agent.battery_env import BatteryEnv, cycles_reward
+from battery_agent.dynamic_dispatch import reward_tables, solve_dp_dispatch
+from battery_agent.pretrain import dispatch_transitions, pretrain_policy
+
+
+@pytest.fixture
+def transitions(ci_data):
+    return dispatch_transitions(ci_data, 25, 25, 200, 50)
+
+
+def test_dispatch_transitions_label_the_best_dispatch(ci_data, transitions):
+    # every complete day but the last, which has no row after it
+    assert len(transitions['action']) == 3 * 48
+    assert np.abs(transitions['action']).max() <= 1
+    np.testing.assert_array_equal(np.flatnonzero(transitions['done']), [47, 95, 143])
+
+
+@pytest.mark.parametrize('objective', ['reward', 'carbon'])
+def test_dispatch_transitions_are_not_penalized_when_power_and_capacity_differ(ci_data, objective):
+    transitions = dispatch_transitions(ci_data, 25, 50, 200, 50, objective=objective)
+
+    # a penalty would end an episode early
+    np.testing.assert_array_equal(np.flatnonzero(transitions['done']), [47, 95, 143])
+    assert (transitions['reward'] != -50).all()
+    if objective == 'reward':
+        # the env scores every labelled day with the value it was planned for
+        charge_values, discharge_values = reward_tables(ci_data, 200, 50)
+        values = solve_dp_dispatch(charge_values.reshape(-1, 48), discharge_values.reshape(-1, 48), 25, 50,
+                                   n_levels=16, cycles_reward=cycles_reward, env_dynamics=True)[2]
+        np.testing.assert_allclose(transitions['reward'].sum(), values[:3].sum())
+
+
+@pytest.mark.parametrize('algorithm', [DDPG, SAC, PPO])
+def test_pretrain_policy_clones_actions(ci_data, transitions, algorithm):
+    env = BatteryEnv(0, 25, 25, 0, ci_data, 200, 50)
+    model = algorithm('MlpPolicy', env, seed=0)
+
+    def action_error():
+        actions, _ = model.predict(transitions['obs'], deterministic=True)
+        return np.mean((actions - transitions['action'])**2)
+
+    error = action_error()
+    losses = pretrain_policy(model, transitions, epochs=30, batch_size=32, verbose=0)
+
+    assert len(losses) == 30
+    assert losses[-1] < losses[0]
+    assert action_error() < 0.75 * error
+
+    if algorithm is DDPG:
+        for param, target_param in zip(model.actor.parameters(), model.actor_target.parameters()):
+            assert th.equal(param, target_param)
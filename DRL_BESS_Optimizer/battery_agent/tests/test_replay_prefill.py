@@ -0,0 +1,73 @@
+import numpy as np
+import pandas as pd
+import pytest
+from stable_baselines3 import DDPG, PPO
+from battery_agent.battery_env import BatteryEnv
+from battery_agent.replay_prefill import pn_energy_per_period, pn_transitions, prefill_replay_buffer
+
+
+@pytest.fixture
+def pn_ci_data(ci_data):
+    ci_data = ci_data.copy()
+    ci_data['from'] = pd.date_range("2023-01-01", periods=len(ci_data), freq="30min", tz="UTC").strftime("%Y-%m-%dT%H:%MZ")
+    return ci_data
+
+
+@pytest.fixture
+def energy_out(ci_data):
+    # charge overnight and discharge in the evening peak, a little over the power limit once
+    day = np.zeros(48)
+    day[4:8] = -5
+    day[34:38] = 5
+    day[20] = 20
+    day[21] = -20
+    return np.tile(day, len(ci_data) // 48)
+
+
+def test_pn_energy_per_period(pn_ci_data):
+    pn_data = pd.DataFrame({
+        'timeFrom': pd.to_datetime(["2023-01-01T00:00Z", "2023-01-01T00:15Z", "2023-01-01T01:00Z"]),
+        'energyOut': [1.0, 2.0, -4.0],
+    })
+    energy = pn_energy_per_period(pn_data, pn_ci_data)
+    assert len(energy) == len(pn_ci_data)
+    np.testing.assert_allclose(energy[:3], [3.0, np.nan, -4.0])
+    assert np.isnan(energy[3:]).all()
+
+
+def test_pn_transitions_match_env(ci_data, energy_out):
+    energy_out = energy_out.copy()
+    energy_out[48 + 10] = np.nan
+    transitions = pn_transitions(energy_out, ci_data, 25, 25, 200, 50)
+
+    # the day with a missing period and the last day, without a row after it, are left out
+    assert len(transitions['action']) == 2 * 48
+    assert transitions['action'].max() == 1 and transitions['action'].min() == -1
+    # no penalties, every episode ends at the end of its day
+    np.testing.assert_array_equal(np.flatnonzero(transitions['done']), [47, 95])
+
+    env = BatteryEnv(transitions['obs'][0, 0] * 25, 25, 25, 0, ci_data, 200, 50)
+    obs, _ = env.reset()
+    for i in range(48):
+        np.testing.assert_allclose(obs, transitions['obs'][i])
+        obs, reward, done, _, _ = env.step(transitions['action'][i])
+        np.testing.assert_allclose(obs, transitions['next_obs'][i])
+        assert reward == transitions['reward'][i]
+        assert done == transitions['done'][i]
+
+
+def test_prefill_replay_buffer(ci_data, energy_out):
+    transitions = pn_transitions(energy_out, ci_data, 25, 25, 200, 50)
+    env = BatteryEnv(0, 25, 25, 0, ci_data, 200, 50)
+
+    model = DDPG('MlpPolicy', env, buffer_size=100, learning_starts=0, seed=0)
+    assert prefill_replay_buffer(model, transitions) == 100
+    assert model.replay_buffer.full and model.replay_buffer.pos == 0
+    # the last transitions are kept
+    np.testing.assert_allclose(model.replay_buffer.observations[:, 0], transitions['obs'][-100:])
+    np.testing.assert_allclose(model.replay_buffer.rewards[:, 0], transitions['reward'][-100:])
+
+    model.learn(total_timesteps=10)
+
+    with pytest.raises(ValueError):
+        prefill_replay_buffer(PPO('MlpPolicy', env, n_steps=16, batch_size=16), transitions)
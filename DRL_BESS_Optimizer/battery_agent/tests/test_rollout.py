@@ -0,0 +1,62 @@
+import numpy as np
+import pytest
+from battery_agent.battery_env import BatteryEnv
+from battery_agent.rollout import rollout_actions, rollout_env
+
+
+def step_env(env, actions):
+    keys = ['energy_out', 'charge', 'reward', 'done', 'daily_charge', 'daily_discharge']
+    results = {key: [] for key in keys}
+    env.reset()
+    for action in actions:
+        _, reward, done, _, _ = env.step(np.array([action]))
+        results['energy_out'].append(env.energy_out)
+        results['charge'].append(env.charge)
+        results['reward'].append(reward)
+        results['done'].append(done)
+        results['daily_charge'].append(env.daily_charge)
+        results['daily_discharge'].append(env.daily_discharge)
+        if done:
+            env.reset()
+    return {key: np.array(values, dtype=float) for key, values in results.items()}
+
+
+@pytest.mark.parametrize("scale", [0.05, 0.3, 1.0])
+def test_rollout_matches_env(ci_data, scale):
+    rng = np.random.default_rng(int(scale * 100))
+    actions = (scale * rng.uniform(-1, 1, len(ci_data) - 1)).astype(np.float32)
+
+    expected = step_env(BatteryEnv(25, 25, 50, 0, ci_data, 200, 50), actions)
+    result = rollout_actions(actions, 25, 25, 50, 0, ci_data, 200, 50)
+
+    for key, values in expected.items():
+        np.testing.assert_array_equal(result[key], values, err_msg=key)
+
+
+def test_rollout_cycle_limit(ci_data):
+    # charge and discharge at full power so the daily cycle limit is hit
+    actions = np.tile([-1.0, -1.0, 1.0, 1.0], 48)[:len(ci_data) - 1]
+    expected = step_env(BatteryEnv(0, 50, 50, 0, ci_data, 200, 50), actions)
+    result = rollout_actions(actions, 0, 50, 50, 0, ci_data, 200, 50)
+
+    assert (result['energy_out'][result['penalized']] == 0).all()
+    assert result['penalized'].any()
+    for key, values in expected.items():
+        np.testing.assert_array_equal(result[key], values, err_msg=key)
+
+
+def test_rollout_env_does_not_change_env(ci_data):
+    env = BatteryEnv(25, 25, 50, 0, ci_data, 200, 50)
+    env.reset()
+    for _ in range(5):
+        env.step(np.array([0.1]))
+
+    result = rollout_env(env, np.full(10, -0.1))
+    assert env.current_timestep == 5
+    assert result['timestep'][0] == 5
+    assert result['charge'][-1] == pytest.approx(env.charge + 0.5)
+
+
+def test_rollout_past_end_of_data(ci_data):
+    with pytest.raises(ValueError):
+        rollout_actions(np.zeros(len(ci_data)), 25, 25, 50, 0, ci_data, 200, 50)
@@ -0,0 +1,45 @@
+import os
+import pandas as pd
+import pytest
+from battery_agent.agent import BatteryAgent
+from battery_agent.sweep import Sweep, grid_search_space, sample_search_space
+
+
+def test_grid_search_space():
+    trials = grid_search_space({'gamma': [0.9, 0.95], 'net_arch': [[8], [16, 16]]})
+    assert len(trials) == 4
+    assert {'gamma': 0.95, 'net_arch': [8]} in trials
+
+    with pytest.raises(ValueError):
+        grid_search_space({'gamma': (0.9, 0.99)})
+
+
+def test_sample_search_space():
+    space = {'learning_rate': (1e-4, 1e-2, 'log'), 'batch_size': (32, 256), 'gamma': [0.9, 0.95], 'tau': 0.01}
+    trials = sample_search_space(space, 20, seed=0)
+    assert trials == sample_search_space(space, 20, seed=0)
+    for params in trials:
+        assert 1e-4 <= params['learning_rate'] <= 1e-2
+        assert isinstance(params['batch_size'], int) and 32 <= params['batch_size'] <= 256
+        assert params['gamma'] in (0.9, 0.95)
+        assert params['tau'] == 0.01
+
+
+def test_successive_halving_sweep(ci_data, tmp_path, capsys):
+    agent = BatteryAgent(ci_data, ci_data.copy())
+    sweep = Sweep(agent, {'gamma': [0.9, 0.95], 'buffer_size': [1000], 'net_arch': [[8, 8]]}, ci_data,
+                  mode='halving', n_trials=3, budget=96, n_rungs=2, eta=3, algorithm='DDPG', max_power=10,
+                  max_charge=20, n_workers=2, sweep_dir=str(tmp_path), seed=0, verbose=0)
+    results = sweep.run()
+    assert capsys.readouterr().out == ""
+
+    assert list(results.groupby('rung').size()) == [3, 1]
+    assert (results[results['rung'] == 0]['timesteps'] == 32).all()
+    assert results[results['rung'] == 1]['timesteps'].item() == 96
+    assert results[results['rung'] == 1]['status'].item() == 'complete'
+
+    table = pd.read_csv(os.path.join(str(tmp_path), "results.csv"))
+    assert len(table) == 4
+    assert sweep.best_params(results) in sweep.trials
+    # replay buffers are only saved when asked for
+    assert not any(name.endswith("_replay_buffer.pkl") for name in os.listdir(str(tmp_path)))
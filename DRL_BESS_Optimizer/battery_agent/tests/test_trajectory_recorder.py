@@ -0,0 +1,63 @@
+import numpy as np
+from battery_agent.battery_env import BatteryEnv
+from battery_agent.batched_battery_env import BatchedBatteryEnv
+from battery_agent.trajectory_recorder import TrajectoryRecorder
+
+
+def test_ring_buffer_keeps_last_steps():
+    recorder = TrajectoryRecorder(capacity=4)
+    for t in range(10):
+        recorder.record(t, 0.1, 1.0, 0.5, 2.0)
+
+    trajectory = recorder.get_trajectory()
+    assert len(recorder) == 4
+    assert trajectory['timestep'].tolist() == [6, 7, 8, 9]
+
+
+def test_spill_to_disk(tmp_path):
+    recorder = TrajectoryRecorder(capacity=4, spill_dir=tmp_path)
+    recorder.record_many(np.arange(7), np.zeros(7), np.zeros(7), np.zeros(7), np.zeros(7))
+    for t in range(7, 10):
+        recorder.record(t, 0.1, 1.0, 0.5, 2.0)
+
+    assert len(recorder.chunks) == 2
+    assert recorder.buffer.size == 4
+    assert recorder.get_trajectory()['timestep'].tolist() == list(range(10))
+
+
+def test_clear_does_not_overwrite_spilled_chunks(tmp_path):
+    recorder = TrajectoryRecorder(capacity=4, spill_dir=tmp_path)
+    recorder.record_many(np.arange(5), np.zeros(5), np.zeros(5), np.zeros(5), np.zeros(5))
+    first_chunk = recorder.chunks[0]
+    recorder.clear()
+    recorder.record_many(np.arange(100, 105), np.zeros(5), np.zeros(5), np.zeros(5), np.zeros(5))
+
+    assert recorder.chunks[0] != first_chunk
+    assert np.load(first_chunk)['timestep'].tolist() == [0, 1, 2, 3]
+    assert recorder.get_trajectory()['timestep'].tolist() == list(range(100, 105))
+
+
+def test_env_records_steps(ci_data):
+    recorder = TrajectoryRecorder(capacity=100)
+    env = BatteryEnv(25, 50, 50, 0, ci_data, 200, 50, recorder=recorder)
+    env.reset()
+    env.step(np.array([0.2]))
+    env.step(np.array([-0.4]))
+
+    trajectory = recorder.get_trajectory()
+    assert trajectory['timestep'].tolist() == [0, 1]
+    np.testing.assert_allclose(trajectory['action'], [0.2, -0.4])
+    np.testing.assert_allclose(trajectory['energy_out'], [5.0, -10.0])
+    np.testing.assert_allclose(trajectory['charge'], [0.4, 0.6])
+
+
+def test_batched_env_records_every_lane(ci_data):
+    recorder = TrajectoryRecorder(capacity=100)
+    env = BatchedBatteryEnv(3, 25, 50, 50, 0, ci_data, 200, 50, recorder=recorder)
+    env.reset()
+    env.step(np.full((3, 1), 0.2))
+    env.step(np.full((3, 1), 0.2))
+
+    trajectory = recorder.get_trajectory()
+    assert trajectory['lane'].tolist() == [0, 1, 2, 0, 1, 2]
+    assert trajectory['timestep'].tolist() == [0, 0, 0, 1, 1, 1]
@@ -0,0 +1,40 @@
+import os
+import numpy as np
+from stable_baselines3 import PPO
+from battery_agent.agent import BatteryAgent
+from battery_agent.validation import CarbonValidationCallback, evaluate_model, validation_score
+
+
+class ConstantPolicy:
+    def __init__(self, actions):
+        self.actions = np.asarray(actions, dtype=np.float32).reshape(-1, 1)
+
+    def predict(self, obs, deterministic=True):
+        return self.actions, None
+
+
+def test_evaluate_model_scores_every_size(ci_data):
+    results = evaluate_model(ConstantPolicy([0.1, -0.1]), [(10, 20), (20, 20)], ci_data, 200, 50)
+    assert len(results) == 2
+    np.testing.assert_allclose(results["MWh Capacity"], [20, 20])
+
+    # a battery that only ever discharges cannot be ranked
+    assert validation_score(results) == -np.inf
+
+
+def test_validation_callback_saves_best_and_stops_early(ci_data, tmp_path):
+    agent = BatteryAgent(ci_data, ci_data.copy())
+    env = agent.make_vec_env(10, 20, 2, vec_env='batched', seed=0)
+    model = PPO('MlpPolicy', env, n_steps=16, batch_size=32, seed=0)
+
+    best_model_path = str(tmp_path / "best")
+    callback = CarbonValidationCallback(ci_data, [(10, 20), (25, 50)], agent.mean_ci, agent.std_dev_ci,
+                                        eval_freq=16, best_model_path=best_model_path, patience=2,
+                                        min_delta=100.0, verbose=0)
+    model.learn(total_timesteps=10000, callback=callback)
+
+    # only the first validation counts as an improvement
+    assert len(callback.scores) == 3
+    assert model.num_timesteps < 10000
+    assert callback.best_timestep == callback.scores[0][0]
+    assert os.path.exists(best_model_path + ".zip")
@@ -0,0 +1,138 @@
+import os
+import numpy as np
+
+TRAJECTORY_DTYPE = np.dtype([
+    ('lane', np.int32),
+    ('timestep', np.int64),
+    ('action', np.float32),
+    ('energy_out', np.float64),
+    ('charge', np.float64),
+    ('reward', np.float64),
+])
+
+
+class TrajectoryRecorder:
+    """
+    Records the steps of a battery env into a preallocated structured array,
+    so memory stays flat however long the env runs.
+
+    Without a spill_dir the buffer is a ring and only the last capacity steps
+    are kept. With a spill_dir, every full buffer is saved as a .npy chunk
+    and the whole trajectory can be read back.
+
+    Parameters
+    ----------
+    capacity : int, optional
+        Number of steps held in memory.
+    spill_dir : str, optional
+        Directory to save full buffers to as .npy chunks.
+    """
+
+    def __init__(self, capacity=100000, spill_dir=None):
+        self.capacity = capacity
+        self.spill_dir = spill_dir
+        self.buffer = np.zeros(capacity, dtype=TRAJECTORY_DTYPE)
+        self.position = 0
+        self.wrapped = False
+        self.n_recorded = 0
+        self.chunks = []
+        # numbers the spilled files, clear does not reset it so they are never overwritten
+        self.n_spilled = 0
+
+        if spill_dir is not None:
+            os.makedirs(spill_dir, exist_ok=True)
+
+    def __len__(self):
+        return self.n_recorded if self.spill_dir is not None else min(self.n_recorded, self.capacity)
+
+    def make_room(self):
+        if self.spill_dir is not None:
+            path = os.path.join(self.spill_dir, f"trajectory_{self.n_spilled:05d}.npy")
+            np.save(path, self.buffer)
+            self.chunks.append(path)
+            self.n_spilled += 1
+        else:
+            self.wrapped = True
+        self.position = 0
+
+    def record(self, timestep, action, energy_out, charge, reward, lane=0):
+        """
+        Record one step.
+
+        Parameters
+        ----------
+        timestep : int
+            Row of the data the action was taken at
+        action : float
+            The normalized action
+        energy_out : float
+            Energy discharged in MWh, negative when charging
+        charge : float
+            State of charge after the step
+        reward : float
+            Reward of the step
+        lane : int, optional
+            Lane of a batched env the step belongs to
+        """
+        if self.position == self.capacity:
+            self.make_room()
+
+        self.buffer[self.position] = (lane, timestep, action, energy_out, charge, reward)
+        self.position += 1
+        self.n_recorded += 1
+
+    def record_many(self, timesteps, actions, energy_out, charge, reward, lanes=None):
+        """
+        Record a batch of steps, e.g. one step of every lane of a batched env.
+        All arguments are arrays with one value per step.
+        """
+        n = len(timesteps)
+        if lanes is None:
+            lanes = np.zeros(n, dtype=np.int32)
+
+        start = 0
+        while start < n:
+            if self.position == self.capacity:
+                self.make_room()
+
+            end = start + min(n - start, self.capacity - self.position)
+            rows = self.buffer[self.position:self.position + end - start]
+            rows['lane'] = lanes[start:end]
+            rows['timestep'] = timesteps[start:end]
+            rows['action'] = actions[start:end]
+            rows['energy_out'] = energy_out[start:end]
+            rows['charge'] = charge[start:end]
+            rows['reward'] = reward[start:end]
+
+            self.position += end - start
+            start = end
+
+        self.n_recorded += n
+
+    def get_trajectory(self):
+        """
+        Get the recorded steps in the order they were recorded.
+
+        Returns
+        -------
+        np.array
+            Structured array with lane, timestep, action, energy_out, charge
+            and reward fields
+        """
+        if self.spill_dir is not None:
+            chunks = [np.load(path, mmap_mode='r') for path in self.chunks]
+            return np.concatenate(chunks + [self.buffer[:self.position]])
+
+        if self.wrapped:
+            return np.concatenate([self.buffer[self.position:], self.buffer[:self.position]])
+        return self.buffer[:self.position].copy()
+
+    def clear(self):
+        """
+        Forget every recorded step. Spilled chunks are left on disk, and
+        later chunks are saved under new names.
+        """
+        self.position = 0
+        self.wrapped = False
+        self.n_recorded = 0
+        self.chunks = []
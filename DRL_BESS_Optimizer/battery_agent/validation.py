@@ -0,0 +1,162 @@
+import numpy as np
+import pandas as pd
+from stable_baselines3.common.callbacks import BaseCallback
+from battery_agent.fleet_env import FleetBatteryEnv
+
+
+def make_validation_env(sizes, ci_data, mean_ci, std_dev_ci):
+    """
+    Create a batched env with one lane per battery size, all starting empty
+    at the first row of the validation data, like BatteryAgent.test_agent.
+
+    Parameters
+    ----------
+    sizes : list
+        (power capacity, energy capacity) of every battery to validate on
+    ci_data : pd.DataFrame
+        The validation slice of the carbon intensity data
+    mean_ci : float
+        Mean value of training carbon intensity data for normalization.
+    std_dev_ci : float
+        Standard deviation of training carbon intensity data for normalization.
+
+    Returns
+    -------
+    FleetBatteryEnv
+        The validation environment
+    """
+    sizes = np.asarray(sizes, dtype=np.float64).reshape(-1, 2)
+    fleet = pd.DataFrame({
+        "MW": sizes[:, 0],
+        "MWh": sizes[:, 1],
+        "Region": 0,
+        "Name": [f"{mw:g}MW/{mwh:g}MWh" for mw, mwh in sizes],
+    }, index=pd.Index(np.arange(len(sizes)), name="BMU ID"))
+
+    return FleetBatteryEnv(fleet, ci_data, mean_ci, std_dev_ci)
+
+
+def evaluate_model(model, sizes, ci_data, mean_ci, std_dev_ci):
+    """
+    Run a model deterministically over a validation slice for every battery
+    size at once, and calculate the carbon each size abated.
+
+    Parameters
+    ----------
+    model : BaseAlgorithm
+        Trained model, or anything with a stable-baselines3 style predict
+    sizes : list
+        (power capacity, energy capacity) of every battery to validate on
+    ci_data : pd.DataFrame
+        The validation slice of the carbon intensity data
+    mean_ci : float
+        Mean value of training carbon intensity data for normalization.
+    std_dev_ci : float
+        Standard deviation of training carbon intensity data for normalization.
+
+    Returns
+    -------
+    pd.DataFrame
+        Carbon abatement results of each size, see FleetBatteryEnv.results
+    """
+    env = make_validation_env(sizes, ci_data, mean_ci, std_dev_ci)
+    # test_agent scores every row but the last two
+    return env.run_policy(model, len(ci_data) - 2)
+
+
+def validation_score(results):
+    """
+    Reduce validation results to one number to rank models by: the mean
+    carbon abated per MWh discharged over all sizes. A size that never both
+    charged and discharged scores -inf.
+
+    Parameters
+    ----------
+    results : pd.DataFrame
+        Results from evaluate_model
+
+    Returns
+    -------
+    float
+        The score, higher is better
+    """
+    carbon_abated = results["carbon_abated_national (mt CO2/MWh Discharged)"].to_numpy()
+    carbon_abated = np.where(np.isfinite(carbon_abated), carbon_abated, -np.inf)
+    return float(carbon_abated.mean())
+
+
+class CarbonValidationCallback(BaseCallback):
+    """
+    Validates the model every eval_freq steps while it trains, by the carbon
+    it abates on a validation slice for every battery size at once (see
+    evaluate_model). The best model so far is saved, and training stops when
+    the score has not improved for patience validations in a row.
+
+    Parameters
+    ----------
+    val_data : pd.DataFrame
+        The validation slice of the carbon intensity data
+    sizes : list
+        (power capacity, energy capacity) of the batteries to validate on
+    mean_ci : float
+        Mean value of training carbon intensity data for normalization.
+    std_dev_ci : float
+        Standard deviation of training carbon intensity data for normalization.
+    eval_freq : int, optional
+        Number of calls to env.step between validations. With a vectorized
+        env every call steps all of its envs.
+    best_model_path : str, optional
+        Where to save the best model, not saved if None
+    patience : int, optional
+        Number of validations without improvement before training stops, 0
+        never stops early
+    min_delta : float, optional
+        How much the score has to go up to count as an improvement
+    verbose : int, optional
+        0 is silent, 1 prints every validation
+    """
+
+    def __init__(self, val_data, sizes, mean_ci, std_dev_ci, eval_freq=10000, best_model_path=None,
+                 patience=5, min_delta=0.0, verbose=1):
+        super(CarbonValidationCallback, self).__init__(verbose)
+        self.val_data = val_data
+        self.sizes = sizes
+        self.mean_ci = mean_ci
+        self.std_dev_ci = std_dev_ci
+        self.eval_freq = eval_freq
+        self.best_model_path = best_model_path
+        self.patience = patience
+        self.min_delta = min_delta
+
+        self.best_score = None
+        self.best_timestep = 0
+        self.n_without_improvement = 0
+        self.scores = []
+
+    def _on_step(self):
+        if self.n_calls % self.eval_freq != 0:
+            return True
+
+        results = evaluate_model(self.model, self.sizes, self.val_data, self.mean_ci, self.std_dev_ci)
+        score = validation_score(results)
+        self.scores.append((self.num_timesteps, score))
+        self.logger.record("validation/carbon_abated", score)
+
+        if self.best_score is None or score > self.best_score + self.min_delta:
+            self.best_score = score
+            self.best_timestep = self.num_timesteps
+            self.n_without_improvement = 0
+            if self.best_model_path is not None:
+                self.model.save(self.best_model_path)
+        else:
+            self.n_without_improvement += 1
+
+        if self.verbose > 0:
+            print(f"validation at {self.num_timesteps} steps: {score:.4f} mt CO2/MWh discharged "
+                  f"(best {self.best_score:.4f} at {self.best_timestep} steps)")
+
+        if self.patience > 0 and self.n_without_improvement >= self.patience:
+            if self.verbose > 0:
+                print(f"no improvement in {self.patience} validations, stopping training")
+            return False
+        return True
@@ -0,0 +1,403 @@
+"""
+Benchmark suite for the battery env, agent testing, data preparation and
+carbon abatement calculation. Everything runs offline on synthetic data, and
+the test_agent benchmark uses the saved model in battery_agent/models/.
+
+Run from the root directory of the project:
+
+    python -m benchmarks.run_benchmarks --save benchmarks/baselines/baseline.json
+    python -m benchmarks.run_benchmarks --compare benchmarks/baselines/baseline.json
+
+Compare mode runs the suite again and flags every case whose median time
+is slower than the baseline by more than the tolerance, and exits with 1 if
+there are any.
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import warnings
+import numpy as np
+import pandas as pd
+
+DEFAULT_SIZES = {
+    'env_step': [1000, 10000, 100000],
+    'test_agent': [480, 4800, 17520],
+    'get_train_test_data': [4800, 48000, 96000],
+    'process_pn_data': [480, 4800, 19200],
+    'fill_time_gaps': [480, 4800, 19200],
+    'map_dates_and_intensities': [4800, 48000, 96000],
+}
+
+
+def make_ci_data(n_rows, seed=0):
+    """
+    Make synthetic carbon intensity data in the format of
+    NationalGridApiAccessor.get_carbon_intensity.
+
+    Parameters
+    ----------
+    n_rows : int
+        Number of settlement periods
+    seed : int, optional
+        Seed of the noise
+
+    Returns
+    -------
+    pd.DataFrame
+        The carbon intensity data
+    """
+    rng = np.random.default_rng(seed)
+    start = pd.date_range("2022-01-01", periods=n_rows, freq="30min", tz="UTC")
+    intensity = 200 + 80 * np.sin(np.arange(n_rows) * 2 * np.pi / 48) + rng.normal(0, 20, n_rows)
+    national_intensity = intensity.copy()
+    national_intensity[rng.random(n_rows) < 0.01] = np.nan
+
+    return pd.DataFrame({
+        'index': np.arange(n_rows),
+        'from': start,
+        'to': start + pd.Timedelta(minutes=30),
+        'nationalIntensity': national_intensity,
+        'forecast': intensity + rng.normal(0, 10, n_rows),
+        'regionalIntensity': intensity + rng.normal(0, 30, n_rows),
+        'settlementPeriod': np.arange(n_rows) % 48 + 1,
+    })
+
+
+def make_test_data(n_rows, seed=0):
+    """
+    Make synthetic data with the forecast features of
+    BatteryAgentDataProcessor.get_train_test_data.
+    """
+    data = make_ci_data(n_rows, seed)
+    data['nationalIntensity'] = data['nationalIntensity'].ffill().bfill()
+    rolling_window = data['forecast'].rolling(window=24, min_periods=1)
+    data['forecast_min'] = rolling_window.min().shift(-24).ffill()
+    data['forecast_max'] = rolling_window.max().shift(-24).ffill()
+    data['forecast_mean'] = rolling_window.mean().shift(-24).ffill()
+    return data
+
+
+def make_pn_data(n_rows, gap_fraction=0.02, seed=0):
+    """
+    Make synthetic physical notifications in the format of the BMRS PN
+    stream: latest first, with string timestamps, and with a fraction of the
+    rows missing so fill_time_gaps has gaps to fill.
+
+    Parameters
+    ----------
+    n_rows : int
+        Number of physical notifications
+    gap_fraction : float, optional
+        Fraction of the settlement periods without a physical notification
+    seed : int, optional
+        Seed of the levels and gaps
+
+    Returns
+    -------
+    pd.DataFrame
+        The physical notifications
+    """
+    rng = np.random.default_rng(seed)
+    n_periods = int(n_rows / (1 - gap_fraction)) + 1
+    periods = np.sort(rng.choice(n_periods, n_rows, replace=False))[::-1]
+
+    start = pd.Timestamp("2022-01-01", tz="UTC")
+    time_from = start + pd.to_timedelta(periods * 30, unit="min")
+    time_to = time_from + pd.Timedelta(minutes=30)
+    levels = np.round(rng.normal(0, 20, n_rows + 1))
+
+    return pd.DataFrame({
+        'dataset': 'PN',
+        'settlementDate': time_from.strftime("%Y-%m-%d"),
+        'timeFrom': time_from.strftime("%Y-%m-%dT%H:%M:%SZ"),
+        'timeTo': time_to.strftime("%Y-%m-%dT%H:%M:%SZ"),
+        'settlementPeriod': periods % 48 + 1,
+        'levelFrom': levels[1:],
+        'levelTo': levels[:-1],
+        'bmUnit': 'BENCH-1',
+        'nationalGridBmUnit': 'BENCH-1',
+    })
+
+
+def prepare_pn_data(pn_data):
+    # the part of BmrsApiAccessor.process_pn_data before fill_time_gaps
+    pn_data['timeFrom'] = pd.to_datetime(pn_data['timeFrom'])
+    pn_data['timeTo'] = pd.to_datetime(pn_data['timeTo'])
+    pn_data['settlementDate'] = pd.to_datetime(pn_data['settlementDate'])
+    pn_data['timeDifference'] = (pn_data['timeTo'] - pn_data['timeFrom']).dt.total_seconds() / 3600
+    pn_data['time_gap'] = pn_data['timeFrom'] - pn_data['timeTo'].shift(-1)
+    return pn_data
+
+
+def bench_env_step(n_rows):
+    """
+    Returns a function that steps a BatteryEnv n_rows times with random actions.
+    """
+    from battery_agent.battery_env import BatteryEnv
+
+    data = make_test_data(n_rows + 1)
+    actions = np.random.default_rng(0).uniform(-0.2, 0.2, (n_rows, 1)).astype(np.float32)
+    mean_ci, std_dev_ci = data['nationalIntensity'].mean(), data['nationalIntensity'].std()
+
+    def run():
+        env = BatteryEnv(25, 25, 50, 0, data, mean_ci, std_dev_ci)
+        env.reset()
+        for action in actions:
+            _obs, _reward, done, _truncated, _info = env.step(action)
+            if done:
+                env.reset()
+
+    return run
+
+
+def bench_test_agent(n_rows):
+    """
+    Returns a function that runs BatteryAgent.test_agent on n_rows settlement
+    periods with the saved DDPG_Best model.
+    """
+    from battery_agent.agent import BatteryAgent
+    from battery_agent.model_cache import load_model
+
+    train_data = make_test_data(4800, seed=1)
+    agent = BatteryAgent(train_data=train_data, test_data=make_test_data(n_rows))
+    model = load_model("DDPG_Best")
+
+    def run():
+        agent.test_agent(25, 50, "DDPG_Best", model=model)
+
+    return run
+
+
+def bench_get_train_test_data(n_rows):
+    """
+    Returns a function that builds the train and test features from a csv
+    of n_rows settlement periods.
+    """
+    from battery_agent.data_preprocessor import BatteryAgentDataProcessor
+
+    data_processor = BatteryAgentDataProcessor()
+    path = os.path.join(tempfile.mkdtemp(), "ci_data.csv")
+    make_ci_data(n_rows).to_csv(path, index=False)
+
+    def run():
+        data_processor.get_train_test_data(None, None, data=path)
+
+    return run
+
+
+def bench_process_pn_data(n_rows):
+    """
+    Returns a function that processes n_rows physical notifications.
+    """
+    from carbon_abatement_api.bmrs_api_accessor import BmrsApiAccessor
+
+    accessor = BmrsApiAccessor()
+    pn_data = make_pn_data(n_rows)
+
+    def run():
+        accessor.process_pn_data(pn_data.copy(), None, None)
+
+    return run
+
+
+def bench_fill_time_gaps(n_rows):
+    """
+    Returns a function that fills the time gaps of n_rows physical notifications.
+    """
+    from carbon_abatement_api.bmrs_api_accessor import BmrsApiAccessor
+
+    accessor = BmrsApiAccessor()
+    pn_data = prepare_pn_data(make_pn_data(n_rows))
+
+    def run():
+        accessor.fill_time_gaps(pn_data.copy())
+
+    return run
+
+
+def bench_map_dates_and_intensities(n_rows):
+    """
+    Returns a function that merges n_rows physical notifications with the
+    carbon intensity data covering them.
+    """
+    from carbon_abatement_api.bmrs_api_accessor import BmrsApiAccessor
+    from carbon_abatement_api.carbon_abatement_calculator import CarbonAbatementCalculator
+
+    calculator = CarbonAbatementCalculator()
+    pn_data = BmrsApiAccessor().process_pn_data(make_pn_data(n_rows, gap_fraction=0), None, None)
+    ci_data = make_ci_data(n_rows + 48).drop(columns=['settlementPeriod'])
+
+    def run():
+        calculator.map_dates_and_intensities(pn_data.copy(), ci_data.copy())
+
+    return run
+
+
+BENCHMARKS = {
+    'env_step': bench_env_step,
+    'test_agent': bench_test_agent,
+    'get_train_test_data': bench_get_train_test_data,
+    'process_pn_data': bench_process_pn_data,
+    'fill_time_gaps': bench_fill_time_gaps,
+    'map_dates_and_intensities': bench_map_dates_and_intensities,
+}
+
+
+def time_case(run, repeat):
+    times = []
+    # keep the progress prints of the code under test out of the report
+    with contextlib.redirect_stdout(io.StringIO()):
+        for _ in range(repeat):
+            start = time.perf_counter()
+            run()
+            times.append(time.perf_counter() - start)
+    return times
+
+
+def run_suite(names=None, sizes=None, repeat=3, verbose=1):
+    """
+    Run the benchmarks.
+
+    Parameters
+    ----------
+    names : list, optional
+        Benchmarks to run, defaults to all of BENCHMARKS
+    sizes : dict, optional
+        Data sizes of each benchmark, defaults to DEFAULT_SIZES
+    repeat : int, optional
+        Number of timed runs of every case
+    verbose : int, optional
+        0 is silent, 1 prints every case
+
+    Returns
+    -------
+    dict
+        The results, with 'metadata' about the machine and a 'results' entry
+        per case with its min and median time and rows per second
+    """
+    names = names or list(BENCHMARKS)
+    sizes = sizes or DEFAULT_SIZES
+    results = {}
+
+    with warnings.catch_warnings():
+        # the PN processing still uses DataFrame.append and sets values on row copies
+        warnings.simplefilter("ignore", FutureWarning)
+        warnings.simplefilter("ignore", pd.errors.SettingWithCopyWarning)
+
+        for name in names:
+            for n_rows in sizes[name]:
+                run = BENCHMARKS[name](n_rows)
+                # an untimed run first, so lazy imports and caches do not count
+                times = time_case(run, 1 + repeat)[1:]
+
+                case = f"{name}[{n_rows}]"
+                results[case] = {
+                    'benchmark': name,
+                    'size': n_rows,
+                    'repeat': repeat,
+                    'min_s': min(times),
+                    'median_s': float(np.median(times)),
+                    'rows_per_s': n_rows / float(np.median(times)),
+                }
+                if verbose > 0:
+                    print(f"{case:40s} {results[case]['median_s'] * 1e3:10.2f} ms {results[case]['rows_per_s']:14.0f} rows/s")
+
+    return {
+        'metadata': {
+            'created': time.strftime("%Y-%m-%dT%H:%M:%S"),
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'pandas': pd.__version__,
+            'machine': platform.machine(),
+            'processor': platform.processor(),
+            'cpu_count': os.cpu_count(),
+        },
+        'results': results,
+    }
+
+
+def compare_results(baseline, current, tolerance=0.2):
+    """
+    Compare benchmark results against a baseline by the median time of each case.
+
+    Parameters
+    ----------
+    baseline : dict
+        Results from run_suite, e.g. loaded from a baseline JSON file
+    current : dict
+        Results from run_suite
+    tolerance : float, optional
+        How much slower than the baseline (as a fraction) a case can be
+        before it counts as a regression
+
+    Returns
+    -------
+    pd.DataFrame
+        One row per case with both median times, their ratio and a status:
+        'regression', 'faster', 'ok', 'new' or 'missing'
+    """
+    rows = []
+    for case in sorted(set(baseline['results']) | set(current['results'])):
+        before = baseline['results'].get(case)
+        after = current['results'].get(case)
+
+        if before is None or after is None:
+            status = 'new' if before is None else 'missing'
+            ratio = np.nan
+        else:
+            ratio = after['median_s'] / before['median_s']
+            if ratio > 1 + tolerance:
+                status = 'regression'
+            elif ratio < 1 / (1 + tolerance):
+                status = 'faster'
+            else:
+                status = 'ok'
+
+        rows.append({
+            'case': case,
+            'baseline_ms': before['median_s'] * 1e3 if before else np.nan,
+            'current_ms': after['median_s'] * 1e3 if after else np.nan,
+            'ratio': ratio,
+            'status': status,
+        })
+
+    return pd.DataFrame(rows, columns=['case', 'baseline_ms', 'current_ms', 'ratio', 'status'])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run the benchmark suite.")
+    parser.add_argument('--only', nargs='+', choices=list(BENCHMARKS), help="benchmarks to run")
+    parser.add_argument('--repeat', type=int, default=3, help="timed runs of every case")
+    parser.add_argument('--quick', action='store_true', help="only run the smallest size of every benchmark")
+    parser.add_argument('--save', help="JSON file to save the results to, e.g. as a new baseline")
+    parser.add_argument('--compare', help="baseline JSON file to compare the results with")
+    parser.add_argument('--tolerance', type=float, default=0.2, help="slowdown that counts as a regression")
+    args = parser.parse_args(argv)
+
+    sizes = {name: values[:1] for name, values in DEFAULT_SIZES.items()} if args.quick else DEFAULT_SIZES
+    current = run_suite(args.only, sizes, args.repeat)
+
+    if args.save:
+        os.makedirs(os.path.dirname(args.save) or ".", exist_ok=True)
+        with open(args.save, 'w') as f:
+            json.dump(current, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        comparison = compare_results(baseline, current, args.tolerance)
+        print(comparison.to_string(index=False))
+        if (comparison['status'] == 'regression').any():
+            return 1
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,38 @@
+import json
+from benchmarks.run_benchmarks import compare_results, main, run_suite
+
+
+def test_run_suite_small_sizes():
+    sizes = {'env_step': [96], 'map_dates_and_intensities': [96]}
+    results = run_suite(['env_step', 'map_dates_and_intensities'], sizes, repeat=1, verbose=0)
+
+    assert set(results['results']) == {'env_step[96]', 'map_dates_and_intensities[96]'}
+    case = results['results']['env_step[96]']
+    assert case['size'] == 96 and case['min_s'] > 0 and case['rows_per_s'] > 0
+
+
+def test_compare_results_flags_regressions():
+    def result(median_s):
+        return {'median_s': median_s}
+
+    baseline = {'results': {'a[1]': result(1.0), 'b[1]': result(1.0), 'c[1]': result(1.0), 'gone[1]': result(1.0)}}
+    current = {'results': {'a[1]': result(1.5), 'b[1]': result(0.5), 'c[1]': result(1.1), 'new[1]': result(1.0)}}
+
+    comparison = compare_results(baseline, current, tolerance=0.2).set_index('case')
+    assert comparison['status'].to_dict() == {
+        'a[1]': 'regression', 'b[1]': 'faster', 'c[1]': 'ok', 'gone[1]': 'missing', 'new[1]': 'new'}
+
+
+def test_main_saves_and_compares(tmp_path):
+    path = str(tmp_path / "baseline.json")
+    assert main(['--only', 'env_step', '--quick', '--repeat', '1', '--save', path]) == 0
+
+    with open(path) as f:
+        baseline = json.load(f)
+    assert 'env_step[1000]' in baseline['results']
+
+    # a baseline 1000 times faster than this machine can run
+    baseline['results']['env_step[1000]']['median_s'] /= 1000
+    with open(path, 'w') as f:
+        json.dump(baseline, f)
+    assert main(['--only', 'env_step', '--quick', '--repeat', '1', '--compare', path]) == 1
@@ -1,3 +1,4 @@
+import os
 import pandas as pd
 import matplotlib.pyplot as plt
 import seaborn as sns
@@ -8,9 +9,20 @@ Utility file for running analysis on all UK BESS assets.
 Additionally, add values for the agent's results to plot over the real BESS results
 """
 
-# agent results
-agent_durations = [1.12, 1, 2, 2.14, 1.51, 1]
-agent_carbon_abated_values = [0.0531, 0.052, 0.053, 0.0528, 0.0532, 0.0528]
+# agent results, regenerate them with battery_agent.evaluation.evaluate_matrix(..., save_file=agent_results_file)
+# the matrix can hold several models and periods, only one model's results for the period of the real assets are plotted
+agent_results_file = 'battery_agent/outputs/evaluation_matrix.csv'
+agent_model = 'DDPG_Best'
+agent_period = 'q2'
+
+if os.path.exists(agent_results_file):
+    agent_results = pd.read_csv(agent_results_file)
+    agent_results = agent_results[(agent_results['Model'] == agent_model) & (agent_results['Period'] == agent_period)]
+    agent_durations = agent_results['Duration'].tolist()
+    agent_carbon_abated_values = agent_results['carbon_abated_national (mt CO2/MWh Discharged)'].tolist()
+else:
+    agent_durations = [1.12, 1, 2, 2.14, 1.51, 1]
+    agent_carbon_abated_values = [0.0531, 0.052, 0.053, 0.0528, 0.0532, 0.0528]
 
 
 # file path for real asset results
@@ -17,10 +17,13 @@ setup(
         'pytest',
         'openpyxl',
         'torch',
-        'wandb',
         'stable_baselines3',
         'gymnasium',
         'tensorboard',
-        'seaborn'
+        'seaborn',
+        'scipy'
     ],
+    extras_require={
+        'wandb': ['wandb'],
+    },
 )